@@ -0,0 +1,91 @@
+""" Batching benchmark
+
+Publishes status signals through a Sender to the local stub broker over TLS,
+once with one PUBLISH per message and once with micro-batching. The broker
+delays every acknowledgement to simulate the round trip time to the endpoint.
+
+    python benchmarks/bench_batching.py --messages 5000 --rtt-ms 20 --batch-size 50
+"""
+import sys
+sys.path.insert(0, ".")
+import argparse
+import json
+import tempfile
+import threading
+import time
+from dataclasses import asdict
+
+from benchmarks.messages import status_signal
+from benchmarks.stub_broker import StubBroker, generate_credentials
+from iot_assets.iot_client import IoTClientDetails
+from iot_assets.sender import Sender, SenderDetails
+from iot_assets.telemetry_batcher import TelemetryBatcherDetails
+
+TELEMETRY_TOPIC = 'telemetry'
+
+
+class Counter:
+    def __init__(self):
+        self.messages = 0
+        self.packets = 0
+        self.done = threading.Event()
+        self.expected = 0
+
+    def on_message(self, client_id, topic, payload):
+        if not topic.startswith(TELEMETRY_TOPIC):
+            return
+        self.packets += 1
+        self.messages += payload.count(b'"eventtype"')
+        if self.messages >= self.expected:
+            self.done.set()
+
+
+def run_once(credentials, rtt_ms: float, messages: int, batching):
+    counter = Counter()
+    counter.expected = messages
+    broker = StubBroker(credentials, ack_delay=rtt_ms / 1000.0, on_message=counter.on_message).start()
+    sender = Sender(SenderDetails('benchmark', 'benchmark', '1.0', 'org', 'site', 'bench-client', TELEMETRY_TOPIC,
+                                  batching=batching),
+                    IoTClientDetails('localhost', broker.port, credentials['client_cert'], credentials['client_key'],
+                                     credentials['ca'], 'bench-thing'))
+    sender.state = {'sendTelemetryData': True}
+    payload = json.dumps(asdict(status_signal()))
+    try:
+        sender.connect()
+        while not sender.iot_client.connflag:
+            time.sleep(0.01)
+        start = time.perf_counter()
+        for _ in range(messages):
+            sender.publish_telemetry(payload)
+        if sender.batcher is not None:
+            sender.batcher.flush()
+        counter.done.wait(300)
+        seconds = time.perf_counter() - start
+    finally:
+        sender.disconnect(5)
+        sender.iot_client.mqttc.loop_stop()
+        broker.stop()
+    return seconds, counter.packets
+
+
+def run(messages: int, rtt_ms: float, batch_size: int, max_delay_ms: float):
+    with tempfile.TemporaryDirectory() as directory:
+        credentials = generate_credentials(directory)
+        print(f'{messages} messages, simulated round trip {rtt_ms} ms')
+        baseline = None
+        for name, batching in (('per message', None),
+                               (f'batches of {batch_size}', TelemetryBatcherDetails(batch_size, max_delay_ms))):
+            seconds, packets = run_once(credentials, rtt_ms, messages, batching)
+            baseline = baseline or seconds
+            print(f'{name:<16} {messages / seconds:10.0f} msgs/s  {packets:6d} publish packets  '
+                  f'x{baseline / seconds:.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--rtt-ms', type=float, default=20.0)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--max-delay-ms', type=float, default=100.0)
+    args = parser.parse_args()
+    run(args.messages, args.rtt_ms, args.batch_size, args.max_delay_ms)
@@ -0,0 +1,58 @@
+""" Compression benchmark
+
+Compresses status signals of different sizes with zlib, gzip and zlib with a
+preset dictionary trained from other sample messages, and reports the bytes on
+the wire and the CPU time per message
+
+    python benchmarks/bench_compression.py --number 2000
+"""
+import sys
+sys.path.insert(0, ".")
+import argparse
+import json
+import time
+from dataclasses import asdict
+
+from benchmarks.messages import status_signal
+from iot_assets.compression import GZIP, ZLIB, CompressionDetails, PayloadCompressor, build_dictionary
+
+CORPORA = {
+    'small (1 job phase, 1 part)': (1, 1),
+    'typical (2 job phases, 2 parts)': (2, 2),
+    'large (5 job phases, 10 parts)': (5, 10),
+    'huge (10 job phases, 40 parts)': (10, 40),
+}
+
+
+def serialized(job_phases: int, parts: int) -> bytes:
+    return json.dumps(asdict(status_signal(job_phases, parts))).encode('utf-8')
+
+
+def run(number: int, level: int):
+    samples = [serialized(job_phases, parts) for job_phases, parts in CORPORA.values() for _ in range(10)]
+    dictionary = build_dictionary(samples)
+    candidates = {
+        'zlib': CompressionDetails(ZLIB, threshold=0, level=level),
+        'gzip': CompressionDetails(GZIP, threshold=0, level=level),
+        'zlib + dictionary': CompressionDetails(ZLIB, threshold=0, level=level, dictionary=dictionary),
+    }
+    print(f'dictionary of {len(dictionary)} bytes, compression level {level}, {number} runs')
+    for corpus, (job_phases, parts) in CORPORA.items():
+        messages = [serialized(job_phases, parts) for _ in range(number)]
+        print(f'\n{corpus}: {len(messages[0])} bytes')
+        for name, options in candidates.items():
+            compressor = PayloadCompressor(options)
+            start = time.process_time()
+            sizes = [len(compressor.compress(message)) for message in messages]
+            seconds = (time.process_time() - start) / number
+            size = sum(sizes) / number
+            print(f'{name:<18} {size:8.0f} bytes  {100 * size / len(messages[0]):5.1f} %  '
+                  f'{seconds * 1e6:7.1f} us cpu/msg')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--level', type=int, default=6)
+    args = parser.parse_args()
+    run(args.number, args.level)
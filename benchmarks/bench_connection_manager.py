@@ -0,0 +1,93 @@
+""" Connection manager benchmark
+
+Connects a growing number of senders to the local stub broker, once with one
+paho network thread per sender and once driven by a connection manager, and
+reports threads, resident memory and CPU time of the client process while the
+senders publish telemetry at the given rate
+
+    python benchmarks/bench_connection_manager.py --senders 10 50 100 300 --rate 2 --seconds 5
+"""
+import sys
+sys.path.insert(0, ".")
+import argparse
+import json
+import multiprocessing
+import tempfile
+import threading
+import time
+from dataclasses import asdict
+
+from benchmarks.messages import status_signal
+from benchmarks.resources import cpu_seconds, rss_bytes
+from benchmarks.stub_broker import StubBroker, generate_credentials
+from iot_assets.connection_manager import ConnectionManager, ConnectionManagerDetails
+from iot_assets.iot_client import IoTClientDetails
+from iot_assets.sender import Sender, SenderDetails
+
+
+def measure(credentials, port: int, senders: int, managed: bool, rate: float, seconds: float, results):
+    """Runs in a fresh process, so the numbers of one configuration do not affect the next one"""
+    manager = ConnectionManager(ConnectionManagerDetails()) if managed else None
+    clients = []
+    for index in range(senders):
+        sender = Sender(SenderDetails('benchmark', 'benchmark', '1.0', 'org', 'site', f'client{index}', 'telemetry'),
+                        IoTClientDetails('localhost', port, credentials['client_cert'], credentials['client_key'],
+                                         credentials['ca'], f'thing{index}'))
+        sender.state = {'sendTelemetryData': True}
+        clients.append(sender)
+    cpu_start = cpu_seconds()
+    for sender in clients:
+        sender.connect(connection_manager=manager)
+    while not all(sender.iot_client.connflag for sender in clients):
+        time.sleep(0.01)
+    connect_cpu = cpu_seconds() - cpu_start
+
+    payload = json.dumps(asdict(status_signal()))
+    interval = 1.0 / (rate * senders)
+    cpu_start = cpu_seconds()
+    start = next_publish = time.monotonic()
+    published = 0
+    while time.monotonic() - start < seconds:
+        clients[published % senders].publish_telemetry(payload)
+        published += 1
+        next_publish += interval
+        time.sleep(max(0.0, next_publish - time.monotonic()))
+    publish_cpu = cpu_seconds() - cpu_start
+    results.put({'threads': threading.active_count(), 'rss': rss_bytes(), 'connect_cpu': connect_cpu,
+                 'cpu_percent': 100 * publish_cpu / seconds, 'published': published})
+    for sender in clients:
+        sender.disconnect()
+    if manager is not None:
+        manager.stop()
+
+
+def run(sender_counts, rate: float, seconds: float):
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        credentials = generate_credentials(directory)
+        broker = StubBroker(credentials).start()
+        try:
+            print(f'{rate} msgs/s per sender for {seconds} s')
+            print(f'{"senders":>7} {"mode":<18} {"threads":>7} {"rss MB":>7} {"connect cpu s":>13} {"cpu %":>6}')
+            for senders in sender_counts:
+                for managed in (False, True):
+                    results = context.Queue()
+                    process = context.Process(target=measure, args=(credentials, broker.port, senders, managed,
+                                                                    rate, seconds, results))
+                    process.start()
+                    result = results.get()
+                    process.join()
+                    mode = 'connection manager' if managed else 'loop_start'
+                    print(f'{senders:>7} {mode:<18} {result["threads"]:>7} {result["rss"] / 2 ** 20:>7.1f} '
+                          f'{result["connect_cpu"]:>13.2f} {result["cpu_percent"]:>6.1f}')
+        finally:
+            broker.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--senders', type=int, nargs='+', default=[10, 50, 100, 300])
+    parser.add_argument('--rate', type=float, default=2.0, help='messages per second and sender')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+    run(args.senders, args.rate, args.seconds)
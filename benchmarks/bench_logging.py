@@ -0,0 +1,90 @@
+""" Logging benchmark
+
+Measures the time IoTClient.publish spends in logging, once with the former
+eager logging of the whole message at INFO level and once with the current
+lazy logging of topic, size and mid. The network is replaced by a stub, so
+only the client code and the logging are measured. Logs are written to a
+counting stream to report the log volume per message.
+
+    python benchmarks/bench_logging.py --messages 20000
+"""
+import sys
+sys.path.insert(0, ".")
+import argparse
+import io
+import json
+import logging
+import time
+from dataclasses import asdict
+
+from benchmarks.messages import status_signal
+from iot_assets.iot_client import IoTClient, IoTClientDetails
+from iot_assets import iot_client as iot_client_module
+
+TOPIC = 'telemetry/org/bench-thing'
+
+
+class CountingStream(io.TextIOBase):
+    def __init__(self):
+        self.characters = 0
+
+    def write(self, text):
+        self.characters += len(text)
+        return len(text)
+
+
+class StubMessageInfo:
+    mid = 1
+
+
+class StubMqttClient:
+    def publish(self, topic, message, qos=0):
+        return StubMessageInfo()
+
+
+class EagerLoggingIoTClient(IoTClient):
+    """The former publish, which formatted the whole message on every call"""
+
+    def publish(self, topic, message):
+        if self.compressor is not None and not topic.startswith('$'):
+            message = self.compressor.compress(message)
+        iot_client_module.logger.info('Publishing to topic: %s' % topic)
+        iot_client_module.logger.info('Message: %s' % message)
+        return self.mqttc.publish(topic, message, qos=1)
+
+
+def measure(client_class, level: int, messages: int, payload: str):
+    stream = CountingStream()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    logger = iot_client_module.logger
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    iot_client = client_class(IoTClientDetails('localhost', 8883, 'cert', 'key', 'ca', 'bench-thing'))
+    iot_client.mqttc = StubMqttClient()
+    try:
+        start = time.perf_counter()
+        for _ in range(messages):
+            iot_client.publish(TOPIC, payload)
+        seconds = time.perf_counter() - start
+    finally:
+        logger.removeHandler(handler)
+    return seconds / messages * 1e6, stream.characters / messages
+
+
+def run(messages: int):
+    payload = json.dumps(asdict(status_signal()))
+    print(f'{messages} messages of {len(payload)} bytes')
+    print(f'{"level":<8} {"logging":<6} {"us/publish":>10} {"log bytes/msg":>13}')
+    for level in (logging.WARNING, logging.INFO, logging.DEBUG):
+        for name, client_class in (('eager', EagerLoggingIoTClient), ('lazy', IoTClient)):
+            micros, volume = measure(client_class, level, messages, payload)
+            print(f'{logging.getLevelName(level):<8} {name:<6} {micros:>10.2f} {volume:>13.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+    run(args.messages)
@@ -0,0 +1,60 @@
+""" Message memory benchmark
+
+Measures the per message footprint and the number of allocated blocks of the
+slotted message classes against equivalent classes with a per instance __dict__
+
+    python benchmarks/bench_message_memory.py --messages 10000
+"""
+import sys
+sys.path.insert(0, ".")
+import argparse
+import gc
+import tracemalloc
+from types import SimpleNamespace
+
+import iot_messages.generic_signal_v2 as gen_sig_v2
+from benchmarks.messages import status_signal
+
+MESSAGE_CLASSES = ['GenericSignalDeviceInfoJobPhasePart', 'GenericSignalDeviceInfoJobPhase',
+                   'GenericSignalDeviceInfoEvent', 'GenericSignalDeviceInfo', 'GenericSignalSignalStatus',
+                   'GenericSignalPayload', 'GenericSignalV2']
+
+
+def dict_classes() -> SimpleNamespace:
+    """Subclasses without __slots__ get a __dict__ again, the constructors stay the same"""
+    return SimpleNamespace(**{name: type(name, (getattr(gen_sig_v2, name),), {}) for name in MESSAGE_CLASSES})
+
+
+def measure(classes, messages: int, job_phases: int, parts: int):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    signals = [status_signal(job_phases, parts, classes=classes) for _ in range(messages)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    statistics = after.compare_to(before, 'filename')
+    size = sum(stat.size_diff for stat in statistics)
+    blocks = sum(stat.count_diff for stat in statistics)
+    del signals
+    return size / messages, blocks / messages
+
+
+def run(messages: int, job_phases: int, parts: int):
+    print(f'{messages} messages with {job_phases} job phases and {parts} parts')
+    results = {
+        '__dict__': measure(dict_classes(), messages, job_phases, parts),
+        '__slots__': measure(gen_sig_v2, messages, job_phases, parts),
+    }
+    for name, (size, blocks) in results.items():
+        print(f'{name:<10} {size:8.0f} bytes/msg  {blocks:6.1f} blocks/msg')
+    saved = 1 - results['__slots__'][0] / results['__dict__'][0]
+    print(f'saved {saved:.0%} per message')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--job-phases', type=int, default=2)
+    parser.add_argument('--parts', type=int, default=2)
+    args = parser.parse_args()
+    run(args.messages, args.job_phases, args.parts)
@@ -0,0 +1,47 @@
+""" Serializer benchmark
+
+Compares dataclasses.asdict + json.dumps with the iot_messages serializer and
+the message builder, which serializes the constant header fields only once
+
+    python benchmarks/bench_serializer.py --job-phases 5 --parts 10
+"""
+import sys
+sys.path.insert(0, ".")
+import argparse
+import json
+import timeit
+from dataclasses import asdict
+
+from benchmarks.messages import status_signal
+from iot_messages import serializer
+from iot_messages.message_builder import GenericSignalV2Builder
+
+
+def run(job_phases: int, parts: int, number: int):
+    signal = status_signal(job_phases, parts)
+    candidates = {
+        'asdict + json.dumps': lambda: json.dumps(asdict(signal)),
+        'serializer (json)': lambda: json.dumps(serializer.to_dict(signal), separators=(',', ':'),
+                                                ensure_ascii=False).encode('utf-8'),
+    }
+    if serializer.orjson is not None:
+        candidates['serializer (orjson)'] = lambda: serializer.serialize(signal)
+    builder = GenericSignalV2Builder(signal, signal)  # the signal carries all asset and sender fields
+    candidates['message builder'] = lambda: builder.build(signal.payload, signal.assettimestamp,
+                                                          signal.sendertimestamp, signal.sendereventuuid)
+
+    print(f'message with {job_phases} job phases and {parts} parts, {number} runs')
+    baseline = None
+    for name, candidate in candidates.items():
+        seconds = min(timeit.repeat(candidate, number=number, repeat=3)) / number
+        baseline = baseline or seconds
+        print(f'{name:<22} {seconds * 1e6:8.1f} us/msg  {len(candidate()):6d} bytes  x{baseline / seconds:.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--job-phases', type=int, default=2)
+    parser.add_argument('--parts', type=int, default=2)
+    parser.add_argument('--number', type=int, default=5000)
+    args = parser.parse_args()
+    run(args.job_phases, args.parts, args.number)
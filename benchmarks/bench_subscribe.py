@@ -0,0 +1,82 @@
+""" Subscribe benchmark
+
+Connects an IoT Client to the local stub broker over TLS and subscribes to the
+five shadow topics, once with one SUBSCRIBE request per topic and once with a
+single SUBSCRIBE request for all topics. The broker delays every acknowledgement
+to simulate the round trip time to the endpoint. Reports the SUBSCRIBE packets
+sent and the time from the CONNACK until all subscriptions were acknowledged.
+
+    python benchmarks/bench_subscribe.py --connects 20 --rtt-ms 50
+"""
+import sys
+sys.path.insert(0, ".")
+import argparse
+import statistics
+import tempfile
+import threading
+
+from benchmarks.stub_broker import StubBroker, generate_credentials
+from iot_assets.iot_client import IoTClient, IoTClientDetails
+
+THING_NAME = 'bench-thing'
+SHADOW_TOPICS = [f'$aws/things/{THING_NAME}/shadow/{topic}'
+                 for topic in ('update/accepted', 'update/delta', 'update/documents', 'get/accepted', 'get/rejected')]
+
+
+def connect_until_ready(credentials, broker: StubBroker, batched: bool) -> float:
+    iot_client = IoTClient(IoTClientDetails('localhost', broker.port, credentials['client_cert'],
+                                            credentials['client_key'], credentials['ca'], THING_NAME))
+    ready = threading.Event()
+
+    connected = iot_client.on_connect
+
+    def on_connect(client, userdata, flags, result_code):
+        connected(client, userdata, flags, result_code)
+        if batched:
+            iot_client.subscribe(SHADOW_TOPICS)
+        else:
+            for topic in SHADOW_TOPICS:
+                iot_client.subscribe(topic)
+
+    def on_subscribe_wrapper(func):
+        def wrapper(client, userdata, mid, granted_qos):
+            func(client, userdata, mid, granted_qos)
+            if iot_client.connflag:
+                ready.set()
+
+        return wrapper
+
+    iot_client.on_connect = on_connect
+    iot_client.on_subscribe = on_subscribe_wrapper(iot_client.on_subscribe)
+    iot_client.connect()
+    try:
+        if not ready.wait(30):
+            raise TimeoutError('subscriptions were not acknowledged')
+        return iot_client.ready_seconds
+    finally:
+        iot_client.disconnect()
+        iot_client.mqttc.loop_stop()
+
+
+def run(connects: int, rtt_ms: float):
+    with tempfile.TemporaryDirectory() as directory:
+        credentials = generate_credentials(directory)
+        print(f'{len(SHADOW_TOPICS)} shadow topics, {connects} connects, acknowledgements delayed by {rtt_ms} ms')
+        print(f'{"mode":<22} {"SUBSCRIBE packets":>17} {"ready p50 ms":>12} {"ready max ms":>12}')
+        for batched in (False, True):
+            broker = StubBroker(credentials, ack_delay=rtt_ms / 1000.0).start()
+            try:
+                seconds = [connect_until_ready(credentials, broker, batched) for _ in range(connects)]
+            finally:
+                broker.stop()
+            mode = 'one SUBSCRIBE' if batched else 'SUBSCRIBE per topic'
+            print(f'{mode:<22} {broker.subscribe_count / connects:>17.0f} '
+                  f'{statistics.median(seconds) * 1000:>12.1f} {max(seconds) * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connects', type=int, default=20)
+    parser.add_argument('--rtt-ms', type=float, default=50.0)
+    args = parser.parse_args()
+    run(args.connects, args.rtt_ms)
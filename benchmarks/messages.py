@@ -0,0 +1,30 @@
+"""Representative generic signal v2 messages for the benchmarks"""
+import datetime
+import uuid
+
+import iot_messages.generic_signal_v2 as gen_sig_v2
+
+
+def status_signal(job_phases: int = 2, parts: int = 2, speed: int = 111,
+                  classes=gen_sig_v2) -> gen_sig_v2.GenericSignalV2:
+    """Builds a Status signal like the telemetry demo with a configurable number of job phases and parts
+
+    classes is the namespace providing the message classes, by default iot_messages.generic_signal_v2
+    """
+    part_list = [classes.GenericSignalDeviceInfoJobPhasePart(f'sideDemo{index}', f'sheetNameDemo{index}')
+                 for index in range(parts)]
+    job_phase_list = [classes.GenericSignalDeviceInfoJobPhase(11 * (index + 1), f'jobIdDemo{index}', 'InProgress',
+                                                              'statusDetailsDemo', 'costCenterIdDemo',
+                                                              'jobPartIdDemo', part_list, 'percentcompleted',
+                                                              'starttime', 'wasteDemo', 'workstepidDemo')
+                      for index in range(job_phases)]
+    event = classes.GenericSignalDeviceInfoEvent('eventValueDemo', 'eventIdDemo')
+    device_info = classes.GenericSignalDeviceInfo(speed, 'Production', 'statusdetailsdemo', 1, 22,
+                                                  job_phase_list, event)
+    payload = classes.GenericSignalPayload(classes.GenericSignalSignalStatus(device_info))
+    timestamp = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()
+    return classes.GenericSignalV2('assetIdDemo', 'assetserialDemo', timestamp, 'BoxPacker', 'generic.signal',
+                                   'Status', str(uuid.uuid1()), 'system', timestamp, payload,
+                                   'assetHardwareVersionDemo', 'assetmanufacturernameDemo', 'assetnameDemo',
+                                   'assetsoftwareversionDemo', 'Speedmaster', 'senderNameDemo',
+                                   'sendersoftwareversionDemo', 'siteIdDemo', 'siteNameOfDirectory')
@@ -0,0 +1,19 @@
+"""Resource usage of the benchmark process"""
+import resource
+import sys
+import time
+
+
+def rss_bytes() -> int:
+    """Current resident set size, the peak size where the current one is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def cpu_seconds() -> float:
+    """User and system CPU time of all threads of the process"""
+    return time.process_time()
@@ -0,0 +1,153 @@
+""" End to end benchmark
+
+Publishes status signals through a Sender to the local stub broker over TLS
+for every combination of message rate and size and reports the throughput,
+the publish to PUBACK latency from the metrics of the client, and CPU and
+resident memory of the client process. Every run uses a fresh client
+process, the broker runs in this process. A rate of 0 publishes as fast as
+the broker acknowledges, with at most --window messages awaiting their
+PUBACK. A size is rounded up to the next status signal with whole job
+phases: the smallest signal has 1002 bytes, the next one 1405 bytes, so the
+default size of 1024 bytes publishes messages of about 1.4 KB.
+
+    python benchmarks/run_benchmarks.py --rates 0 1000 --sizes 1024 8192 --seconds 5
+
+--json stores the results, --baseline compares them with stored results and
+exits with status 1 if the throughput dropped or the p99 latency rose by more
+than --tolerance percent.
+"""
+import sys
+sys.path.insert(0, ".")
+import argparse
+import json
+import multiprocessing
+import tempfile
+import time
+from dataclasses import asdict
+
+from benchmarks.messages import status_signal
+from benchmarks.resources import cpu_seconds, rss_bytes
+from benchmarks.stub_broker import StubBroker, generate_credentials
+from iot_assets.iot_client import IoTClientDetails
+from iot_assets.sender import Sender, SenderDetails
+from metrics.registry import metrics_registry
+
+
+def status_payload(size: int) -> str:
+    """A status signal with as many job phases as needed to reach the size in bytes"""
+    job_phases = 0
+    while True:
+        payload = json.dumps(asdict(status_signal(job_phases=job_phases)))
+        if len(payload) >= size or job_phases >= 10000:
+            return payload
+        job_phases = max(job_phases + 1, job_phases * size // len(payload))
+
+
+def measure(credentials, port: int, rate: float, size: int, seconds: float, window: int, results):
+    """Runs in a fresh process, so the numbers of one run do not affect the next one"""
+    registry = metrics_registry()
+    registry.enable()
+    published = registry.counter('iot_published_messages_total')
+    puback_seconds = registry.histogram('iot_puback_seconds')
+    sender = Sender(SenderDetails('benchmark', 'benchmark', '1.0', 'org', 'site', 'bench-client', 'telemetry'),
+                    IoTClientDetails('localhost', port, credentials['client_cert'], credentials['client_key'],
+                                     credentials['ca'], 'bench-thing'))
+    sender.state = {'sendTelemetryData': True}
+    payload = status_payload(size)
+    sender.connect()
+    while not sender.iot_client.connflag:
+        time.sleep(0.01)
+    registry.reset()
+
+    interval = 1.0 / rate if rate > 0 else 0.0
+    cpu_start = cpu_seconds()
+    start = next_publish = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        sender.publish_telemetry(payload)
+        if not interval:
+            while published.value - puback_seconds.count >= window:
+                time.sleep(0.0001)
+        else:
+            next_publish += interval
+            delay = next_publish - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    deadline = time.perf_counter() + 60
+    while puback_seconds.count < published.value and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    cpu = cpu_seconds() - cpu_start
+    results.put({'rate': rate, 'requested_size': size, 'size': len(payload), 'messages': published.value,
+                 'acked': puback_seconds.count, 'msgs_per_second': puback_seconds.count / elapsed,
+                 'p50_ms': puback_seconds.quantile(0.5) * 1000,
+                 'p99_ms': puback_seconds.quantile(0.99) * 1000, 'cpu_percent': 100 * cpu / elapsed,
+                 'cpu_us_per_message': 1e6 * cpu / max(1, published.value), 'rss_mb': rss_bytes() / 2 ** 20})
+    sender.disconnect(5)
+    sender.iot_client.mqttc.loop_stop()
+
+
+def run(rates, sizes, seconds: float, rtt_ms: float, window: int):
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        credentials = generate_credentials(directory)
+        broker = StubBroker(credentials, ack_delay=rtt_ms / 1000.0).start()
+        try:
+            print(f'{seconds} s per run, simulated round trip {rtt_ms} ms')
+            print(f'{"rate":>6} {"bytes":>6} {"msgs/s":>8} {"p50 ms":>7} {"p99 ms":>7} {"cpu %":>6} '
+                  f'{"cpu us/msg":>10} {"rss MB":>7}')
+            for size in sizes:
+                for rate in rates:
+                    queue = context.Queue()
+                    process = context.Process(target=measure, args=(credentials, broker.port, rate, size, seconds,
+                                                                    window, queue))
+                    process.start()
+                    result = queue.get()
+                    process.join()
+                    results.append(result)
+                    print(f'{f"{rate:g}" if rate else "max":>6} {result["size"]:>6} {result["msgs_per_second"]:>8.0f} '
+                          f'{result["p50_ms"]:>7.2f} {result["p99_ms"]:>7.2f} {result["cpu_percent"]:>6.1f} '
+                          f'{result["cpu_us_per_message"]:>10.1f} {result["rss_mb"]:>7.1f}')
+        finally:
+            broker.stop()
+    return results
+
+
+def regressions(results, baseline, tolerance: float):
+    """Compares the results with the baseline results of the same rate and requested size"""
+    previous = {(result['rate'], result['requested_size']): result for result in baseline}
+    found = []
+    for result in results:
+        before = previous.get((result['rate'], result['requested_size']))
+        if before is None:
+            continue
+        rate = f'{result["rate"]:g}' if result['rate'] else 'max'
+        name = f'rate {rate}, {result["requested_size"]} bytes'
+        if result['msgs_per_second'] < before['msgs_per_second'] * (1 - tolerance / 100):
+            found.append(f'{name}: {before["msgs_per_second"]:.0f} -> {result["msgs_per_second"]:.0f} msgs/s')
+        if result['p99_ms'] > before['p99_ms'] * (1 + tolerance / 100):
+            found.append(f'{name}: p99 {before["p99_ms"]:.2f} -> {result["p99_ms"]:.2f} ms')
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rates', type=float, nargs='+', default=[0, 1000], help='messages per second, 0 is max')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 8192], help='message sizes in bytes')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--rtt-ms', type=float, default=0.0, help='delay of every acknowledgement of the broker')
+    parser.add_argument('--window', type=int, default=100, help='messages awaiting their PUBACK at rate 0')
+    parser.add_argument('--json', help='stores the results in this file')
+    parser.add_argument('--baseline', help='results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=20.0, help='percent')
+    args = parser.parse_args()
+    all_results = run(args.rates, args.sizes, args.seconds, args.rtt_ms, args.window)
+    if args.json:
+        with open(args.json, 'w') as results_file:
+            json.dump(all_results, results_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = regressions(all_results, json.load(baseline_file), args.tolerance)
+        for regression in found:
+            print(f'regression: {regression}')
+        sys.exit(1 if found else 0)
@@ -0,0 +1,427 @@
+"""Local stand-in MQTT broker for tests and benchmarks
+
+A small MQTT 3.1.1 broker written in pure python. It serves TLS on loopback
+with self-signed certificates, runs a single selector based network thread and
+supports what the reference client needs: CONNECT with persistent sessions,
+PUBLISH with QoS 0 and 1, SUBSCRIBE with wildcards, UNSUBSCRIBE, PINGREQ and
+DISCONNECT. Messages are forwarded to matching subscribers with QoS 0.
+
+An ack_delay simulates the round trip time to a remote broker, every
+acknowledgement (CONNACK, PUBACK, SUBACK) is sent after the delay.
+"""
+import datetime
+import heapq
+import ipaddress
+import os
+import selectors
+import socket
+import ssl
+import struct
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def generate_credentials(directory: str) -> Dict[str, str]:
+    """Creates a self-signed CA with a server certificate for localhost and a client certificate
+
+    Returns the paths of the created pem files
+    """
+    os.makedirs(directory, exist_ok=True)
+    ca_key = _private_key()
+    ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'Stub Broker CA')])
+    ca_cert = _certificate(ca_name, ca_name, ca_key.public_key(), ca_key,
+                           [(x509.BasicConstraints(ca=True, path_length=None), True)])
+    server_key = _private_key()
+    server_cert = _certificate(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')]), ca_name,
+                               server_key.public_key(), ca_key,
+                               [(x509.SubjectAlternativeName([x509.DNSName('localhost'),
+                                                              x509.IPAddress(ipaddress.ip_address('127.0.0.1'))]),
+                                 False)])
+    client_key = _private_key()
+    client_cert = _certificate(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'Stub Broker Client')]), ca_name,
+                               client_key.public_key(), ca_key, [])
+    paths = {
+        'ca': os.path.join(directory, 'ca.pem'),
+        'server_cert': os.path.join(directory, 'server.pem'),
+        'server_key': os.path.join(directory, 'server.key'),
+        'client_cert': os.path.join(directory, 'client.pem'),
+        'client_key': os.path.join(directory, 'client.key'),
+    }
+    _write(paths['ca'], ca_cert.public_bytes(serialization.Encoding.PEM))
+    _write(paths['server_cert'], server_cert.public_bytes(serialization.Encoding.PEM))
+    _write(paths['server_key'], _key_bytes(server_key))
+    _write(paths['client_cert'], client_cert.public_bytes(serialization.Encoding.PEM))
+    _write(paths['client_key'], _key_bytes(client_key))
+    return paths
+
+
+def _private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+
+
+def _certificate(subject, issuer, public_key, signing_key, extensions):
+    now = datetime.datetime.utcnow()
+    builder = x509.CertificateBuilder().subject_name(subject).issuer_name(issuer).public_key(public_key) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=30))
+    for extension, critical in extensions:
+        builder = builder.add_extension(extension, critical=critical)
+    return builder.sign(signing_key, hashes.SHA256(), default_backend())
+
+
+def _key_bytes(key) -> bytes:
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                             serialization.NoEncryption())
+
+
+def _write(path: str, data: bytes) -> None:
+    with open(path, 'wb') as pem:
+        pem.write(data)
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for index, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if index >= len(topic_levels) or (level != '+' and level != topic_levels[index]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _packet(packet_type: int, body: bytes, flags: int = 0) -> bytes:
+    return bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode('utf-8')
+    return struct.pack('>H', len(encoded)) + encoded
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.handshake_done = False
+        self.inbound = bytearray()
+        self.outbound = bytearray()
+        self.client_id = None
+        self.closed = False
+
+
+class StubBroker:
+    """ Stub Broker
+    Start it with start(), the port is chosen by the operating system unless given.
+    on_message is called with (client_id, topic, payload) for every received PUBLISH
+    """
+    def __init__(self, credentials: Dict[str, str], port: int = 0, ack_delay: float = 0.0,
+                 on_message: Optional[Callable[[str, str, bytes], None]] = None):
+        self.credentials = credentials
+        self.ack_delay = ack_delay
+        self.on_message = on_message
+        self.publish_count = 0
+        self.publish_bytes = 0
+        self.subscribe_count = 0
+        self.connect_count = 0
+        self.messages: List[tuple] = []
+        self.record_messages = False
+        self.sessions: Dict[str, Dict[str, int]] = {}
+        self._context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self._context.load_cert_chain(credentials['server_cert'], credentials['server_key'])
+        self._context.load_verify_locations(credentials['ca'])
+        self._context.verify_mode = ssl.CERT_REQUIRED
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(('127.0.0.1', port))
+        self.port = self._server.getsockname()[1]
+        self._selector = selectors.DefaultSelector()
+        self._connections: Dict[socket.socket, _Connection] = {}
+        self._subscriptions = defaultdict(dict)  # connection -> topic filter -> qos
+        self._scheduled = []
+        self._sequence = 0
+        self._commands = []
+        self._lock = threading.Lock()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._running = False
+        self._thread = None
+
+    def start(self) -> 'StubBroker':
+        self._server.listen(512)
+        self._server.setblocking(False)
+        self._wakeup_reader.setblocking(False)
+        self._selector.register(self._server, selectors.EVENT_READ)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='stub-broker', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        self._wakeup()
+        if self._thread is not None:
+            self._thread.join(5)
+        for connection in list(self._connections.values()):
+            self._close(connection)
+        self._selector.close()
+        self._server.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        """Sends a message to all subscribers of the topic"""
+        self._submit(lambda: self._forward(topic, payload))
+
+    def disconnect_all(self) -> None:
+        """Drops all client connections, like a broker restart"""
+        self._submit(lambda: [self._close(connection) for connection in list(self._connections.values())])
+
+    @property
+    def connected_clients(self) -> int:
+        return len(self._connections)
+
+    def _submit(self, command) -> None:
+        with self._lock:
+            self._commands.append(command)
+        self._wakeup()
+
+    def _wakeup(self) -> None:
+        try:
+            self._wakeup_writer.send(b'\0')
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        while self._running:
+            timeout = None
+            if self._scheduled:
+                timeout = max(0.0, self._scheduled[0][0] - time.monotonic())
+            for key, events in self._selector.select(timeout):
+                if key.fileobj is self._server:
+                    self._accept()
+                elif key.fileobj is self._wakeup_reader:
+                    self._drain_wakeup()
+                else:
+                    connection = self._connections.get(key.fileobj)
+                    if connection is None:
+                        continue
+                    if events & selectors.EVENT_READ:
+                        self._read(connection)
+                    if events & selectors.EVENT_WRITE and not connection.closed:
+                        self._flush(connection)
+            now = time.monotonic()
+            while self._scheduled and self._scheduled[0][0] <= now:
+                _, _, connection, data = heapq.heappop(self._scheduled)
+                self._send(connection, data)
+
+    def _drain_wakeup(self) -> None:
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        with self._lock:
+            commands, self._commands = self._commands, []
+        for command in commands:
+            command()
+
+    def _accept(self) -> None:
+        try:
+            sock, _ = self._server.accept()
+        except (BlockingIOError, OSError):
+            return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        tls_sock = self._context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        tls_sock.setblocking(False)
+        connection = _Connection(tls_sock)
+        self._connections[tls_sock] = connection
+        self._selector.register(tls_sock, selectors.EVENT_READ)
+
+    def _read(self, connection: _Connection) -> None:
+        try:
+            if not connection.handshake_done:
+                connection.sock.do_handshake()
+                connection.handshake_done = True
+            while True:
+                data = connection.sock.recv(65536)
+                if not data:
+                    self._close(connection)
+                    return
+                connection.inbound += data
+                if not connection.sock.pending():
+                    break
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError):
+            pass
+        except (ssl.SSLError, OSError):
+            self._close(connection)
+            return
+        self._process(connection)
+
+    def _process(self, connection: _Connection) -> None:
+        data = connection.inbound
+        while not connection.closed:
+            if len(data) < 2:
+                return
+            length, multiplier, index = 0, 1, 1
+            while True:
+                if index >= len(data):
+                    return
+                byte = data[index]
+                length += (byte & 0x7f) * multiplier
+                multiplier *= 128
+                index += 1
+                if not byte & 0x80:
+                    break
+            if len(data) < index + length:
+                return
+            header = data[0]
+            body = bytes(data[index:index + length])
+            del data[:index + length]
+            self._handle(connection, header >> 4, header & 0x0f, body)
+
+    def _handle(self, connection: _Connection, packet_type: int, flags: int, body: bytes) -> None:
+        if packet_type == CONNECT:
+            self._handle_connect(connection, body)
+        elif packet_type == PUBLISH:
+            self._handle_publish(connection, flags, body)
+        elif packet_type == SUBSCRIBE:
+            self._handle_subscribe(connection, body)
+        elif packet_type == UNSUBSCRIBE:
+            self._handle_unsubscribe(connection, body)
+        elif packet_type == PINGREQ:
+            self._send(connection, _packet(PINGRESP, b''))
+        elif packet_type == DISCONNECT:
+            self._close(connection)
+
+    def _handle_connect(self, connection: _Connection, body: bytes) -> None:
+        name_length = struct.unpack('>H', body[:2])[0]
+        offset = 2 + name_length + 1
+        connect_flags = body[offset]
+        offset += 3
+        client_id_length = struct.unpack('>H', body[offset:offset + 2])[0]
+        connection.client_id = body[offset + 2:offset + 2 + client_id_length].decode('utf-8')
+        clean_session = bool(connect_flags & 0x02)
+        session_present = 0
+        if clean_session:
+            self.sessions.pop(connection.client_id, None)
+        elif connection.client_id in self.sessions:
+            session_present = 1
+            self._subscriptions[connection] = dict(self.sessions[connection.client_id])
+        if not clean_session:
+            self.sessions.setdefault(connection.client_id, {})
+        self.connect_count += 1
+        self._acknowledge(connection, _packet(CONNACK, bytes([session_present, 0])))
+
+    def _handle_publish(self, connection: _Connection, flags: int, body: bytes) -> None:
+        qos = (flags >> 1) & 0x03
+        topic_length = struct.unpack('>H', body[:2])[0]
+        topic = body[2:2 + topic_length].decode('utf-8')
+        offset = 2 + topic_length
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+        payload = body[offset:]
+        self.publish_count += 1
+        self.publish_bytes += len(payload)
+        if self.record_messages:
+            self.messages.append((connection.client_id, topic, payload))
+        if qos:
+            self._acknowledge(connection, _packet(PUBACK, packet_id))
+        if self.on_message is not None:
+            self.on_message(connection.client_id, topic, payload)
+        self._forward(topic, payload)
+
+    def _handle_subscribe(self, connection: _Connection, body: bytes) -> None:
+        packet_id, offset, granted = body[:2], 2, bytearray()
+        while offset < len(body):
+            length = struct.unpack('>H', body[offset:offset + 2])[0]
+            topic_filter = body[offset + 2:offset + 2 + length].decode('utf-8')
+            qos = min(body[offset + 2 + length], 1)
+            offset += 3 + length
+            self._subscriptions[connection][topic_filter] = qos
+            if connection.client_id in self.sessions:
+                self.sessions[connection.client_id][topic_filter] = qos
+            granted.append(qos)
+        self.subscribe_count += 1
+        self._acknowledge(connection, _packet(SUBACK, packet_id + bytes(granted)))
+
+    def _handle_unsubscribe(self, connection: _Connection, body: bytes) -> None:
+        packet_id, offset = body[:2], 2
+        while offset < len(body):
+            length = struct.unpack('>H', body[offset:offset + 2])[0]
+            topic_filter = body[offset + 2:offset + 2 + length].decode('utf-8')
+            offset += 2 + length
+            self._subscriptions[connection].pop(topic_filter, None)
+            self.sessions.get(connection.client_id, {}).pop(topic_filter, None)
+        self._acknowledge(connection, _packet(UNSUBACK, packet_id))
+
+    def _forward(self, topic: str, payload: bytes) -> None:
+        packet = None
+        for connection, filters in list(self._subscriptions.items()):
+            if connection.closed:
+                continue
+            if any(topic_matches(topic_filter, topic) for topic_filter in filters):
+                packet = packet or _packet(PUBLISH, _string(topic) + payload)
+                self._send(connection, packet)
+
+    def _acknowledge(self, connection: _Connection, data: bytes) -> None:
+        if self.ack_delay <= 0:
+            self._send(connection, data)
+            return
+        self._sequence += 1
+        heapq.heappush(self._scheduled, (time.monotonic() + self.ack_delay, self._sequence, connection, data))
+
+    def _send(self, connection: _Connection, data: bytes) -> None:
+        if connection.closed:
+            return
+        connection.outbound += data
+        self._flush(connection)
+
+    def _flush(self, connection: _Connection) -> None:
+        try:
+            while connection.outbound:
+                sent = connection.sock.send(connection.outbound)
+                del connection.outbound[:sent]
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError):
+            pass
+        except (ssl.SSLError, OSError):
+            self._close(connection)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if connection.outbound else 0)
+        self._selector.modify(connection.sock, events)
+
+    def _close(self, connection: _Connection) -> None:
+        if connection.closed:
+            return
+        connection.closed = True
+        self._connections.pop(connection.sock, None)
+        self._subscriptions.pop(connection, None)
+        try:
+            self._selector.unregister(connection.sock)
+        except (KeyError, ValueError):
+            pass
+        try:
+            connection.sock.close()
+        except OSError:
+            pass
@@ -0,0 +1,230 @@
+"""Precompiled validation of generic.signal / Status version 2 messages
+
+The json schemas are compiled once into a tree of plain python checks, so a
+message is validated without the generic jsonschema interpreter. Only the
+keywords used by the local schemas are supported (type, enum, properties,
+required, items and additionalProperties), annotations like format or
+description are ignored the same way jsonschema ignores them by default.
+
+Messages can be passed as parsed dicts or directly as the dataclass instances
+of iot_messages.generic_signal_v2. For dataclass instances a field set to None
+is treated as an omitted optional field.
+"""
+import dataclasses
+import numbers
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from .schema_validator import (PATHS, EventValidator, SchemaRegistry, SchemaValidationException, validate_seconds,
+                               validation_failures)
+
+Error = Tuple[tuple, str]
+Check = Callable[[Any], Optional[List[Error]]]
+
+ANNOTATIONS = {'$schema', '$id', 'title', 'description', 'format', 'default', 'examples', '$comment'}
+
+_dataclass_fields = {}
+
+
+def _is_object(value) -> bool:
+    return isinstance(value, dict) or (dataclasses.is_dataclass(value) and not isinstance(value, type))
+
+
+def _is_integer(value) -> bool:
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) or (isinstance(value, float) and value.is_integer())
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+TYPE_CHECKS = {
+    'object': _is_object,
+    'array': lambda value: isinstance(value, list),
+    'string': lambda value: isinstance(value, str),
+    'integer': _is_integer,
+    'number': _is_number,
+    'boolean': lambda value: isinstance(value, bool),
+    'null': lambda value: value is None,
+}
+
+
+def _present_items(value):
+    """Returns the (name, value) pairs of a dict or of the set fields of a dataclass instance"""
+    if isinstance(value, dict):
+        return value.items()
+    names = _dataclass_fields.get(type(value))
+    if names is None:
+        names = _dataclass_fields[type(value)] = tuple(f.name for f in dataclasses.fields(value))
+    return [(name, getattr(value, name)) for name in names if getattr(value, name) is not None]
+
+
+def _get(value, name, missing):
+    if isinstance(value, dict):
+        return value.get(name, missing)
+    attribute = getattr(value, name, None)
+    return missing if attribute is None else attribute
+
+
+def _prefixed(key, errors: List[Error]) -> List[Error]:
+    return [((key,) + path, message) for path, message in errors]
+
+
+def compile_schema(schema: dict) -> Check:
+    """Compiles a json schema into a check function
+
+    The check returns None for a valid instance, otherwise a list of
+    (path, message) tuples describing every violation.
+    """
+    unsupported = set(schema) - ANNOTATIONS - {'type', 'enum', 'properties', 'required', 'items',
+                                               'additionalProperties'}
+    if unsupported:
+        raise SchemaValidationException('Unsupported schema keywords', details=sorted(unsupported))
+
+    checks = []
+    if 'type' in schema:
+        checks.append(_compile_type(schema['type']))
+    if 'enum' in schema:
+        checks.append(_compile_enum(schema['enum']))
+    if 'properties' in schema or 'required' in schema or 'additionalProperties' in schema:
+        checks.append(_compile_object(schema))
+    if 'items' in schema:
+        checks.append(_compile_items(schema['items']))
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check(value):
+        errors = None
+        for sub_check in checks:
+            found = sub_check(value)
+            if found:
+                errors = (errors or []) + found
+        return errors
+
+    return check
+
+
+def _compile_type(expected) -> Check:
+    names = [expected] if isinstance(expected, str) else list(expected)
+    type_checks = [TYPE_CHECKS[name] for name in names]
+    description = repr(expected)
+
+    def check(value):
+        for type_check in type_checks:
+            if type_check(value):
+                return None
+        return [((), f'{value!r} is not of type {description}')]
+
+    return check
+
+
+def _compile_enum(enum) -> Check:
+    allows_bool = any(isinstance(member, bool) for member in enum)
+
+    def check(value):
+        if value in enum and (allows_bool or not isinstance(value, bool)):
+            return None
+        return [((), f'{value!r} is not one of {enum!r}')]
+
+    return check
+
+
+def _compile_object(schema) -> Check:
+    missing = object()
+    properties = [(name, compile_schema(sub_schema)) for name, sub_schema in schema.get('properties', {}).items()]
+    known = set(schema.get('properties', {}))
+    required = list(schema.get('required', []))
+    additional = schema.get('additionalProperties', True)
+    if additional not in (True, False):
+        raise SchemaValidationException('Unsupported schema keywords', details=['additionalProperties'])
+
+    def check(value):
+        if not _is_object(value):
+            return None
+        errors = None
+        for name, sub_check in properties:
+            sub_value = _get(value, name, missing)
+            if sub_value is not missing:
+                found = sub_check(sub_value)
+                if found:
+                    errors = (errors or []) + _prefixed(name, found)
+        for name in required:
+            if _get(value, name, missing) is missing:
+                errors = (errors or []) + [((), f'{name!r} is a required property')]
+        if additional is False:
+            extras = [name for name, _ in _present_items(value) if name not in known]
+            if extras:
+                unexpected = ', '.join(repr(name) for name in sorted(extras))
+                errors = (errors or []) + [((), f'Additional properties are not allowed ({unexpected} unexpected)')]
+        return errors
+
+    return check
+
+
+def _compile_items(items_schema) -> Check:
+    if not isinstance(items_schema, dict):
+        raise SchemaValidationException('Unsupported schema keywords', details=['items'])
+    item_check = compile_schema(items_schema)
+
+    def check(value):
+        if not isinstance(value, list):
+            return None
+        errors = None
+        for index, item in enumerate(value):
+            found = item_check(item)
+            if found:
+                errors = (errors or []) + _prefixed(index, found)
+        return errors
+
+    return check
+
+
+class StatusV2Validator:
+    """ Status V2 Validator
+    Validates generic.signal / Status messages in payload version 2 against the
+    header version 3 schema and the Status payload schema, both precompiled.
+    The Status schema describes the whole message (eventtype, eventsubtype and
+    payload), therefore it is applied to the complete message.
+    """
+    def __init__(self, paths=PATHS):
+        registry = SchemaRegistry(paths)
+        header_schema = EventValidator.load_json(registry.header_path(3))
+        status_schema = EventValidator.load_json(registry.payload_path('generic.signal', 'Status', 2))
+        self._checks = (compile_schema(header_schema), compile_schema(status_schema))
+
+    def iter_errors(self, message) -> List[str]:
+        """Returns all violations of the message as 'path: message' strings"""
+        errors = []
+        for check in self._checks:
+            for path, error in check(message) or ():
+                errors.append(f'{"/".join(str(part) for part in path)}: {error}' if path else error)
+        return errors
+
+    def is_valid(self, message) -> bool:
+        for check in self._checks:
+            if check(message):
+                return False
+        return True
+
+    def validate(self, message) -> None:
+        start = time.perf_counter() if validate_seconds.enabled else None
+        valid = self.is_valid(message)
+        if start is not None:
+            validate_seconds.observe(time.perf_counter() - start)
+        if not valid:
+            validation_failures.inc()
+            raise SchemaValidationException(details=self.iter_errors(message))
+
+
+_status_v2_validator = None
+
+
+def status_v2_validator_factory() -> StatusV2Validator:
+    """Returns the shared precompiled validator, the schemas are compiled on first use"""
+    global _status_v2_validator
+    if _status_v2_validator is None:
+        _status_v2_validator = StatusV2Validator(PATHS)
+    return _status_v2_validator
@@ -1,8 +1,17 @@
 import json
 import os
+import threading
+import time
+from collections import defaultdict, namedtuple
+from functools import partial
 from os.path import dirname, join
+from typing import Dict, Iterable, List, Union
 
-from jsonschema import validate
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+from metrics.registry import metrics_registry
+from .validation_policy import ValidationPolicy
 
 HEADER_FILE_NAME = "header.schema.json"
 CURRENT_DIR = dirname(__file__)
@@ -13,13 +22,141 @@ PATHS = {
     "header_file_name": HEADER_FILE_NAME,
 }
 
+SCHEMA_KEYS = ('headerversion', 'eventtype', 'eventsubtype', 'payloadversion')  # select the schemas of a message
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'size'])
+
+validate_seconds = metrics_registry().histogram('iot_validate_seconds', 'Time to validate a message')
+validation_failures = metrics_registry().counter('iot_validation_failures_total', 'Messages which failed validation')
+
+
+class SchemaRegistry:
+    """ Schema Registry
+    Loads and compiles every header and payload schema only once and keeps
+    the compiled validators in memory. Header validators are keyed by
+    headerversion, payload validators by (eventtype, eventsubtype, payloadversion)
+
+    The registry can be shared between threads. A jsonschema validator keeps a
+    resolution scope stack while validating, therefore every thread gets its own
+    validator instance built from the shared, already checked schema.
+    The hit and miss counters are statistics only and are not synchronized.
+    """
 
-class EventValidator:
     def __init__(self, paths):
         self.path_to_header = paths['path_to_header']
         self.header_file_name = paths['header_file_name']
         self.path_to_payload = paths['path_to_payload']
-        self.message = None
+        self._factories = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def header_path(self, header_version) -> str:
+        return join(self.path_to_header, str(header_version), self.header_file_name)
+
+    def payload_path(self, event_type, event_subtype, payload_version) -> str:
+        return join(self.path_to_payload,
+                    str(event_type),
+                    str(event_subtype),
+                    str(payload_version),
+                    f'{event_subtype}.schema.json')
+
+    def header_validator(self, header_version):
+        """Returns the compiled validator of the given header version"""
+        return self._get(('header', header_version), self.header_path(header_version))
+
+    def payload_validator(self, event_type, event_subtype, payload_version):
+        """Returns the compiled validator of the given payload schema"""
+        key = ('payload', event_type, event_subtype, payload_version)
+        return self._get(key, self.payload_path(event_type, event_subtype, payload_version))
+
+    def _get(self, key, path):
+        validators = getattr(self._local, 'validators', None)
+        if validators is None:
+            validators = self._local.validators = {}
+        validator = validators.get(key)
+        if validator is not None:
+            self.hits += 1
+            return validator
+        factory = self._factories.get(key)
+        if factory is None:
+            with self._lock:
+                factory = self._factories.get(key)
+                if factory is None:
+                    self.misses += 1
+                    factory = self._compile(path)
+                    self._factories[key] = factory
+                else:
+                    self.hits += 1
+        else:
+            self.hits += 1
+        validator = validators[key] = factory()
+        return validator
+
+    @staticmethod
+    def _compile(path):
+        """Loads and checks the schema, returns a factory for validator instances"""
+        if not EventValidator.file_exists(path):
+            raise SchemaValidationException("Schema not available", details=path)
+        schema = EventValidator.load_json(path)
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        return partial(cls, schema)
+
+    def preload(self) -> int:
+        """Compiles all header and payload schemas found on disk
+
+        Intended to be called once at startup, so that no schema has to be
+        loaded while messages are validated. Returns the number of cached validators
+        """
+        for header_version in _subdirectories(self.path_to_header):
+            if EventValidator.file_exists(self.header_path(header_version)):
+                self.header_validator(_version(header_version))
+        for event_type in _subdirectories(self.path_to_payload):
+            for event_subtype in _subdirectories(join(self.path_to_payload, event_type)):
+                for payload_version in _subdirectories(join(self.path_to_payload, event_type, event_subtype)):
+                    path = self.payload_path(event_type, event_subtype, payload_version)
+                    if EventValidator.file_exists(path):
+                        self.payload_validator(event_type, event_subtype, _version(payload_version))
+        return len(self._factories)
+
+    def cache_info(self) -> CacheInfo:
+        """Reports cache hits, misses and the number of compiled validators"""
+        return CacheInfo(self.hits, self.misses, len(self._factories))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._factories.clear()
+            self._local = threading.local()
+            self.hits = 0
+            self.misses = 0
+
+
+def _subdirectories(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(entry for entry in os.listdir(path) if os.path.isdir(join(path, entry)))
+
+
+def _version(directory_name):
+    """Versions are stored as integers in the messages, directories are named after them"""
+    return int(directory_name) if directory_name.isdigit() else directory_name
+
+
+class EventValidator:
+    """ Event Validator
+    Validates messages against the local header and payload json schemas.
+    The validation keeps no per message state, so one instance can be used
+    concurrently from several threads. An optional validation policy decides
+    which messages passed to validate() get the full schema validation
+    """
+    def __init__(self, paths, registry: SchemaRegistry = None, policy: ValidationPolicy = None):
+        self.path_to_header = paths['path_to_header']
+        self.header_file_name = paths['header_file_name']
+        self.path_to_payload = paths['path_to_payload']
+        self.registry = registry or SchemaRegistry(paths)
+        self.policy = policy
 
     @staticmethod
     def load_json(file_path):
@@ -34,49 +171,141 @@ class EventValidator:
     def file_exists(file_path):
         return os.path.isfile(file_path)
 
-    def validate_header(self) -> None:
+    @staticmethod
+    def _check(validator, instance) -> None:
+        error = best_match(validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+    def validate_header(self, message: dict) -> None:
         try:
-            header_version = self.message ['headerversion']
-            path = f'{self.path_to_header}' \
-                   f'/{header_version}/{self.header_file_name}'
-            schema = EventValidator.load_json(path)
-            validate(instance=self.message , schema=schema)
+            header_version = message['headerversion']
+            EventValidator._check(self.registry.header_validator(header_version), message)
         except Exception as err:
             raise SchemaValidationException(details=err)
 
-    def validate_payload(self, payload_path: str) -> None:
+    def validate_payload(self, message: dict, validator) -> None:
         try:
-            payload_schema = EventValidator.load_json(payload_path)
-            validate(instance=self.message['payload'],
-                     schema=payload_schema)
+            EventValidator._check(validator, message['payload'])
         except Exception as err:
             raise SchemaValidationException(details=err)
 
-    def validate(self, message: str):
+    def validate(self, message: Union[str, bytes]):
+        if not validate_seconds.enabled:
+            return self._validate(message)
+        start = time.perf_counter()
         try:
-            self.message = self.message = json.loads(message)
-            self.validate_header()
-            event_type = self.message .get('eventtype')
-            event_subtype = self.message .get('eventsubtype')
-            event_version = self.message .get('payloadversion')
-            file_name = f'{event_subtype}.schema.json'
-            payload_path = join(self.path_to_payload,
-                                event_type,
-                                event_subtype,
-                                str(event_version),
-                                file_name)
-            if not EventValidator.file_exists(payload_path):
+            self._validate(message)
+        except SchemaValidationException:
+            validation_failures.inc()
+            raise
+        finally:
+            validate_seconds.observe(time.perf_counter() - start)
+
+    def _validate(self, message: Union[str, bytes]):
+        parsed = None
+        try:
+            parsed = json.loads(message)
+            if self.policy is not None and not self.policy.should_validate(parsed):
+                return
+            self.validate_header(parsed)
+            event_type = parsed.get('eventtype')
+            event_subtype = parsed.get('eventsubtype')
+            event_version = parsed.get('payloadversion')
+            try:
+                validator = self.registry.payload_validator(event_type, event_subtype, event_version)
+            except SchemaValidationException:
                 raise SchemaValidationException("Payload Schema not available")
-            self.validate_payload(payload_path)
+            self.validate_payload(parsed, validator)
         except Exception as err:
+            if self.policy is not None and isinstance(parsed, dict):
+                self.policy.rejected(parsed)
             raise SchemaValidationException(details=err)
+        if self.policy is not None:
+            self.policy.accepted(parsed)
+
+    def validate_many(self, messages: Iterable[Union[str, bytes, dict]]) -> Dict[int, List[str]]:
+        """Validates a batch of messages without raising per message
+
+        Accepts json strings, bytes or already parsed dicts. The messages are grouped
+        by their schema keys, so each compiled validator is looked up once per group.
+        The validation policy does not apply, every message is validated.
+        Returns the error list of every invalid message keyed by its index in the batch,
+        an empty dict means that all messages are valid.
+        """
+        errors = {}
+        header_groups = defaultdict(list)
+        payload_groups = defaultdict(list)
+        for index, message in enumerate(messages):
+            if isinstance(message, (str, bytes, bytearray)):
+                try:
+                    message = json.loads(message)
+                except ValueError as err:
+                    errors[index] = [f'invalid json: {err}']
+                    continue
+            if not isinstance(message, dict):
+                errors[index] = ['message is not a json object']
+                continue
+            invalid_keys = [key for key in SCHEMA_KEYS
+                            if not isinstance(message.get(key), (str, int, float, type(None)))]
+            if invalid_keys:
+                errors[index] = [f'{key} must be a string or number' for key in invalid_keys]
+                continue
+            header_groups[message.get('headerversion')].append((index, message))
+            payload_key = (message.get('eventtype'), message.get('eventsubtype'), message.get('payloadversion'))
+            payload_groups[payload_key].append((index, message))
+
+        for header_version, group in header_groups.items():
+            try:
+                validator = self.registry.header_validator(header_version)
+            except SchemaValidationException:
+                _add_group_error(errors, group, f'header schema not available: {header_version}')
+                continue
+            _collect_errors(errors, validator, group, lambda message: message)
+
+        for payload_key, group in payload_groups.items():
+            group = [item for item in group if item[0] not in errors]
+            if not group:
+                continue
+            try:
+                validator = self.registry.payload_validator(*payload_key)
+            except SchemaValidationException:
+                _add_group_error(errors, group, 'payload schema not available: {}/{}/{}'.format(*payload_key))
+                continue
+            _collect_errors(errors, validator, group, lambda message: message.get('payload'))
+        return errors
+
+
+def _add_group_error(errors, group, error):
+    for index, _ in group:
+        errors[index] = [error]
+
+
+def _collect_errors(errors, validator, group, select):
+    for index, message in group:
+        found = [_format_error(error) for error in validator.iter_errors(select(message))]
+        if found:
+            errors[index] = found
+
+
+def _format_error(error) -> str:
+    if error.absolute_path:
+        path = '/'.join(str(part) for part in error.absolute_path)
+        return f'{path}: {error.message}'
+    return error.message
+
+
+_default_registry = SchemaRegistry(PATHS)
 
 
-def event_validator_factory() -> EventValidator:
-    return EventValidator(PATHS)
+def event_validator_factory(preload=False, policy: ValidationPolicy = None) -> EventValidator:
+    """Returns a validator sharing the compiled schemas of the default registry"""
+    if preload:
+        _default_registry.preload()
+    return EventValidator(PATHS, _default_registry, policy)
 
 
 class SchemaValidationException(Exception):
     def __init__(self, message="Invalid schema", details=None):
         super().__init__(message)
-        self.details = details or {}
\ No newline at end of file
+        self.details = details or {}
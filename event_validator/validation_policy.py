@@ -0,0 +1,113 @@
+"""Validation policies decide which messages get the full schema validation
+
+A policy is passed to the EventValidator. For every message the validator asks
+the policy whether the message has to be validated and reports back whether
+the validated messages passed, skipped messages are accepted without a check.
+"""
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict, namedtuple
+
+ValidationCounters = namedtuple('ValidationCounters', ['checked', 'skipped'])
+
+
+def schema_key(message: dict) -> tuple:
+    return (message.get('headerversion'), message.get('eventtype'),
+            message.get('eventsubtype'), message.get('payloadversion'))
+
+
+class ValidationPolicy(ABC):
+    """ Validation Policy
+    Base class of all policies, counts the checked and skipped messages
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+
+    def should_validate(self, message: dict) -> bool:
+        with self._lock:
+            validate = self._decide(message)
+            if validate:
+                self.checked += 1
+            else:
+                self.skipped += 1
+        return validate
+
+    def accepted(self, message: dict) -> None:
+        """Called by the validator for every message which passed the validation"""
+
+    def rejected(self, message: dict) -> None:
+        """Called by the validator for every message which failed the validation"""
+
+    def counters(self) -> ValidationCounters:
+        return ValidationCounters(self.checked, self.skipped)
+
+    @abstractmethod
+    def _decide(self, message: dict) -> bool:
+        """Returns True if the message has to be validated"""
+
+
+class AlwaysValidate(ValidationPolicy):
+    """Validates every message"""
+
+    def _decide(self, message: dict) -> bool:
+        return True
+
+
+class SampledValidation(ValidationPolicy):
+    """Validates the first messages of every schema, afterwards one in sample_every messages"""
+
+    def __init__(self, first_n: int = 100, sample_every: int = 100):
+        super().__init__()
+        if first_n < 0 or sample_every < 1:
+            raise ValueError('first_n must not be negative and sample_every must be at least 1')
+        self.first_n = first_n
+        self.sample_every = sample_every
+        self._seen = defaultdict(int)
+
+    def _decide(self, message: dict) -> bool:
+        key = schema_key(message)
+        count = self._seen[key]
+        self._seen[key] = count + 1
+        return count < self.first_n or (count - self.first_n + 1) % self.sample_every == 0
+
+
+class ShapeChangeValidation(ValidationPolicy):
+    """Validates only messages with a new structure
+
+    The fingerprint of a message consists of its schema key and the nested key
+    set together with the value types, the values themselves are not part of it.
+    A message whose fingerprint has already passed the validation is skipped, so
+    value constraints like enums are only checked for the first message of a shape.
+    A shape counts as seen once a message of it passed, messages of a shape under
+    validation in another thread are validated as well.
+    """
+
+    def __init__(self, max_shapes: int = 1024):
+        super().__init__()
+        self.max_shapes = max_shapes
+        self._shapes = set()
+
+    def _decide(self, message: dict) -> bool:
+        return self.fingerprint(message) not in self._shapes
+
+    def accepted(self, message: dict) -> None:
+        fingerprint = self.fingerprint(message)
+        with self._lock:
+            if len(self._shapes) >= self.max_shapes:
+                self._shapes.clear()
+            self._shapes.add(fingerprint)
+
+    @staticmethod
+    def fingerprint(message: dict) -> tuple:
+        """The shape itself rather than its hash, so distinct shapes never collide"""
+        return schema_key(message), _shape(message)
+
+
+def _shape(value):
+    if isinstance(value, dict):
+        return frozenset((key, _shape(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return 'list', frozenset(_shape(item) for item in value)
+    return type(value).__name__
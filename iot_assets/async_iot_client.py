@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Union
+
+import paho.mqtt.client as paho
+
+from .iot_client import IoTClient, has_pending_data
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncIoTClient:
+    """ Async IoT Client
+    Drives the paho client of an IoT Client from an asyncio event loop instead of
+    the network thread started by loop_start(). The socket is watched with
+    add_reader and add_writer and paho's housekeeping (keep alive, retries) runs
+    every second with loop_misc, so all callbacks of the IoT Client, including the
+    wrappers of the shadow callback handler, are called on the event loop thread
+    and many clients can share one loop.
+
+    paho opens the connection with blocking sockets, therefore the TCP and TLS
+    handshake of connect() runs in the default executor. The IoT Client has to be
+    completely set up (e.g. by its Sender) before it is passed in, because the
+    callbacks are wrapped here.
+    """
+    misc_interval = 1.0
+
+    def __init__(self, iot_client: IoTClient):
+        self.iot_client = iot_client
+        self.mqttc = iot_client.mqttc
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = None
+        self._fd = None
+        self._writing = False
+        self._misc_handle = None
+        self._connack: Optional[asyncio.Future] = None
+        self._disconnected: Optional[asyncio.Future] = None
+        self._publishes: Dict[int, asyncio.Future] = {}
+        self._subscriptions: Dict[int, asyncio.Future] = {}
+        iot_client.on_connect = self.on_connect_wrapper(iot_client.on_connect)
+        iot_client.on_disconnect = self.on_disconnect_wrapper(iot_client.on_disconnect)
+        iot_client.on_publish = self.on_publish_wrapper(iot_client.on_publish)
+        iot_client.on_subscribe = self.on_subscribe_wrapper(iot_client.on_subscribe)
+        iot_client.publish = self.write_wrapper(iot_client.publish)
+        iot_client.subscribe = self.write_wrapper(iot_client.subscribe)
+
+    @property
+    def is_attached(self) -> bool:
+        return self._fd is not None
+
+    async def connect(self, ssl_tunnel=False, timeout: float = 30.0) -> None:
+        """Connects and waits for the CONNACK, raises ConnectionError if the broker refused the connection"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        port = self.iot_client.configure(ssl_tunnel)
+        self._connack = self._loop.create_future()
+        self._disconnected = self._loop.create_future()
+        await self._loop.run_in_executor(None, self.mqttc.connect, self.iot_client.endpoint, port,
+                                         IoTClient.keep_alive)
+        logger.info('Connection to endpoint: %s', self.iot_client.endpoint)
+        self._attach()
+        await asyncio.wait_for(self._connack, timeout)
+
+    async def disconnect(self, timeout: float = 5.0) -> None:
+        if not self.is_attached:
+            return
+        self.iot_client.disconnect()
+        self._update_writer()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._disconnected), timeout)
+        except asyncio.TimeoutError:
+            logger.warning('no clean disconnect within %s seconds', timeout)
+        self._detach(ConnectionError('disconnected'))
+
+    async def publish(self, topic: str, message: Union[str, bytes, None], timeout: Optional[float] = None) -> int:
+        """Publishes with QoS 1 and waits for the PUBACK, returns the message id"""
+        info = self.iot_client.publish(topic, message)
+        if info.rc != paho.MQTT_ERR_SUCCESS:
+            raise ConnectionError(f'publishing to topic {topic} failed: {paho.error_string(info.rc)}')
+        future = self._publishes[info.mid] = self._loop.create_future()
+        await asyncio.wait_for(future, timeout)
+        return info.mid
+
+    async def subscribe(self, topic: Union[str, List[str]], timeout: Optional[float] = None) -> tuple:
+        """Subscribes to a topic or a list of topics with QoS 1 and waits for the SUBACK, returns the granted QoS"""
+        mid = self.iot_client.subscribe(topic)
+        future = self._subscriptions[mid] = self._loop.create_future()
+        return await asyncio.wait_for(future, timeout)
+
+    def _attach(self) -> None:
+        self._fd = self.mqttc.socket().fileno()
+        self._loop.add_reader(self._fd, self._on_readable)
+        self._update_writer()
+        self._misc_handle = self._loop.call_later(self.misc_interval, self._on_misc)
+
+    def _detach(self, error: Exception) -> None:
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            if self._writing:
+                self._loop.remove_writer(self._fd)
+            self._fd = None
+            self._writing = False
+        if self._misc_handle is not None:
+            self._misc_handle.cancel()
+            self._misc_handle = None
+        for futures in (self._publishes, self._subscriptions):
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(error)
+            futures.clear()
+        if self._connack is not None and not self._connack.done():
+            self._connack.set_exception(error)
+
+    def _on_readable(self) -> None:
+        # decrypted tls data buffered in the ssl object does not wake the loop, read it now
+        while self.mqttc.loop_read() == paho.MQTT_ERR_SUCCESS and has_pending_data(self.mqttc.socket()):
+            pass
+        self._update_writer()
+
+    def _on_writable(self) -> None:
+        self.mqttc.loop_write()
+        self._update_writer()
+
+    def _on_misc(self) -> None:
+        self.mqttc.loop_misc()
+        self._update_writer()
+        if self._fd is not None:
+            self._misc_handle = self._loop.call_later(self.misc_interval, self._on_misc)
+
+    def _update_writer(self) -> None:
+        """Watches the socket for writability as long as paho has outgoing packets"""
+        if self._loop is None:
+            return
+        if threading.get_ident() != self._loop_thread:
+            self._loop.call_soon_threadsafe(self._update_writer)
+            return
+        if self._fd is None:
+            return
+        wants_write = self.mqttc.want_write()
+        if wants_write and not self._writing:
+            self._loop.add_writer(self._fd, self._on_writable)
+        elif not wants_write and self._writing:
+            self._loop.remove_writer(self._fd)
+        self._writing = wants_write
+
+    def write_wrapper(self, func):
+        """A wrapper that lets the loop write packets queued by publish or subscribe"""
+
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            self._update_writer()
+            return result
+
+        return wrapper
+
+    def on_connect_wrapper(self, func):
+        """A wrapper that completes the pending connect"""
+
+        def wrapper(client, userdata, flags, result_code):
+            func(client, userdata, flags, result_code)
+            if self._connack is None or self._connack.done():
+                return
+            if result_code == 0:
+                self._connack.set_result(flags)
+            else:
+                self._connack.set_exception(ConnectionError(paho.connack_string(result_code)))
+
+        return wrapper
+
+    def on_disconnect_wrapper(self, func):
+        """A wrapper that stops watching the socket and fails all pending operations"""
+
+        def wrapper(client, userdata, result_code):
+            func(client, userdata, result_code)
+            if self._disconnected is not None and not self._disconnected.done():
+                self._disconnected.set_result(result_code)
+            self._detach(ConnectionError(f'connection lost: {paho.error_string(result_code)}'))
+
+        return wrapper
+
+    def on_publish_wrapper(self, func):
+        """A wrapper that completes the publish waiting for the PUBACK"""
+
+        def wrapper(client, userdata, mid):
+            func(client, userdata, mid)
+            future = self._publishes.pop(mid, None)
+            if future is not None and not future.done():
+                future.set_result(mid)
+
+        return wrapper
+
+    def on_subscribe_wrapper(self, func):
+        """A wrapper that completes the subscribe waiting for the SUBACK"""
+
+        def wrapper(client, userdata, mid, granted_qos):
+            func(client, userdata, mid, granted_qos)
+            future = self._subscriptions.pop(mid, None)
+            if future is not None and not future.done():
+                future.set_result(tuple(granted_qos))
+
+        return wrapper
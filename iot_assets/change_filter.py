@@ -0,0 +1,66 @@
+import logging
+import numbers
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChangeFilterDetails:
+    heartbeat_interval: float = 60.0  # seconds after which an unchanged signal is published anyway
+    deadbands: Dict[str, float] = field(default_factory=lambda: {})  # e.g. {'speed': 5}, changes up to 5 are ignored
+
+
+class StatusChangeFilter:
+    """ Status Change Filter
+    Keeps the payload of the last published signal per asset and event type.
+    A signal whose payload did not change since then is redundant, unless the
+    heartbeat interval has passed. Numeric fields with a deadband only count as
+    changed if they differ from the last published value by more than the deadband.
+    """
+    def __init__(self, options: ChangeFilterDetails, clock=time.monotonic):
+        self.heartbeat_interval = options.heartbeat_interval
+        self.deadbands = dict(options.deadbands)
+        self.clock = clock
+        self.suppressed = 0
+        self._published = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(message: dict) -> tuple:
+        return message.get('assetid'), message.get('eventtype'), message.get('eventsubtype')
+
+    def is_redundant(self, message: dict) -> bool:
+        with self._lock:
+            last = self._published.get(self.key(message))
+            if last is None:
+                return False
+            published_at, payload = last
+            if self.clock() - published_at >= self.heartbeat_interval:
+                return False
+            if not self._equivalent(payload, message.get('payload')):
+                return False
+            self.suppressed += 1
+            return True
+
+    def record(self, message: dict) -> None:
+        """Remembers the payload of a published signal"""
+        with self._lock:
+            self._published[self.key(message)] = (self.clock(), message.get('payload'))
+
+    def _equivalent(self, old, new, name=None) -> bool:
+        if isinstance(old, dict) and isinstance(new, dict):
+            return old.keys() == new.keys() and all(self._equivalent(old[key], new[key], key) for key in old)
+        if isinstance(old, list) and isinstance(new, list):
+            return len(old) == len(new) and all(self._equivalent(o, n, name) for o, n in zip(old, new))
+        deadband = self.deadbands.get(name)
+        if deadband is not None and _is_number(old) and _is_number(new):
+            return abs(new - old) <= deadband
+        return type(old) is type(new) and old == new
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
@@ -0,0 +1,112 @@
+"""Compression of telemetry payloads
+
+Compressed payloads start with a marker naming the algorithm. Json messages
+never start with a NUL byte, so a receiver can tell compressed payloads from
+plain json by the first byte and pick the decompressor from the marker. Preset
+dictionaries are supported for zlib only, the zlib stream carries the adler32
+checksum of the dictionary, so the receiver can verify it uses the right one.
+"""
+import re
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Optional, Union
+
+ZLIB = 'zlib'
+GZIP = 'gzip'
+MARKERS = {
+    ZLIB: b'\x00zlib',
+    GZIP: b'\x00gzip',
+}
+WBITS = {
+    ZLIB: zlib.MAX_WBITS,
+    GZIP: zlib.MAX_WBITS | 16,
+}
+MAX_DICTIONARY_SIZE = 32 * 1024  # the zlib window, a longer dictionary is cut off
+
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"\s*:?|[\[\]{},]+')
+
+
+@dataclass
+class CompressionDetails:
+    algorithm: str = ZLIB  # zlib or gzip
+    threshold: int = 512  # payloads smaller than this many bytes are published uncompressed
+    level: int = 6
+    dictionary: Optional[bytes] = None  # preset dictionary, see build_dictionary(), zlib only
+
+
+class PayloadCompressor:
+    """ Payload Compressor
+    Compresses payloads at or above the size threshold and prefixes them with the
+    marker of the algorithm. A payload which does not get smaller is kept as it is.
+    """
+    def __init__(self, options: CompressionDetails):
+        if options.algorithm not in MARKERS:
+            raise ValueError(f'unknown compression algorithm: {options.algorithm}')
+        if options.dictionary is not None and options.algorithm != ZLIB:
+            raise ValueError('a preset dictionary requires the zlib algorithm')
+        self.algorithm = options.algorithm
+        self.threshold = options.threshold
+        self.level = options.level
+        self.dictionary = options.dictionary
+        self.marker = MARKERS[options.algorithm]
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def compress(self, message: Union[str, bytes, None]) -> Union[str, bytes, None]:
+        if message is None:
+            return message
+        data = message.encode('utf-8') if isinstance(message, str) else message
+        if len(data) < self.threshold:
+            return message
+        if self.dictionary is None:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, WBITS[self.algorithm])
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, WBITS[self.algorithm], zdict=self.dictionary)
+        compressed = self.marker + compressor.compress(data) + compressor.flush()
+        if len(compressed) >= len(data):
+            return message
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed)
+        return compressed
+
+
+def is_compressed(payload: bytes) -> bool:
+    return payload[:1] == b'\x00'
+
+
+def decompress_payload(payload: bytes, dictionary: Optional[bytes] = None) -> bytes:
+    """Returns the original payload of a compressed one, plain payloads are returned unchanged"""
+    if not is_compressed(payload):
+        return payload
+    for algorithm, marker in MARKERS.items():
+        if payload.startswith(marker):
+            if dictionary is None:
+                decompressor = zlib.decompressobj(WBITS[algorithm])
+            else:
+                decompressor = zlib.decompressobj(WBITS[algorithm], zdict=dictionary)
+            return decompressor.decompress(payload[len(marker):]) + decompressor.flush()
+    raise ValueError('unknown compression marker')
+
+
+def build_dictionary(samples: Iterable[Union[str, bytes]], size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """Builds a preset dictionary from sample messages
+
+    The samples should be serialized messages like the ones published later, e.g.
+    GenericSignalV2 messages. The dictionary consists of the json keys and string
+    values found in more than one sample. zlib finds matches at the end of the
+    dictionary with the shortest distances, so the most frequent tokens go last.
+    """
+    counts = Counter()
+    for sample in samples:
+        data = sample.encode('utf-8') if isinstance(sample, str) else sample
+        counts.update(set(_TOKEN.findall(data)))
+    ranked = [token for token, count in counts.most_common() if count > 1]
+    dictionary = b''
+    for token in ranked:
+        if len(dictionary) + len(token) > size:
+            break
+        dictionary = token + dictionary
+    return dictionary
@@ -0,0 +1,285 @@
+import heapq
+import logging
+import selectors
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from .iot_client import IoTClient, has_pending_data
+from .reconnect_supervisor import ReconnectPolicy, ReconnectPolicyDetails
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ConnectionManagerDetails:
+    network_threads: int = 1
+    reconnect_workers: int = 2  # threads which reconnect lost clients, paho connects with blocking sockets
+    misc_interval: float = 1.0  # seconds between the keep alive and retry checks of all clients
+    reconnect: ReconnectPolicyDetails = field(default_factory=ReconnectPolicyDetails)  # unless set for the client
+
+
+class _Registration:
+    """The state of one IoT Client within the connection manager"""
+
+    def __init__(self, iot_client: IoTClient, network_loop: '_NetworkLoop', policy: ReconnectPolicy):
+        self.iot_client = iot_client
+        self.mqttc = iot_client.mqttc
+        self.network_loop = network_loop
+        self.lock = threading.RLock()  # serializes all paho calls of the client
+        self.port = None
+        self.fd = None
+        self.events = 0
+        self.closing = False
+        self.policy = policy
+
+
+class ConnectionManager:
+    """ Connection Manager
+    Drives the network IO of many IoT Clients from a small pool of selector
+    based network threads instead of one paho network thread per client.
+    The clients are spread evenly over the network threads. Clients with the
+    same certificates share one ssl context, which is created only once.
+
+    Every client is guarded by its own lock, publish and subscribe can still be
+    called from any thread. Lost connections are reconnected by a small worker
+    pool according to the reconnect policy of the client.
+    """
+    def __init__(self, options: Optional[ConnectionManagerDetails] = None):
+        self.options = options or ConnectionManagerDetails()
+        if self.options.network_threads < 1:
+            raise ValueError('network_threads must be at least 1')
+        self._ssl_contexts: Dict[tuple, ssl.SSLContext] = {}
+        self._registrations: Dict[int, _Registration] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.options.reconnect_workers,
+                                            thread_name_prefix='connection-manager-reconnect')
+        self._network_loops = [_NetworkLoop(self, index) for index in range(self.options.network_threads)]
+        for network_loop in self._network_loops:
+            network_loop.start()
+
+    @property
+    def clients(self) -> int:
+        return sum(len(network_loop.attached) for network_loop in self._network_loops)
+
+    def ssl_context(self, iot_client: IoTClient, ssl_tunnel=False) -> ssl.SSLContext:
+        """Returns the shared ssl context for the certificates of the client"""
+        key = (ssl_tunnel, iot_client.ca_server_path, iot_client.cert_path, iot_client.key_path)
+        with self._lock:
+            context = self._ssl_contexts.get(key)
+            if context is None:
+                if ssl_tunnel:
+                    context = iot_client.ssl_alpn()
+                else:
+                    context = ssl.create_default_context(cafile=iot_client.ca_server_path)
+                    context.load_cert_chain(certfile=iot_client.cert_path, keyfile=iot_client.key_path)
+                self._ssl_contexts[key] = context
+            return context
+
+    def register(self, iot_client: IoTClient, ssl_tunnel=False) -> None:
+        """Connects the client and hands its network IO to one of the network threads"""
+        ssl_context = self.ssl_context(iot_client, ssl_tunnel)
+        with self._lock:
+            registration = self._registrations.get(id(iot_client))
+            if registration is None:
+                network_loop = min(self._network_loops, key=lambda candidate: candidate.load)
+                policy = ReconnectPolicy(iot_client.reconnect_options or self.options.reconnect)
+                registration = _Registration(iot_client, network_loop, policy)
+                network_loop.load += 1
+                self._registrations[id(iot_client)] = registration
+                iot_client.reconnect_policy = policy
+                iot_client.on_connect = policy.on_connect_wrapper(iot_client.on_connect)
+                iot_client.publish = self.io_wrapper(registration, iot_client.publish)
+                iot_client.subscribe = self.io_wrapper(registration, iot_client.subscribe)
+                iot_client.disconnect = self.disconnect_wrapper(registration, iot_client.disconnect)
+                registration.port = iot_client.configure(ssl_tunnel, ssl_context)
+        registration.closing = False
+        with registration.lock:
+            iot_client.mqttc.connect(iot_client.endpoint, registration.port, keepalive=IoTClient.keep_alive)
+        logger.info('Connection to endpoint: %s', iot_client.endpoint)
+        logger.info('Connection via port: %s', registration.port)
+        registration.network_loop.touch(registration)
+
+    def stop(self) -> None:
+        """Stops the network threads, the clients should be disconnected before"""
+        for network_loop in self._network_loops:
+            network_loop.stop()
+        self._executor.shutdown(wait=False)
+
+    def io_wrapper(self, registration: _Registration, func):
+        """A wrapper that serializes the call with the network thread and lets it write the queued packets"""
+
+        def wrapper(*args, **kwargs):
+            with registration.lock:
+                result = func(*args, **kwargs)
+            registration.network_loop.touch(registration)
+            return result
+
+        return wrapper
+
+    def disconnect_wrapper(self, registration: _Registration, func):
+        """A wrapper that stops reconnecting a client which disconnects on purpose"""
+
+        def wrapper(*args, **kwargs):
+            registration.closing = True
+            with registration.lock:
+                result = func(*args, **kwargs)
+            registration.network_loop.touch(registration)
+            return result
+
+        return wrapper
+
+    def _reconnect(self, registration: _Registration) -> None:
+        if registration.closing:
+            return
+        try:
+            with registration.lock:
+                registration.mqttc.reconnect()
+        except (OSError, ssl.SSLError) as err:
+            logger.warning('reconnecting %s failed: %s', registration.iot_client.client_id, err)
+            registration.policy.attempt_failed()
+            registration.network_loop.schedule_reconnect(registration)
+            return
+        registration.network_loop.touch(registration)
+
+
+class _NetworkLoop:
+    """A network thread watching the sockets of its clients with a selector"""
+
+    def __init__(self, manager: ConnectionManager, index: int):
+        self.manager = manager
+        self.misc_interval = manager.options.misc_interval
+        self.load = 0
+        self.attached = set()
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+        self._lock = threading.Lock()
+        self._touched = set()
+        self._reconnects = []
+        self._sequence = 0
+        self._running = False
+        self._thread = threading.Thread(target=self._run, name=f'connection-manager-{index}', daemon=True)
+
+    def start(self) -> None:
+        self._running = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+        self._wakeup()
+        self._thread.join(5)
+        self._selector.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+    def touch(self, registration: _Registration) -> None:
+        """Lets the network thread check the socket and the outgoing packets of the client"""
+        with self._lock:
+            self._touched.add(registration)
+        if threading.current_thread() is not self._thread:
+            self._wakeup()
+
+    def schedule_reconnect(self, registration: _Registration) -> None:
+        delay = registration.policy.next_delay()
+        logger.info('reconnecting %s in %.2f seconds', registration.iot_client.client_id, delay)
+        with self._lock:
+            self._sequence += 1
+            heapq.heappush(self._reconnects, (time.monotonic() + delay, self._sequence, registration))
+        self._wakeup()
+
+    def _wakeup(self) -> None:
+        try:
+            self._wakeup_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self) -> None:
+        next_misc = time.monotonic() + self.misc_interval
+        while self._running:
+            with self._lock:
+                due = self._reconnects[0][0] if self._reconnects else next_misc
+            timeout = max(0.0, min(due, next_misc) - time.monotonic())
+            for key, events in self._selector.select(timeout):
+                if key.data is None:
+                    self._drain_wakeup()
+                else:
+                    self._handle_io(key.data, events)
+            self._handle_touched()
+            now = time.monotonic()
+            if now >= next_misc:
+                next_misc = now + self.misc_interval
+                for registration in list(self.attached):
+                    with registration.lock:
+                        registration.mqttc.loop_misc()
+                    self._update(registration)
+            self._handle_reconnects(now)
+
+    def _drain_wakeup(self) -> None:
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _handle_io(self, registration: _Registration, events: int) -> None:
+        with registration.lock:
+            if events & selectors.EVENT_READ:
+                # decrypted tls data buffered in the ssl object does not wake the selector, read it now
+                while registration.mqttc.loop_read() == 0 and has_pending_data(registration.mqttc.socket()):
+                    pass
+            if events & selectors.EVENT_WRITE and registration.mqttc.socket() is not None:
+                registration.mqttc.loop_write()
+        self._update(registration)
+
+    def _handle_touched(self) -> None:
+        with self._lock:
+            touched, self._touched = self._touched, set()
+        for registration in touched:
+            self._update(registration)
+
+    def _handle_reconnects(self, now: float) -> None:
+        with self._lock:
+            due = []
+            while self._reconnects and self._reconnects[0][0] <= now:
+                due.append(heapq.heappop(self._reconnects)[2])
+        for registration in due:
+            self.manager._executor.submit(self.manager._reconnect, registration)
+
+    def _update(self, registration: _Registration) -> None:
+        """Registers the current socket of the client with the events it is waiting for"""
+        with registration.lock:
+            sock = registration.mqttc.socket()
+            fd = sock.fileno() if sock is not None else None
+            wants_write = fd is not None and registration.mqttc.want_write()
+        if registration.fd is not None and registration.fd != fd:
+            self._selector.unregister(registration.fd)
+            registration.fd = None
+            self.attached.discard(registration)
+            if fd is None and not registration.closing:
+                logger.warning('connection of %s lost', registration.iot_client.client_id)
+                registration.policy.connection_lost()
+                self.schedule_reconnect(registration)
+        if fd is None:
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if wants_write else 0)
+        if registration.fd is None:
+            try:
+                previous = self._selector.get_key(fd).data
+            except KeyError:
+                previous = None
+            if previous is not None:
+                self._update(previous)  # the closed socket of another client had the same descriptor
+            registration.fd = fd
+            registration.events = events
+            self._selector.register(fd, events, registration)
+            self.attached.add(registration)
+        elif events != registration.events:
+            registration.events = events
+            self._selector.modify(fd, events, registration)
@@ -1,11 +1,23 @@
 from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
 
 import logging
 import paho.mqtt.client as paho
 import ssl
+import threading
+import time
+
+from metrics.registry import metrics_registry
+from .compression import CompressionDetails, PayloadCompressor
+from .reconnect_supervisor import ReconnectPolicyDetails, reconnect_supervisor_factory
 
 logger = logging.getLogger(__name__)
 
+publish_seconds = metrics_registry().histogram('iot_publish_seconds', 'Time to hand a message to the mqtt client')
+puback_seconds = metrics_registry().histogram('iot_puback_seconds', 'Time from publishing a message to its PUBACK')
+published_messages = metrics_registry().counter('iot_published_messages_total', 'Messages published')
+published_bytes = metrics_registry().counter('iot_published_bytes_total', 'Payload bytes published')
+
 
 @dataclass
 class IoTClientDetails:
@@ -15,6 +27,10 @@ class IoTClientDetails:
     device_private_key_path: str
     amazon_root_ca_path: str
     thing_name: str
+    compression: Optional[CompressionDetails] = None  # opt-in: compress large payloads of non shadow topics
+    clean_session: bool = True  # False resumes the persistent session of the broker after a reconnect
+    reconnect: Optional[ReconnectPolicyDetails] = None  # opt-in: reconnect with jittered backoff and circuit breaker
+    payload_log_sampling: int = 100  # every nth payload is logged at DEBUG level, 1 logs all of them
 
 
 class IoTClient:
@@ -22,9 +38,14 @@ class IoTClient:
     This class handles the connectivity to the iot core. The sender
     uses this class to connect to the IoT Core, receive updates and publish
     state changes and telemetry messages
+
+    Messages are logged with topic, size and mid at INFO level. Payloads are
+    only logged at DEBUG level for a sample of the messages, truncated to
+    payload_log_limit characters
     """
     iot_protocol_name = "x-amzn-mqtt-ca"
     keep_alive = 120
+    payload_log_limit = 1024
 
     def __init__(self, options: IoTClientDetails):
         self.endpoint = options.mqtt_endpoint
@@ -34,27 +55,61 @@ class IoTClient:
         self.key_path = options.device_private_key_path
         self.ca_server_path = options.amazon_root_ca_path
         self.thing_name = options.thing_name
-        self.mqttc = paho.Client(client_id=self.client_id)
+        self.mqttc = paho.Client(client_id=self.client_id, clean_session=options.clean_session)
         self.connflag = False  # unclear use
-        self.subscriptions_ledger = []
+        self.subscriptions_ledger: Dict[int, List[str]] = {}  # topics of every SUBSCRIBE without SUBACK by mid
+        self.ready_seconds = None  # time from the CONNACK until all subscriptions were acknowledged
+        self._connack_at = None
+        self.reconnect_options = options.reconnect
+        self.reconnect_policy = None
+        self.compressor = None
+        self.payload_log_sampling = max(1, options.payload_log_sampling)
+        self._payload_log_count = 0
+        self._ack_lock = threading.Lock()
+        self._publish_started: Dict[int, float] = {}  # start of every publish without PUBACK by mid
+        self._early_acks: Dict[int, float] = {}  # PUBACKs which arrived before publish returned
+        if options.compression is not None:
+            self.compressor = PayloadCompressor(options.compression)
+
+    def connect(self, ssl_tunnel=False, connection_manager=None):
+        """Setup the mqtt connection to use standard port
+
+        With a connection manager the network IO of the client is handled by the
+        threads of the manager, otherwise paho starts a network thread for the client.
+        With reconnect options the reconnects are left to the reconnect supervisor
+        """
+        if connection_manager is not None:
+            connection_manager.register(self, ssl_tunnel)
+            return
+        if self.reconnect_options is not None:
+            reconnect_supervisor_factory().supervise(self, self.reconnect_options)
+        port = self.configure(ssl_tunnel)
+        self.mqttc.connect(self.endpoint, port, keepalive=IoTClient.keep_alive)
+        logger.info('Connection to endpoint: %s', self.endpoint)
+        logger.info('Connection via port: %s', port)
+        self.mqttc.loop_start()  # starts a new thread to handle mqtt IO
+
+    def configure(self, ssl_tunnel=False, ssl_context: Optional[ssl.SSLContext] = None) -> int:
+        """Assigns the callbacks and the tls settings to the paho client, returns the port to connect to
 
-    def connect(self, ssl_tunnel=False):
-        """Setup the mqtt connection to use standard port"""
+        A given ssl context is used instead of creating a new one from the certificate files
+        """
         self.mqttc.enable_logger(logger)
         self.mqttc.on_connect = self.on_connect
         self.mqttc.on_message = self.on_message
         self.mqttc.on_disconnect = self.on_disconnect
         self.mqttc.on_subscribe = self.on_subscribe
-        if ssl_tunnel:
+        self.mqttc.on_publish = self.on_publish
+        if ssl_context is not None:
+            port = 443 if ssl_tunnel else self.standard_port
+            self.mqttc.tls_set_context(context=ssl_context)
+        elif ssl_tunnel:
             port = 443
             self.mqttc.tls_set_context(context=self.ssl_alpn())
         else:
             port = self.standard_port
             self.mqttc.tls_set(ca_certs=self.ca_server_path, certfile=self.cert_path, keyfile=self.key_path)
-        self.mqttc.connect(self.endpoint, port, keepalive=IoTClient.keep_alive)
-        logger.info('Connection to endpoint: %s' % self.endpoint)
-        logger.info('Connection via port: %s' % port)
-        self.mqttc.loop_start()  # starts a new thread to handle mqtt IO
+        return port
 
     def ssl_alpn(self):
         """Create the ssl context for the tls connection"""
@@ -74,39 +129,117 @@ class IoTClient:
         """Disconnects the mqtt iot_assets"""
         self.mqttc.disconnect()
 
-    def publish(self, topic, message):
-        """publishes a message via the mqtt iot_assets"""
-        logger.info('Publishing to topic: %s' % topic)
-        logger.info('Message: %s' % message)
-        self.mqttc.publish(topic, message, qos=1)
-
-    def subscribe(self, topic):
-        """subscribes to a mqtt topic"""
-        result, mid = self.mqttc.subscribe(topic, qos=1)
+    def publish(self, topic, message) -> paho.MQTTMessageInfo:
+        """publishes a message via the mqtt iot_assets
+
+        With compression enabled, large messages are compressed. Messages to the
+        reserved AWS topics starting with $ (e.g. the device shadow) are never compressed
+        """
+        if self.compressor is not None and not topic.startswith('$'):
+            message = self.compressor.compress(message)
+        start = time.perf_counter() if publish_seconds.enabled else None
+        message_info = self.mqttc.publish(topic, message, qos=1)
+        if start is not None:
+            self._record_publish(start, message_info.mid, message)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('Published %s bytes to topic: %s with mid %s', _size(message), topic, message_info.mid)
+            self.log_payload(message_info.mid, message)
+        return message_info
+
+    def subscribe(self, topic: Union[str, List[str]]) -> int:
+        """subscribes to a mqtt topic or a list of topics, returns the message id of the subscription
+
+        A list of topics is subscribed with a single SUBSCRIBE request, which is
+        acknowledged by a single SUBACK
+        """
+        if isinstance(topic, str):
+            topics = [topic]
+            result, mid = self.mqttc.subscribe(topic, qos=1)
+        else:
+            topics = list(topic)
+            result, mid = self.mqttc.subscribe([(name, 1) for name in topics])
         if result == 0:
-            self.subscriptions_ledger.append(mid)
+            self.subscriptions_ledger[mid] = topics
         else:
             raise Exception(f'Error subscribing to topic: {topic}')
-        logger.info(f'Subscribing to topic: {topic} with result {result} and mid {mid}')
+        logger.info('Subscribing to topic: %s with result %s and mid %s', topic, result, mid)
+        return mid
 
     def on_connect(self, client, userdata, flags, result_code):
-        """On connect callback handler"""
-        logger.info('Connected client: %s' % client)
-        logger.info('Result is: %i' % result_code)
+        """On connect callback handler
+
+        Subscriptions of an earlier connection which were never acknowledged are
+        forgotten, their SUBACKs will not arrive anymore
+        """
+        self.subscriptions_ledger.clear()
+        self._connack_at = time.monotonic()
+        logger.info('Connected client: %s', client)
+        logger.info('Result is: %i', result_code)
 
     def on_message(self, client, userdata, message):
-        logger.info(f'message received: {message}')
         """On message callback handler"""
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('Received %s bytes on topic: %s with mid %s', _size(message.payload), message.topic,
+                        message.mid)
+            self.log_payload(message.mid, message.payload)
 
     def on_disconnect(self, client, userdata, result_code):
         """disconnect callback handler"""
-        logger.info('Disconnecting client: %s' % client)
-        logger.info('Result is: %i' % result_code)
+        logger.info('Disconnecting client: %s', client)
+        logger.info('Result is: %i', result_code)
         self.connflag = False
+        self.subscriptions_ledger.clear()
+
+    def on_publish(self, client, userdata, mid):
+        """On publish callback handler, called when the broker acknowledged the message"""
+        if not puback_seconds.enabled:
+            return
+        acked_at = time.perf_counter()
+        with self._ack_lock:
+            start = self._publish_started.pop(mid, None)
+            if start is None:
+                self._early_acks[mid] = acked_at
+                return
+        puback_seconds.observe(acked_at - start)
+
+    def _record_publish(self, start, mid, message):
+        publish_seconds.observe(time.perf_counter() - start)
+        published_messages.inc()
+        published_bytes.inc(_size(message))
+        with self._ack_lock:
+            acked_at = self._early_acks.pop(mid, None)
+            if acked_at is None or acked_at < start:  # a PUBACK of an earlier message with the same mid
+                self._publish_started[mid] = start
+                return
+        puback_seconds.observe(acked_at - start)
 
     def on_subscribe(self, client, userdata, mid, granted_qos):
-        self.subscriptions_ledger.remove(mid)
+        topics = self.subscriptions_ledger.pop(mid, [])
+        for topic, qos in zip(topics, granted_qos):
+            if qos == 0x80:
+                logger.error('Subscription to topic %s was rejected', topic)
         self.connflag = self.are_subscriptions_complete()
+        if self.connflag and self._connack_at is not None:
+            self.ready_seconds = time.monotonic() - self._connack_at
+            self._connack_at = None
+
+    def log_payload(self, mid, payload):
+        """Logs the first and then every nth payload at DEBUG level"""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        self._payload_log_count += 1
+        if self._payload_log_count % self.payload_log_sampling == 1 or self.payload_log_sampling == 1:
+            logger.debug('Payload of mid %s: %.*s', mid, self.payload_log_limit, payload)
 
     def are_subscriptions_complete(self) -> bool:
         return len(self.subscriptions_ledger) == 0
+
+
+def has_pending_data(sock) -> bool:
+    """True if a tls socket holds decrypted data which select does not report as readable"""
+    pending = getattr(sock, 'pending', None)
+    return pending is not None and pending() > 0
+
+
+def _size(payload) -> int:
+    return len(payload) if payload is not None else 0
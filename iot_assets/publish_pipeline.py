@@ -0,0 +1,170 @@
+import logging
+import threading
+import weakref
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from metrics.registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+_instances = weakref.WeakSet()
+metrics_registry().gauge('iot_publish_queue_depth', 'Messages queued in the publish pipelines',
+                         lambda: sum(instance.queue_depth for instance in list(_instances)))
+metrics_registry().gauge('iot_publish_in_flight', 'Messages of the publish pipelines without PUBACK',
+                         lambda: sum(instance.in_flight for instance in list(_instances)))
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+BACKPRESSURE_MODES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+
+@dataclass
+class PublishPipelineDetails:
+    max_queue_size: int = 1000
+    backpressure: str = BLOCK  # block, drop-oldest or drop-newest when the queue is full
+    block_timeout: Optional[float] = None  # seconds a producer blocks at most, None waits forever
+
+
+class PublishPipeline:
+    """ Publish Pipeline
+    Decouples the producers of telemetry messages from the network. Producers
+    put messages into a bounded queue, a dedicated worker thread hands them to
+    the IoT Client and tracks every message id until the broker acknowledged
+    it with a PUBACK. The pipeline has to be created before the client connects,
+    because it wraps the on_publish and on_disconnect callbacks of the IoT Client.
+    """
+    def __init__(self, iot_client, options: PublishPipelineDetails):
+        if options.backpressure not in BACKPRESSURE_MODES:
+            raise ValueError(f'unknown backpressure mode: {options.backpressure}')
+        if options.max_queue_size < 1:
+            raise ValueError('max_queue_size must be at least 1')
+        self.iot_client = iot_client
+        self.max_queue_size = options.max_queue_size
+        self.backpressure = options.backpressure
+        self.block_timeout = options.block_timeout
+        self.dropped = 0
+        self.published = 0
+        self.acknowledged = 0
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._in_flight = set()
+        self._acknowledged_early = set()  # PUBACKs which arrived while the worker was publishing
+        self._publishing = False
+        self._ack_lock = threading.Lock()
+        self._worker = None
+        self._running = False
+        _instances.add(self)
+        self.iot_client.on_publish = self.on_publish_wrapper(self.iot_client.on_publish)
+        self.iot_client.on_disconnect = self.on_disconnect_wrapper(self.iot_client.on_disconnect)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of published messages without PUBACK"""
+        return len(self._in_flight)
+
+    def start(self) -> None:
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._worker = threading.Thread(target=self._run, name='publish-pipeline', daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops the worker after the queued messages have been handed to the IoT Client"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+
+    def submit(self, topic: str, message: Union[str, bytes]) -> bool:
+        """Queues a message, returns False if the message was dropped because of backpressure"""
+        with self._condition:
+            if len(self._queue) >= self.max_queue_size:
+                if self.backpressure == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.backpressure == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif not self._condition.wait_for(lambda: len(self._queue) < self.max_queue_size,
+                                                  self.block_timeout):
+                    self.dropped += 1
+                    logger.warning('publish queue full, message dropped after %s seconds', self.block_timeout)
+                    return False
+            self._queue.append((topic, message))
+            self._condition.notify_all()
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or not self._running)
+                if not self._queue:
+                    return
+                topic, message = self._queue.popleft()
+                self._condition.notify_all()
+            try:
+                self._publish(topic, message)
+            except Exception as err:
+                logger.error('publishing to topic %s failed: %s', topic, err)
+
+    def _publish(self, topic, message) -> None:
+        # paho holds its own locks while calling on_publish, so the ack lock
+        # must not be held during publish. A PUBACK can therefore arrive before
+        # the message id is known here, it is then kept as early acknowledgement.
+        # Only PUBACKs during the publish are kept and all are dropped afterwards,
+        # so acknowledgements of other messages never match a later message id
+        with self._ack_lock:
+            self._publishing = True
+        info = None
+        try:
+            info = self.iot_client.publish(topic, message)
+        finally:
+            mid = getattr(info, 'mid', None)
+            with self._ack_lock:
+                self._publishing = False
+                if mid in self._acknowledged_early:
+                    self.acknowledged += 1
+                elif mid is not None:
+                    self._in_flight.add(mid)
+                self._acknowledged_early.clear()
+        self.published += 1
+
+    def on_publish_wrapper(self, func):
+        """A wrapper that removes acknowledged messages from the in flight messages"""
+
+        def wrapper(client, userdata, mid):
+            func(client, userdata, mid)
+            with self._ack_lock:
+                if mid in self._in_flight:
+                    self._in_flight.discard(mid)
+                    self.acknowledged += 1
+                elif self._publishing:
+                    # possibly the message being published, or one published outside of the pipeline
+                    self._acknowledged_early.add(mid)
+
+        return wrapper
+
+    def on_disconnect_wrapper(self, func):
+        """A wrapper that forgets the in flight messages of a lost connection
+
+        Their PUBACKs will not arrive anymore, and message ids of later messages
+        must not match them after the message ids wrapped around
+        """
+
+        def wrapper(client, userdata, result_code):
+            func(client, userdata, result_code)
+            with self._ack_lock:
+                self._in_flight.clear()
+
+        return wrapper
@@ -0,0 +1,249 @@
+import heapq
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import namedtuple
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from metrics.registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+disconnects = metrics_registry().counter('iot_disconnects_total', 'Connections lost unexpectedly')
+reconnect_seconds = metrics_registry().histogram('iot_reconnect_seconds',
+                                                 'Time from losing a connection until the next one was accepted')
+failed_reconnects = metrics_registry().counter('iot_reconnect_failures_total', 'Failed connection attempts')
+opened_circuits = metrics_registry().counter('iot_circuit_opened_total', 'Circuits opened by failed attempts')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+ReconnectStats = namedtuple('ReconnectStats', ['disconnects', 'reconnects', 'failed_attempts', 'last_seconds',
+                                               'max_seconds', 'total_seconds'])
+
+
+@dataclass
+class ReconnectPolicyDetails:
+    base_delay: float = 1.0  # upper bound of the first delay, doubled with every failed attempt
+    max_delay: float = 120.0
+    failure_threshold: int = 8  # consecutive failed attempts which open the circuit
+    open_duration: float = 300.0  # seconds without attempts while the circuit is open
+
+
+class ReconnectPolicy:
+    """ Reconnect Policy
+    Exponential backoff with full jitter: the delay before an attempt is drawn
+    uniformly between zero and base_delay * 2 ** failed attempts, capped at
+    max_delay, so a fleet disconnected at the same moment does not reconnect at
+    the same moment. After failure_threshold failed attempts in a row the
+    circuit opens and no attempt is made for open_duration seconds, then a
+    single trial attempt either closes the circuit again or reopens it.
+
+    The policy also measures the time from the loss of a connection until the
+    broker accepted the next connection.
+    """
+    def __init__(self, options: Optional[ReconnectPolicyDetails] = None, random_func: Callable[[], float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.options = options or ReconnectPolicyDetails()
+        self._random = random_func or random.random
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.disconnects = 0
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.last_seconds = None
+        self.max_seconds = 0.0
+        self.total_seconds = 0.0
+        self._lost_at = None
+
+    def connection_lost(self) -> None:
+        with self._lock:
+            if self._lost_at is None:
+                self._lost_at = self._clock()
+                self.disconnects += 1
+                disconnects.inc()
+
+    def next_delay(self) -> float:
+        """Seconds to wait before the next attempt"""
+        with self._lock:
+            jitter = self._random() * min(self.options.max_delay, self.options.base_delay * 2 ** self.failures)
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+                return self.options.open_duration + jitter
+            return jitter
+
+    def attempt_failed(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.failed_attempts += 1
+            failed_reconnects.inc()
+            if self.state == HALF_OPEN or self.failures >= self.options.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning('circuit opened after %s failed connection attempts', self.failures)
+                    opened_circuits.inc()
+                self.state = OPEN
+
+    def connected(self) -> None:
+        """Called when the broker accepted the connection"""
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            if self._lost_at is None:
+                return
+            seconds = self._clock() - self._lost_at
+            self._lost_at = None
+            self.reconnects += 1
+            self.last_seconds = seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.total_seconds += seconds
+            reconnect_seconds.observe(seconds)
+
+    def stats(self) -> ReconnectStats:
+        return ReconnectStats(self.disconnects, self.reconnects, self.failed_attempts, self.last_seconds,
+                              self.max_seconds, self.total_seconds)
+
+    def on_connect_wrapper(self, func):
+        """A wrapper that reports accepted and refused connections to the policy"""
+
+        def wrapper(client, userdata, flags, result_code):
+            if result_code == 0:
+                self.connected()
+            else:
+                self.attempt_failed()
+            func(client, userdata, flags, result_code)
+
+        return wrapper
+
+
+class ReconnectSupervisor:
+    """ Reconnect Supervisor
+    Reconnects IoT Clients after an unexpected disconnect according to their
+    reconnect policy. Without supervision the network thread of paho reconnects
+    on its own with a fixed exponential delay. A supervised client stops its
+    network thread when the connection is lost, one supervisor thread waits for
+    the delay, reconnects the client and starts its network thread again.
+    A client which disconnects on purpose is not reconnected until it connects
+    again. One supervisor can serve all clients of a process.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._due = []
+        self._sequence = 0
+        self._thread = None
+        self._running = False
+        self._reconnect_lock = threading.Lock()  # serializes reconnects with deliberate disconnects
+        self._closing = weakref.WeakSet()  # clients which disconnected on purpose
+
+    def supervise(self, iot_client, options: Optional[ReconnectPolicyDetails] = None) -> ReconnectPolicy:
+        """Wraps the callbacks of the client, has to be called before the client connects"""
+        with self._reconnect_lock:
+            self._closing.discard(iot_client)
+        if iot_client.reconnect_policy is not None:
+            return iot_client.reconnect_policy
+        policy = iot_client.reconnect_policy = ReconnectPolicy(options)
+        iot_client.on_connect = policy.on_connect_wrapper(iot_client.on_connect)
+        iot_client.on_disconnect = self.on_disconnect_wrapper(iot_client, policy, iot_client.on_disconnect)
+        iot_client.disconnect = self.disconnect_wrapper(iot_client, iot_client.disconnect)
+        self.start()
+        return policy
+
+    def start(self) -> None:
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='reconnect-supervisor', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def schedule(self, iot_client, policy: ReconnectPolicy) -> None:
+        delay = policy.next_delay()
+        logger.info('reconnecting %s in %.2f seconds', iot_client.client_id, delay)
+        with self._condition:
+            self._sequence += 1
+            heapq.heappush(self._due, (time.monotonic() + delay, self._sequence, iot_client, policy))
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and (not self._due or self._due[0][0] > time.monotonic()):
+                    self._condition.wait(self._due[0][0] - time.monotonic() if self._due else None)
+                if not self._running:
+                    return
+                _, _, iot_client, policy = heapq.heappop(self._due)
+            self._reconnect(iot_client, policy)
+
+    def _reconnect(self, iot_client, policy: ReconnectPolicy) -> None:
+        mqttc = iot_client.mqttc
+        with self._reconnect_lock:
+            if iot_client in self._closing:
+                return
+            mqttc.loop_stop()  # joins the network thread, which ended after the disconnect
+            try:
+                mqttc.reconnect()
+            except Exception as err:  # the supervisor thread serves all clients and must not end
+                logger.warning('reconnecting %s failed: %s', iot_client.client_id, err)
+                policy.attempt_failed()
+                self.schedule(iot_client, policy)
+                return
+            mqttc.loop_start()
+
+    def cancel(self, iot_client) -> None:
+        """Drops the scheduled reconnects of the client"""
+        with self._condition:
+            self._due = [entry for entry in self._due if entry[2] is not iot_client]
+            heapq.heapify(self._due)
+            self._condition.notify_all()
+
+    def disconnect_wrapper(self, iot_client, func):
+        """A wrapper that stops reconnecting a client which disconnects on purpose"""
+
+        def wrapper(*args, **kwargs):
+            with self._reconnect_lock:
+                self._closing.add(iot_client)
+            self.cancel(iot_client)
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    def on_disconnect_wrapper(self, iot_client, policy: ReconnectPolicy, func):
+        """A wrapper that ends the network thread after an unexpected disconnect and schedules the reconnect"""
+
+        def wrapper(client, userdata, result_code):
+            func(client, userdata, result_code)
+            if result_code == 0:
+                return
+            closing = iot_client in self._closing
+            if not closing:
+                policy.connection_lost()
+            # called on the network thread, loop_stop only tells the thread to end after this callback
+            client.loop_stop()
+            if not closing:
+                self.schedule(iot_client, policy)
+
+        return wrapper
+
+
+_reconnect_supervisor = None
+
+
+def reconnect_supervisor_factory() -> ReconnectSupervisor:
+    """Returns the supervisor shared by all clients of the process"""
+    global _reconnect_supervisor
+    if _reconnect_supervisor is None:
+        _reconnect_supervisor = ReconnectSupervisor()
+    return _reconnect_supervisor
@@ -0,0 +1,217 @@
+import logging
+import os
+import struct
+import threading
+import zlib
+from typing import List, Optional, Tuple
+
+from metrics.registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+evicted_messages = metrics_registry().counter('iot_store_and_forward_evicted_total',
+                                              'Stored messages evicted by the size cap')
+
+FRAME_HEADER = struct.Struct('>II')  # payload length, crc32 of the payload
+SEGMENT_SUFFIX = '.seg'
+CURSOR_FILE_NAME = 'cursor'
+
+
+class SegmentLog:
+    """ Segment Log
+    A disk backed, append-only FIFO of messages. Messages are appended as
+    length and checksum prefixed frames to segment files which are written
+    sequentially. The read position is persisted in a cursor file once per
+    commit and fully consumed segments are deleted. Writes are flushed to disk every fsync_batch
+    appends. If the log grows beyond max_bytes the oldest segments are evicted.
+
+    A new segment is started whenever the log is opened, so a frame torn by a
+    crash can only be found at the end of an old segment, where it is skipped.
+    """
+    def __init__(self, directory: str, segment_size: int = 4 * 1024 * 1024, max_bytes: int = 256 * 1024 * 1024,
+                 fsync_batch: int = 100):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.fsync_batch = fsync_batch
+        self.evicted_messages = 0
+        self.backlog_messages = 0
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        os.makedirs(directory, exist_ok=True)
+        self._segments = self._list_segments()
+        self._sizes = {segment: os.path.getsize(self._path(segment)) for segment in self._segments}
+        self._cursor = self._load_cursor()
+        self.backlog_messages = sum(self._count_frames(segment, self._start_of(segment))
+                                    for segment in self._segments)
+        self._write_segment = (self._segments[-1] + 1) if self._segments else 0
+        self._segments.append(self._write_segment)
+        self._sizes[self._write_segment] = 0
+        self._writer = open(self._path(self._write_segment), 'ab')
+
+    @property
+    def backlog_bytes(self) -> int:
+        """Bytes on disk which have not been consumed yet"""
+        with self._lock:
+            total = sum(self._sizes.values())
+            return total - (self._cursor[1] if self._cursor[0] in self._sizes else 0)
+
+    def __len__(self) -> int:
+        return self.backlog_messages
+
+    def append(self, message: bytes) -> None:
+        frame = FRAME_HEADER.pack(len(message), zlib.crc32(message)) + message
+        with self._lock:
+            size = self._sizes[self._write_segment]
+            if size > 0 and size + len(frame) > self.segment_size:
+                self._roll()
+            self._writer.write(frame)
+            self._sizes[self._write_segment] += len(frame)
+            self.backlog_messages += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_batch:
+                self._sync()
+            self._evict()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._sync()
+
+    def read(self, max_messages: int) -> List[Tuple[Tuple[int, int], bytes]]:
+        """Returns up to max_messages from the read position without consuming them
+
+        Every message is returned together with the position behind it, which
+        has to be passed to commit() once the message was handled
+        """
+        with self._lock:
+            self._writer.flush()
+            messages = []
+            segment, offset = self._cursor
+            for candidate in self._segments:
+                if candidate < segment:
+                    continue
+                if candidate > segment:
+                    segment, offset = candidate, 0
+                with open(self._path(segment), 'rb') as reader:
+                    reader.seek(offset)
+                    while len(messages) < max_messages:
+                        message = _read_frame(reader)
+                        if message is None:
+                            break
+                        messages.append(((segment, reader.tell()), message))
+                if len(messages) >= max_messages:
+                    break
+            return messages
+
+    def commit(self, position: Tuple[int, int], count: int) -> None:
+        """Consumes the count messages up to the position returned by read()
+
+        Every commit writes and fsyncs the cursor file, so commit a whole batch at once
+        """
+        with self._lock:
+            if position < self._cursor:
+                return  # the messages were evicted in the meantime
+            self._cursor = position
+            self.backlog_messages = max(0, self.backlog_messages - count)
+            for segment in [s for s in self._segments if s < position[0]]:
+                self._delete(segment)
+            self._store_cursor()
+
+    @property
+    def closed(self) -> bool:
+        return self._writer.closed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer.closed:
+                return
+            self._sync()
+            self._writer.close()
+
+    def _roll(self) -> None:
+        self._sync()
+        self._writer.close()
+        self._write_segment += 1
+        self._segments.append(self._write_segment)
+        self._sizes[self._write_segment] = 0
+        self._writer = open(self._path(self._write_segment), 'ab')
+
+    def _sync(self) -> None:
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._unsynced = 0
+
+    def _evict(self) -> None:
+        total = sum(self._sizes.values())
+        while total > self.max_bytes and len(self._segments) > 1:
+            oldest = self._segments[0]
+            evicted = self._count_frames(oldest, self._start_of(oldest))
+            total -= self._sizes[oldest]
+            self._delete(oldest)
+            self.evicted_messages += evicted
+            evicted_messages.inc(evicted)
+            self.backlog_messages -= evicted
+            if self._cursor[0] <= oldest:
+                self._cursor = (self._segments[0], 0)
+                self._store_cursor()
+            logger.warning('segment log exceeds %s bytes, %s messages evicted', self.max_bytes, evicted)
+
+    def _start_of(self, segment: int) -> int:
+        if segment < self._cursor[0]:
+            return self._sizes[segment]
+        return self._cursor[1] if segment == self._cursor[0] else 0
+
+    def _count_frames(self, segment: int, offset: int) -> int:
+        count = 0
+        with open(self._path(segment), 'rb') as reader:
+            reader.seek(offset)
+            while _read_frame(reader) is not None:
+                count += 1
+        return count
+
+    def _delete(self, segment: int) -> None:
+        self._segments.remove(segment)
+        del self._sizes[segment]
+        try:
+            os.remove(self._path(segment))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f'{segment:020d}{SEGMENT_SUFFIX}')
+
+    def _list_segments(self) -> List[int]:
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE_NAME)) as cursor_file:
+                segment, offset = (int(value) for value in cursor_file.read().split())
+        except (FileNotFoundError, ValueError):
+            return (self._segments[0], 0) if self._segments else (0, 0)
+        if self._segments and segment < self._segments[0]:
+            return self._segments[0], 0
+        return segment, offset
+
+    def _store_cursor(self) -> None:
+        """Replaces the cursor file atomically, a crash leaves the previous cursor"""
+        path = os.path.join(self.directory, CURSOR_FILE_NAME)
+        with open(f'{path}.tmp', 'w') as cursor_file:
+            cursor_file.write(f'{self._cursor[0]} {self._cursor[1]}')
+            cursor_file.flush()
+            os.fsync(cursor_file.fileno())
+        os.replace(f'{path}.tmp', path)
+
+
+def _read_frame(reader) -> Optional[bytes]:
+    """Reads the next frame, returns None at the end of the segment or at a torn frame"""
+    header = reader.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    length, checksum = FRAME_HEADER.unpack(header)
+    message = reader.read(length)
+    if len(message) < length or zlib.crc32(message) != checksum:
+        logger.warning('skipping torn frame in segment log')
+        return None
+    return message
@@ -1,10 +1,18 @@
 from dataclasses import dataclass, field
 
+import json
 import logging
-from typing import Dict
+import paho.mqtt.client as paho
+import threading
+from typing import Dict, Optional, Union
 
+from .change_filter import ChangeFilterDetails, StatusChangeFilter
 from .iot_client import IoTClient, IoTClientDetails
-from .shadow_callback_handler import ShadowCallbackHandler
+from .publish_pipeline import PublishPipeline, PublishPipelineDetails
+from .shadow_callback_handler import ShadowCallbackHandler, ShadowDetails
+from .shadow_state import StateSnapshot
+from .store_and_forward import StoreAndForward, StoreAndForwardDetails
+from .telemetry_batcher import TelemetryBatcher, TelemetryBatcherDetails
 
 logger = logging.getLogger(__name__)
 
@@ -19,12 +27,20 @@ class SenderDetails:
     client_id: str
     telemetry_topic: str
     state: Dict = field(default_factory=lambda: {})
+    change_filter: Optional[ChangeFilterDetails] = None  # opt-in: suppress unchanged signals
+    publish_pipeline: Optional[PublishPipelineDetails] = None  # opt-in: publish from a worker thread
+    store_and_forward: Optional[StoreAndForwardDetails] = None  # opt-in: buffer telemetry on disk while offline
+    batching: Optional[TelemetryBatcherDetails] = None  # opt-in: publish telemetry in json array batches
+    shadow: Optional[ShadowDetails] = None  # e.g. coalesce reported state updates
 
 
 class Sender:
     """ Sender
     This class handles the connectivity to the IoT Client and the ShadowCallbackHandler
     It represents your IoT gateway
+
+    The state is an immutable snapshot, which is replaced as a whole when the
+    state changes, so publishing telemetry reads it without a lock
     """
     def __init__(self, sender_options: SenderDetails, iot_client_options: IoTClientDetails):
         self.iot_client = IoTClient(iot_client_options)
@@ -35,27 +51,138 @@ class Sender:
         self.sendername = sender_options.sendername
         self.sendersoftwareversion = sender_options.sendersoftwareversion
         self.telemetry_topic = sender_options.telemetry_topic
-        self.state = sender_options.state
-        self.shadow_callback_handler = ShadowCallbackHandler(self.iot_client, self)
+        self._state_lock = threading.Lock()
+        self._state_snapshot = StateSnapshot(sender_options.state)
+        self.change_filter = None
+        if sender_options.change_filter is not None:
+            self.change_filter = StatusChangeFilter(sender_options.change_filter)
+        self.publish_pipeline = None
+        if sender_options.publish_pipeline is not None:
+            self.publish_pipeline = PublishPipeline(self.iot_client, sender_options.publish_pipeline)
+        self.batcher = None
+        if sender_options.batching is not None:
+            self.batcher = TelemetryBatcher(self._send, sender_options.batching)
+        self.store_and_forward = None
+        if sender_options.store_and_forward is not None:
+            self.store_and_forward = StoreAndForward(sender_options.store_and_forward, self._forward,
+                                                     self._is_ready_to_publish)
+        self.shadow_callback_handler = ShadowCallbackHandler(self.iot_client, self, options=sender_options.shadow)
+        if self.store_and_forward is not None:
+            self.iot_client.on_connect = self.on_ready_wrapper(self.iot_client.on_connect)
+            self.iot_client.on_subscribe = self.on_ready_wrapper(self.iot_client.on_subscribe)
+
+    def connect(self, ssl_tunnel=False, connection_manager=None):
+        """Setup the mqtt connection to use standard port
+
+        Senders of one gateway can share the network threads of a connection manager
+        """
+        self.iot_client.connect(ssl_tunnel, connection_manager)
+        if self.publish_pipeline is not None:
+            self.publish_pipeline.start()
+        if self.batcher is not None:
+            self.batcher.start()
+        if self.store_and_forward is not None:
+            self.store_and_forward.start()
 
-    def connect(self, ssl_tunnel=False):
-        """Setup the mqtt connection to use standard port"""
-        self.iot_client.connect(ssl_tunnel)
+    def publish_telemetry(self, message: Union[str, bytes]):
+        """publish message to dedicated telemetry topic
 
-    def publish_telemetry(self, message: str):
-        """publish message to dedicated telemetry topic"""
+        With store and forward enabled, the message is stored on disk while the
+        sender is not connected or stored messages are still pending
+        """
+        if self.store_and_forward is not None and self.store_and_forward.store(message, self.iot_client.connflag):
+            return
         if self.iot_client.connflag:
-            if self.state.get('sendTelemetryData'):
-                self.iot_client.publish(f'{self.telemetry_topic}/{self.org_id}/{self.client_id}', message)
+            snapshot = self._state_snapshot
+            if snapshot.telemetry_enabled:
+                if self.change_filter is not None and self._is_unchanged(message):
+                    return
+                self._publish(message)
             else:
-                logger.warning(f'state object sendTelemetryData is: {self.state.get("sendTelemetryData")}')
+                logger.warning('state object sendTelemetryData is: %s', snapshot.state.get('sendTelemetryData'))
         else:
             logger.warning("sender not connected")
 
-    def disconnect(self):
-        """Disconnects the mqtt iot_assets"""
+    def _publish(self, message: Union[str, bytes]):
+        if self.batcher is not None:
+            self.batcher.add(message)
+        else:
+            self._send(message)
+
+    def _send(self, message: Union[str, bytes]):
+        topic = f'{self.telemetry_topic}/{self.org_id}/{self.client_id}'
+        if self.publish_pipeline is not None:
+            self.publish_pipeline.submit(topic, message)
+        else:
+            self.iot_client.publish(topic, message)
+
+    def _forward(self, message: bytes) -> paho.MQTTMessageInfo:
+        """Publishes a stored message directly with the IoT Client, so its PUBACK can be awaited"""
+        return self.iot_client.publish(f'{self.telemetry_topic}/{self.org_id}/{self.client_id}', message)
+
+    def _is_ready_to_publish(self) -> bool:
+        return bool(self.iot_client.connflag and self._state_snapshot.telemetry_enabled)
+
+    def _is_unchanged(self, message: Union[str, bytes]) -> bool:
+        """Checks the message against the last published one of the same asset
+
+        Messages which are no json object are always treated as changed
+        """
+        try:
+            parsed = json.loads(message)
+        except ValueError:
+            return False
+        if not isinstance(parsed, dict):
+            return False
+        if self.change_filter.is_redundant(parsed):
+            logger.debug('unchanged signal of asset %s suppressed', parsed.get('assetid'))
+            return True
+        self.change_filter.record(parsed)
+        return False
+
+    def on_ready_wrapper(self, func):
+        """A wrapper that lets store and forward drain as soon as the client is ready to publish again"""
+
+        def wrapper(client, userdata, *args):
+            func(client, userdata, *args)
+            if self.iot_client.connflag:
+                self.store_and_forward.wakeup()
+
+        return wrapper
+
+    def disconnect(self, timeout=None):
+        """Disconnects the mqtt iot_assets
+
+        Pending batches, reported state changes and queued messages of the publish pipeline are handed
+        to the client first, timeout limits the wait for them in seconds
+        """
+        if self.store_and_forward is not None:
+            self.store_and_forward.stop(timeout)
+        if self.batcher is not None:
+            self.batcher.stop(timeout)
+        self.shadow_callback_handler.flush_reported_state()
+        if self.publish_pipeline is not None:
+            self.publish_pipeline.stop(timeout)
         self.iot_client.disconnect()
 
+    @property
+    def state(self):
+        """The current state, a FrozenDict which does not change"""
+        return self._state_snapshot.state
+
+    @state.setter
+    def state(self, new_state):
+        with self._state_lock:
+            self._state_snapshot = StateSnapshot(new_state, self._state_snapshot.version + 1)
+
+    @property
+    def state_snapshot(self) -> StateSnapshot:
+        return self._state_snapshot
+
+    def changed_since(self, version: int) -> bool:
+        """Checks whether the state changed after the snapshot with the given version"""
+        return self._state_snapshot.version != version
+
     def get_state(self):
         """The internal state of the device.
 
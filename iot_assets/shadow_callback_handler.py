@@ -3,14 +3,35 @@ from __future__ import annotations
 import json
 
 import logging
-from typing import TYPE_CHECKING
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
 
 if TYPE_CHECKING:
     from .sender import Sender  # cyclic import problem
+from metrics.registry import metrics_registry
 from .iot_client import IoTClient
+from .shadow_state import merge_state, state_changes
+from .topic_router import TopicRouter
 
 logger = logging.getLogger(__name__)
 
+shadow_get_seconds = metrics_registry().histogram('iot_shadow_get_seconds',
+                                                  'Time from a shadow get request to its response')
+shadow_update_seconds = metrics_registry().histogram('iot_shadow_update_seconds',
+                                                     'Time from a reported state update to update/accepted')
+stale_shadow_documents = metrics_registry().counter('iot_shadow_stale_documents_total',
+                                                    'Shadow documents dropped as out of order')
+
+
+@dataclass
+class ShadowDetails:
+    report_window_ms: float = 0.0  # state changes within this window are reported with one update, 0 reports each
+    state_file: Optional[str] = None  # e.g. certificate_store/shadow_state.json, enables a warm start
+
 
 class ShadowCallbackHandler:
     """
@@ -20,11 +41,51 @@ class ShadowCallbackHandler:
     Whenever a message is received on a relevant topic for the device,
     the devices state is updated. Each update to the state of the device
     is published to the iot core via the iot iot_assets
+
+    The shadow topics of the thing are routed to their callbacks by a routing
+    table built once. Handlers of several things can share one router.
+
+    Desired state changes are merged into the state key by key and only the
+    changed keys are reported back. Updates with a shadow version older than
+    the last one applied arrived out of order and are dropped.
+
+    With a report window, the state changes within the window are coalesced
+    into one update document. No update is published when the state equals
+    the reported state once the window has passed.
+
+    With a state file, the state and the shadow version are stored whenever a
+    shadow document was applied and are loaded when the handler is created.
+    A restarting gateway publishes telemetry under the stored state as soon
+    as it is connected and reconciles it when get/accepted arrives.
     """
 
-    def __init__(self, iot_client: IoTClient, sender: Sender):
+    def __init__(self, iot_client: IoTClient, sender: Sender, router: Optional[TopicRouter] = None,
+                 options: Optional[ShadowDetails] = None):
         self.iot_client = iot_client
         self.sender = sender
+        self.options = options or ShadowDetails()
+        self.suppressed_reports = 0
+        self._report_lock = threading.RLock()
+        self._report_timer = None
+        self._get_requested_at = None
+        self._updates_requested_at = deque()
+        self.shadow_topics_subscribed = False
+        self.shadow_version = None  # version of the last shadow document applied
+        self.reported_state = None  # the reported state of the shadow as published and acknowledged
+        self.shadow_topic_prefix = f"$aws/things/{self.get_thing_name()}/shadow/"
+        self.shadow_routes = {
+            f"{self.shadow_topic_prefix}update/accepted": self.on_desired_stage_change,
+            f"{self.shadow_topic_prefix}update/delta": self.on_shadow_delta,
+            f"{self.shadow_topic_prefix}update/documents": self.on_shadow_documents,
+            f"{self.shadow_topic_prefix}get/accepted": self.on_shadow_get_accepted,
+            f"{self.shadow_topic_prefix}get/rejected": self.on_shadow_rejected,
+        }
+        self.router = router if router is not None else TopicRouter()
+        for topic, callback in self.shadow_routes.items():
+            self.router.add(topic, callback)
+        self._persisted = None
+        if self.options.state_file:
+            self.load_state()
         self.sender.set_state = self.set_state_wrapper(self.sender.set_state)
         self.iot_client.on_connect = self.on_connect_wrapper(
             self.iot_client.on_connect)
@@ -39,19 +100,31 @@ class ShadowCallbackHandler:
 
         def wrapper(new_state):
             logger.info('set_state wrapper function invoked')
+            with self._report_lock:
+                if self.reported_state is None:
+                    self.reported_state = self.sender.get_state()  # immutable, no copy needed
             func(new_state)
-            self.publish_new_state(self.sender.get_state())
+            self.schedule_report()
 
         return wrapper
 
     def on_connect_wrapper(self, func):
-        """A wrapper that subscribes to the state update topics on connect"""
+        """A wrapper that subscribes to the state update topics on connect
+
+        If the broker resumed the persistent session (clean_session=False) in which
+        the topics were subscribed, the subscriptions still exist and are skipped
+        """
         logger.info('on_connect_wrapper invoked')
 
         def wrapper(client, userdata, flags, result_code):
             func(client, userdata, flags, result_code)
             if result_code == 0:
-                self.subscribe_to_device_shadow_topics()
+                if self.shadow_topics_subscribed and flags and flags.get('session present'):
+                    logger.info('persistent session resumed, shadow topics are still subscribed')
+                    self.iot_client.connflag = True
+                    self.request_desired_state()
+                else:
+                    self.subscribe_to_device_shadow_topics()
 
         return wrapper
 
@@ -61,6 +134,7 @@ class ShadowCallbackHandler:
         def wrapper(client, userdata, mid, granted_qos):
             func(client, userdata, mid, granted_qos)
             if self.iot_client.connflag:
+                self.shadow_topics_subscribed = True
                 self.request_desired_state()
         return wrapper
 
@@ -79,40 +153,64 @@ class ShadowCallbackHandler:
         It publishes the a message to the relevant topic.
         """
         logger.info('request_desired_state invoked')
+        if shadow_get_seconds.enabled:
+            self._get_requested_at = time.perf_counter()
         self.iot_client.publish(
-            f"$aws/things/{self.get_thing_name()}/shadow/get",
+            f"{self.shadow_topic_prefix}get",
             None)
 
     def subscribe_to_device_shadow_topics(self):
         """ This function subscribes to all releveant shadow update topics
 
         It will receive updates on these topics regarding desired
-        state changes
+        state changes. All topics are subscribed with one SUBSCRIBE request
         """
 
-        shadow_update_topics = [
-            f"$aws/things/{self.get_thing_name()}/shadow/update/accepted",
-            f"$aws/things/{self.get_thing_name()}/shadow/update/delta",
-            f"$aws/things/{self.get_thing_name()}/shadow/update/documents",
-            f"$aws/things/{self.get_thing_name()}/shadow/get/accepted",
-            f"$aws/things/{self.get_thing_name()}/shadow/get/rejected"
-        ]
-
-        for topic in shadow_update_topics:
-            self.iot_client.subscribe(topic)
+        self.iot_client.subscribe(list(self.shadow_routes))
 
     def get_thing_name(self):
         """ proxy to the devices get_thing_name function """
         return self.sender.client_id
 
+    def schedule_report(self):
+        """Reports the state changes now or at the end of the report window"""
+        if self.options.report_window_ms <= 0:
+            self.flush_reported_state()
+            return
+        with self._report_lock:
+            if self._report_timer is not None:
+                return
+            self._report_timer = threading.Timer(self.options.report_window_ms / 1000.0, self.flush_reported_state)
+            self._report_timer.daemon = True
+            self._report_timer.start()
+
+    def flush_reported_state(self):
+        """Publishes the keys of the state which differ from the reported state"""
+        with self._report_lock:
+            if self._report_timer is not None:
+                self._report_timer.cancel()
+                self._report_timer = None
+            if self.reported_state is None:
+                return
+            state = self.sender.get_state()
+            changes = state_changes(self.reported_state, state)
+            if not changes:
+                self.suppressed_reports += 1
+                logger.debug('state equals the reported state, no update published')
+                return
+            self.reported_state = state
+            self.publish_new_state(changes)
+
     def publish_new_state(self, new_state):
         """ this method publishes the new state to the relevant topic"""
-        topic = f"$aws/things/{self.get_thing_name()}/shadow/update"
+        topic = f"{self.shadow_topic_prefix}update"
         update_document = {
             "state": {
                 "reported": new_state,
             }
         }
+        if shadow_update_seconds.enabled:
+            self._updates_requested_at.append(time.perf_counter())
         self.iot_client.publish(topic, json.dumps(update_document))
 
     def on_message(self, client, userdata, msg):
@@ -120,7 +218,7 @@ class ShadowCallbackHandler:
 
         It calls the route function get the matching callback for the message
         """
-        logger.info(f'on message received: {msg}')
+        logger.debug('routing message on topic %s', msg.topic)
 
         callback = self.route(msg)
         if callback is not None:
@@ -130,24 +228,137 @@ class ShadowCallbackHandler:
         """Filter and update of the device state
 
         This function checks the contents of the message for a new desired
-        state and updates the devices state with the new desired state.
-        It only supports full state updates, not delta updates
+        state and merges it into the devices state. Keys set to None are
+        removed from the state. An acknowledged reported state is recorded
         """
 
         shadow_update_doc = json.loads(shadow_update_json)
-        if "desired" in shadow_update_doc.get('state'):
-            self.sender.set_state(
-                shadow_update_doc.get("state").get("desired")
-            )
+        if self.is_stale(shadow_update_doc):
+            return
+        state = shadow_update_doc.get('state') or {}
+        reported = state.get('reported')
+        if reported:
+            if self._updates_requested_at:
+                shadow_update_seconds.observe(time.perf_counter() - self._updates_requested_at.popleft())
+            with self._report_lock:
+                self.reported_state = merge_state(self.reported_state or {}, reported)
+        desired = state.get('desired')
+        if desired:
+            self.apply_desired_state(desired)
+        self.persist_state()
+
+    def on_shadow_get_accepted(self, shadow_document_json):
+        """Reconciles the device state with the current shadow document
+
+        The desired state is merged into the devices state and the keys which
+        differ from the reported state of the shadow are reported
+        """
+        self._observe_get_response()
+        shadow_document = json.loads(shadow_document_json)
+        version = shadow_document.get('version')
+        if isinstance(version, int):
+            self.shadow_version = version  # the current document, even if the shadow was recreated
+        state = shadow_document.get('state') or {}
+        with self._report_lock:
+            self.reported_state = state.get('reported') or {}
+        self.sender.set_state(merge_state(self.sender.get_state(), state.get('desired') or {}))
+        self.persist_state()
+
+    def on_shadow_delta(self, shadow_delta_json):
+        """Merges the difference between the desired and the reported state into the devices state"""
+        shadow_delta_doc = json.loads(shadow_delta_json)
+        if self.is_stale(shadow_delta_doc):
+            return
+        delta = shadow_delta_doc.get('state')
+        if delta:
+            self.apply_desired_state(delta)
+        self.persist_state()
+
+    def apply_desired_state(self, changes):
+        state = self.sender.get_state()
+        new_state = merge_state(state, changes)
+        if state_changes(state, new_state):
+            self.sender.set_state(new_state)
+
+    def is_stale(self, shadow_document) -> bool:
+        """Checks the version of the document against the last one applied
+
+        The shadow service publishes update/accepted and update/delta with the
+        same version, the second of them is dropped as well. Documents without
+        a version are never stale
+        """
+        version = shadow_document.get('version')
+        if not isinstance(version, int):
+            return False
+        if self.shadow_version is not None and version <= self.shadow_version:
+            stale_shadow_documents.inc()
+            logger.info('dropped shadow document version %s, version %s was applied already',
+                        version, self.shadow_version)
+            return True
+        self.shadow_version = version
+        return False
+
+    def load_state(self):
+        """Restores the state and the shadow version stored by persist_state"""
+        path = self.options.state_file
+        try:
+            with open(path) as state_file:
+                document = json.load(state_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as err:
+            logger.warning('could not load the shadow state from %s: %s', path, err)
+            return
+        state = document.get('state') if isinstance(document, dict) else None
+        if not isinstance(state, dict):
+            logger.warning('ignored the shadow state in %s without a state object', path)
+            return
+        self.sender.state = state
+        version = document.get('version')
+        if isinstance(version, int):
+            self.shadow_version = version
+        self._persisted = (self.sender.state_snapshot.version, self.shadow_version)
+        logger.info('loaded the shadow state version %s from %s', version, path)
+
+    def persist_state(self):
+        """Stores the state and the shadow version if either changed since they were stored
+
+        The file is replaced atomically, a crash leaves the previous state
+        """
+        path = self.options.state_file
+        if not path:
+            return
+        snapshot = self.sender.state_snapshot
+        persisted = (snapshot.version, self.shadow_version)
+        if persisted == self._persisted:
+            return
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(f'{path}.tmp', 'w') as state_file:
+                json.dump({'version': self.shadow_version, 'state': snapshot.state}, state_file)
+                state_file.flush()
+                os.fsync(state_file.fileno())
+            os.replace(f'{path}.tmp', path)
+        except OSError as err:
+            logger.warning('could not store the shadow state in %s: %s', path, err)
+            return
+        self._persisted = persisted
+
+    def on_shadow_documents(self, shadow_documents_json):
+        logger.debug('shadow documents received: %s', shadow_documents_json)
+
+    def on_shadow_rejected(self, shadow_error_json):
+        """The shadow service rejected a request, e.g. the shadow of the thing does not exist yet"""
+        logger.warning('shadow request rejected: %s', shadow_error_json)
+        self._observe_get_response()
+
+    def _observe_get_response(self):
+        requested_at, self._get_requested_at = self._get_requested_at, None
+        if requested_at is not None:
+            shadow_get_seconds.observe(time.perf_counter() - requested_at)
 
     def route(self, msg):
-        """Filters the message for shadow update topic messages"""
-
-        shadow_update_topics = [
-            f"$aws/things/{self.get_thing_name()}/shadow/get/accepted",
-            f"$aws/things/{self.get_thing_name()}/shadow/update/accepted"
-        ]
-        if msg.topic in shadow_update_topics:
-            return self.on_desired_stage_change
-
-        return None
+        """Returns the callback for the topic of the message or None"""
+        return self.router.route(msg.topic)
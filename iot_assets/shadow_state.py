@@ -0,0 +1,102 @@
+from typing import Any, Dict
+
+
+class FrozenDict(dict):
+    """A dict which can not be changed after it was created
+
+    It is still a dict, so it can be serialized with json and compared with
+    other dicts. Copy it with dict(frozen) to change it
+    """
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('FrozenDict can not be changed, copy it with dict()')
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(value: Any) -> Any:
+    """Returns an immutable copy of a json value, objects become FrozenDicts and arrays tuples"""
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class StateSnapshot:
+    """ State Snapshot
+    An immutable state of the sender with a version, which is incremented by
+    every change. A changed state is a new snapshot which replaces the previous
+    one (copy on write), so readers never need a lock and a snapshot they hold
+    never changes. Whether telemetry is enabled is evaluated once per snapshot.
+    """
+    __slots__ = ('state', 'version', 'telemetry_enabled')
+
+    def __init__(self, state: Dict, version: int = 0):
+        self.state = freeze(state)
+        self.version = version
+        self.telemetry_enabled = bool(self.state.get('sendTelemetryData'))
+
+
+def merge_state(state: Dict, changes: Dict) -> Dict:
+    """Returns a copy of the state with the changes merged into it
+
+    Nested objects are merged key by key. As in the shadow service, a key
+    set to None is removed from the state.
+    """
+    merged = dict(state)
+    for key, value in changes.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict):
+            current = merged.get(key)
+            merged[key] = merge_state(current if isinstance(current, dict) else {}, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def state_changes(old: Dict, new: Dict) -> Dict:
+    """Returns the part of the new state which differs from the old one
+
+    Removed keys are set to None, so merging the changes into the old state
+    results in the new state.
+    """
+    changes = {}
+    for key, value in new.items():
+        if key not in old:
+            changes[key] = value
+            continue
+        current = old[key]
+        if isinstance(value, dict) and isinstance(current, dict):
+            nested = state_changes(current, value)
+            if nested:
+                changes[key] = nested
+        elif not _same(value, current):
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+def _same(value, other) -> bool:
+    """Compares json values, arrays may be lists or tuples"""
+    if isinstance(value, dict) and isinstance(other, dict):
+        return value.keys() == other.keys() and all(_same(value[key], other[key]) for key in value)
+    if isinstance(value, (list, tuple)) and isinstance(other, (list, tuple)):
+        return len(value) == len(other) and all(_same(item, other_item) for item, other_item in zip(value, other))
+    return type(value) is type(other) and value == other
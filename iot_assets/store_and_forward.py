@@ -0,0 +1,154 @@
+import logging
+import paho.mqtt.client as paho
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Callable, List, Tuple, Union
+
+from metrics.registry import metrics_registry
+from .segment_log import SegmentLog
+
+logger = logging.getLogger(__name__)
+
+_instances = weakref.WeakSet()
+metrics_registry().gauge('iot_store_and_forward_backlog_messages', 'Stored messages waiting to be forwarded',
+                         lambda: sum(instance.backlog_messages for instance in list(_instances)))
+metrics_registry().gauge('iot_store_and_forward_backlog_bytes', 'Bytes of the stored messages on disk',
+                         lambda: sum(instance.backlog_bytes for instance in list(_instances)))
+
+
+@dataclass
+class StoreAndForwardDetails:
+    directory: str  # directory of the segment files, e.g. certificate_store/telemetry_buffer
+    drain_rate: float = 50.0  # messages per second published from the buffer after a reconnect
+    max_bytes: int = 256 * 1024 * 1024  # the oldest messages are evicted above this size
+    segment_size: int = 4 * 1024 * 1024
+    fsync_batch: int = 100  # appends between two fsync calls
+    ack_timeout: float = 10.0  # seconds to wait for the PUBACKs of a drained batch
+
+
+class StoreAndForward:
+    """ Store And Forward
+    Stores telemetry messages in a segment log on disk while the sender cannot
+    publish and forwards them in the original order after a reconnect.
+    As long as stored messages are pending, new messages are stored as well,
+    so the messages are published with monotonically increasing timestamps.
+
+    Forwarded messages are only removed from the log once the broker
+    acknowledged them with a PUBACK. Messages without PUBACK are forwarded
+    again with the next batch, so a message may arrive twice but is never lost.
+    """
+    drain_batch = 100
+
+    def __init__(self, options: StoreAndForwardDetails, publish: Callable[[bytes], paho.MQTTMessageInfo],
+                 is_ready: Callable[[], bool]):
+        self.options = options
+        self.log = self._open_log()
+        self.drain_interval = 1.0 / options.drain_rate
+        self.ack_timeout = options.ack_timeout
+        self.publish = publish
+        self.is_ready = is_ready
+        self.forwarded = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._worker = None
+        _instances.add(self)
+
+    @property
+    def backlog_messages(self) -> int:
+        return self.log.backlog_messages
+
+    @property
+    def backlog_bytes(self) -> int:
+        return self.log.backlog_bytes
+
+    def store(self, message: Union[str, bytes], connected: bool) -> bool:
+        """Stores the message if the sender is offline or stored messages are pending
+
+        Returns False if the message can be published directly
+        """
+        with self._lock:
+            if self.log.closed:
+                self.log = self._open_log()
+            if connected and self.log.backlog_messages == 0:
+                return False
+            self.log.append(message.encode('utf-8') if isinstance(message, str) else message)
+        self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        if self._running:
+            return
+        with self._lock:
+            if self.log.closed:
+                self.log = self._open_log()
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name='store-and-forward', daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout=None) -> None:
+        """Stops forwarding and closes the log, which is opened again by start() or store()"""
+        self._running = False
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+            if self._worker.is_alive():
+                logger.warning('store and forward still waits for PUBACKs, the log is only flushed')
+                self.log.flush()
+                return
+            self._worker = None
+        with self._lock:
+            self.log.close()
+
+    def wakeup(self) -> None:
+        """Signals that the sender might be ready to publish again"""
+        self._wakeup.set()
+
+    def _open_log(self) -> SegmentLog:
+        return SegmentLog(self.options.directory, self.options.segment_size, self.options.max_bytes,
+                          self.options.fsync_batch)
+
+    def _run(self) -> None:
+        while self._running:
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
+            while self._running and self.is_ready() and self.drain():
+                pass
+
+    def drain(self) -> int:
+        """Publishes a batch of stored messages at the drain rate, returns the number of acknowledged messages"""
+        pending = []
+        next_publish = time.monotonic()
+        for position, message in self.log.read(self.drain_batch):
+            if not self._running or not self.is_ready():
+                break
+            delay = next_publish - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_publish = max(next_publish, time.monotonic() - self.drain_interval) + self.drain_interval
+            message_info = self.publish(message)
+            if message_info.rc != paho.MQTT_ERR_SUCCESS:
+                logger.warning('forwarding a stored message failed with result %s', message_info.rc)
+                break
+            pending.append((position, message_info))
+        acknowledged = self._wait_for_acknowledgements(pending)
+        if acknowledged:
+            with self._lock:
+                self.log.commit(pending[acknowledged - 1][0], acknowledged)
+            self.forwarded += acknowledged
+            logger.info('forwarded %s stored messages, %s pending', acknowledged, self.log.backlog_messages)
+        return acknowledged
+
+    def _wait_for_acknowledgements(self, pending: List[Tuple[Tuple[int, int], paho.MQTTMessageInfo]]) -> int:
+        """Returns the number of leading messages of the batch which the broker acknowledged"""
+        deadline = time.monotonic() + self.ack_timeout
+        for index, (_, message_info) in enumerate(pending):
+            while not message_info.is_published():
+                if time.monotonic() > deadline:
+                    logger.warning('%s forwarded messages without PUBACK, they are forwarded again',
+                                   len(pending) - index)
+                    return index
+                time.sleep(0.005)
+        return len(pending)
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TelemetryBatcherDetails:
+    max_messages: int = 50  # a batch is published as soon as it holds this many messages
+    max_delay_ms: float = 100.0  # a batch is published at the latest this long after its first message
+
+
+def frame(messages: List[bytes]) -> bytes:
+    """Frames serialized json messages as one json array"""
+    return b'[' + b','.join(messages) + b']'
+
+
+class TelemetryBatcher:
+    """ Telemetry Batcher
+    Accumulates telemetry messages and publishes them as one json array, so many
+    small messages share one MQTT PUBLISH and one PUBACK round trip. A batch is
+    handed to the publish function when it reaches max_messages or when its first
+    message has waited max_delay_ms, whatever happens first. Full batches are
+    published on the thread of the producer, timed out batches on a timer thread.
+    """
+    def __init__(self, publish: Callable[[bytes], None], options: TelemetryBatcherDetails):
+        if options.max_messages < 1:
+            raise ValueError('max_messages must be at least 1')
+        self.publish = publish
+        self.max_messages = options.max_messages
+        self.max_delay = options.max_delay_ms / 1000.0
+        self.batches = 0
+        self.batched_messages = 0
+        self._batch: List[bytes] = []
+        self._deadline: Optional[float] = None
+        self._condition = threading.Condition()
+        self._publish_lock = threading.Lock()  # taken before the batch is released, keeps the batch order
+        self._timer = None
+        self._running = False
+
+    def start(self) -> None:
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._timer = threading.Thread(target=self._run, name='telemetry-batcher', daemon=True)
+        self._timer.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops the timer thread and publishes the pending batch"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._timer is not None:
+            self._timer.join(timeout)
+            self._timer = None
+        self.flush()
+
+    def add(self, message: Union[str, bytes]) -> None:
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        with self._condition:
+            self._batch.append(message)
+            if len(self._batch) < self.max_messages:
+                if self._deadline is None:
+                    self._deadline = time.monotonic() + self.max_delay
+                    self._condition.notify_all()
+                return
+            batch = self._take()
+            self._publish_lock.acquire()
+        self._publish(batch)
+
+    def flush(self) -> None:
+        """Publishes the pending messages immediately"""
+        with self._condition:
+            batch = self._take()
+            self._publish_lock.acquire()
+        self._publish(batch)
+
+    def _take(self) -> List[bytes]:
+        batch, self._batch, self._deadline = self._batch, [], None
+        return batch
+
+    def _publish(self, batch: List[bytes]) -> None:
+        try:
+            if not batch:
+                return
+            self.batches += 1
+            self.batched_messages += len(batch)
+            self.publish(frame(batch))
+        except Exception as err:
+            logger.error('publishing a batch of %s messages failed: %s', len(batch), err)
+        finally:
+            self._publish_lock.release()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and (self._deadline is None or self._deadline > time.monotonic()):
+                    self._condition.wait(None if self._deadline is None else self._deadline - time.monotonic())
+                if not self._running:
+                    return
+                batch = self._take()
+                self._publish_lock.acquire()
+            self._publish(batch)
@@ -0,0 +1,121 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+MULTI_LEVEL = '#'
+SINGLE_LEVEL = '+'
+
+
+class _Node:
+    """A level of the topic filter trie"""
+    __slots__ = ('children', 'handler')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.handler = None
+
+
+class TopicRouter:
+    """ Topic Router
+    Maps mqtt topic filters to handlers. Filters without wildcards are kept in a
+    dict keyed by the topic, so routing a message to them is a single lookup
+    however many filters, e.g. the shadow topics of many things, are registered.
+    Filters with the wildcards + and # are kept in a trie with one node per
+    topic level and are only searched when no exact filter matched.
+
+    As in mqtt, wildcards at the first level do not match topics starting
+    with $, e.g. # does not match $aws/things/thing/shadow/get/accepted.
+    """
+    def __init__(self):
+        self._exact: Dict[str, Callable] = {}
+        self._root = _Node()
+        self._wildcards = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._exact) + self._wildcards
+
+    def add(self, topic_filter: str, handler: Callable) -> None:
+        """Routes the topics matching the filter to the handler, replaces the handler of an existing filter"""
+        levels = _parse_filter(topic_filter)
+        with self._lock:
+            if SINGLE_LEVEL not in levels and MULTI_LEVEL not in levels:
+                self._exact[topic_filter] = handler
+                return
+            node = self._root
+            for level in levels:
+                node = node.children.setdefault(level, _Node())
+            if node.handler is None:
+                self._wildcards += 1
+            node.handler = handler
+
+    def remove(self, topic_filter: str) -> None:
+        levels = _parse_filter(topic_filter)
+        with self._lock:
+            if self._exact.pop(topic_filter, None) is not None:
+                return
+            path = [self._root]
+            for level in levels:
+                node = path[-1].children.get(level)
+                if node is None:
+                    return
+                path.append(node)
+            if path[-1].handler is None:
+                return
+            path[-1].handler = None
+            self._wildcards -= 1
+            for parent, level, node in zip(reversed(path[:-1]), reversed(levels), reversed(path[1:])):
+                if node.children or node.handler is not None:
+                    break
+                del parent.children[level]
+
+    def route(self, topic: str) -> Optional[Callable]:
+        """Returns the handler of the topic, filters without wildcards take precedence"""
+        handler = self._exact.get(topic)
+        if handler is not None or not self._wildcards:
+            return handler
+        matches = self.matches(topic)
+        return matches[0] if matches else None
+
+    def matches(self, topic: str) -> List[Callable]:
+        """Returns the handlers of all filters matching the topic, most specific first"""
+        handlers = []
+        handler = self._exact.get(topic)
+        if handler is not None:
+            handlers.append(handler)
+        if self._wildcards:
+            levels = topic.split('/')
+            self._match(self._root, levels, 0, handlers, topic.startswith('$'))
+        return handlers
+
+    def _match(self, node: _Node, levels: List[str], index: int, handlers: List[Any], system: bool) -> None:
+        if index == len(levels):
+            if node.handler is not None:
+                handlers.append(node.handler)
+            # 'a/#' also matches the parent level 'a'
+            child = node.children.get(MULTI_LEVEL)
+            if child is not None and child.handler is not None:
+                handlers.append(child.handler)
+            return
+        child = node.children.get(levels[index])
+        if child is not None:
+            self._match(child, levels, index + 1, handlers, False)
+        if system:
+            return
+        child = node.children.get(SINGLE_LEVEL)
+        if child is not None:
+            self._match(child, levels, index + 1, handlers, False)
+        child = node.children.get(MULTI_LEVEL)
+        if child is not None and child.handler is not None:
+            handlers.append(child.handler)
+
+
+def _parse_filter(topic_filter: str) -> List[str]:
+    if not topic_filter:
+        raise ValueError('topic filter must not be empty')
+    levels = topic_filter.split('/')
+    for index, level in enumerate(levels):
+        if level == MULTI_LEVEL and index != len(levels) - 1:
+            raise ValueError(f'# must be the last level of topic filter {topic_filter}')
+        if level not in (SINGLE_LEVEL, MULTI_LEVEL) and (SINGLE_LEVEL in level or MULTI_LEVEL in level):
+            raise ValueError(f'wildcards must occupy an entire level of topic filter {topic_filter}')
+    return levels
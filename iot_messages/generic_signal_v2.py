@@ -1,17 +1,45 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from typing import List, Any, Optional
 
 """The following classes represent the iot events
 Currently implemented: 
 Generic.Signal in Version 2
+
+The message classes store their fields in __slots__ instead of a per instance
+__dict__. The header mixins HeaderV3Optional and HeaderStatic only declare
+fields for the message classes and cannot be instantiated on their own.
 """
 
+
+def _slotted(cls):
+    """Recreates a dataclass with __slots__ for its fields
+
+    dataclass(slots=True) is only available since python 3.10. Fields already
+    stored in the slots of a base class are not declared again.
+    """
+    inherited = set()
+    for base in cls.__mro__[1:-1]:
+        inherited.update(base.__dict__.get('__slots__', ()))
+    names = tuple(f.name for f in fields(cls) if f.name not in inherited)
+    cls_dict = dict(cls.__dict__)
+    for name in names:
+        cls_dict.pop(name, None)
+    cls_dict.pop('__dict__', None)
+    cls_dict.pop('__weakref__', None)
+    cls_dict['__slots__'] = names
+    slotted_cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    slotted_cls.__qualname__ = cls.__qualname__
+    return slotted_cls
+
+
+@_slotted
 @dataclass
 class GenericSignalDeviceInfoJobPhasePart:
     side: str
     sheetname: str
 
 
+@_slotted
 @dataclass
 class GenericSignalDeviceInfoJobPhase:
     amount: int
@@ -27,12 +55,14 @@ class GenericSignalDeviceInfoJobPhase:
     workstepid: Optional[str] = None
 
 
+@_slotted
 @dataclass
 class GenericSignalDeviceInfoEvent:
     eventvalue: str
     eventid: str
 
 
+@_slotted
 @dataclass
 class GenericSignalDeviceInfo:
     speed: int
@@ -44,16 +74,19 @@ class GenericSignalDeviceInfo:
     event: Optional[GenericSignalDeviceInfoEvent] = None
 
 
+@_slotted
 @dataclass
 class GenericSignalSignalStatus:
     deviceinfo: GenericSignalDeviceInfo
 
 
+@_slotted
 @dataclass
 class GenericSignalPayload:
     signalstatus: GenericSignalSignalStatus
 
 
+@_slotted
 @dataclass
 class HeaderV3Mandatory:
     assetid: str  # from device
@@ -70,6 +103,8 @@ class HeaderV3Mandatory:
 
 @dataclass
 class HeaderV3Optional:
+    __slots__ = ()
+
     assethardwareversion: Optional[str] = None  # from asset
     assetmanufacturername: Optional[str] = None  # from asset, created in the onbaording process
     assetname: Optional[str] = None  # from asset, created in the onbaording process
@@ -83,15 +118,19 @@ class HeaderV3Optional:
 
 @dataclass
 class HeaderStatic:
+    __slots__ = ()
+
     headerversion: int = 3  # from message
     payloadversion: int = 2  # from message
 
 
+@_slotted
 @dataclass
 class GenericHeaderMandatory(HeaderV3Mandatory):
     payload: GenericSignalPayload
 
 
+@_slotted
 @dataclass
 class GenericSignalV2(HeaderStatic, HeaderV3Optional, GenericHeaderMandatory):
     pass
@@ -0,0 +1,77 @@
+"""Message builder with a precomputed header for one asset / sender pair
+
+Most header fields of a generic signal v2 message are the same for every
+message of an asset and its sender. The builder serializes them once and only
+adds the timestamps, the sendereventuuid and the payload per message.
+"""
+import datetime
+import time
+import uuid
+
+from .generic_signal_v2 import GenericSignalV2, HeaderStatic
+from .serializer import dumps, field_names, serialize_seconds, to_dict
+
+ASSET_FIELDS = frozenset(['assetid', 'assetserial', 'assettype', 'assethardwareversion', 'assetmanufacturername',
+                          'assetname', 'assetsoftwareversion', 'assetsubtype', 'siteid', 'sitename'])
+SENDER_FIELDS = frozenset(['sendertype', 'sendername', 'sendersoftwareversion'])
+MESSAGE_FIELDS = frozenset(['assettimestamp', 'sendertimestamp', 'sendereventuuid', 'payload'])
+
+
+def utc_timestamp() -> str:
+    return datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()
+
+
+class GenericSignalV2Builder:
+    """ Generic Signal V2 Builder
+    Builds serialized GenericSignalV2 messages of one asset and sender.
+    The asset and sender are read once, call refresh() after changing them.
+    """
+    def __init__(self, asset, sender, eventtype: str = 'generic.signal', eventsubtype: str = 'Status'):
+        self.asset = asset
+        self.sender = sender
+        self.eventtype = eventtype
+        self.eventsubtype = eventsubtype
+        self._header = b''
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Serializes the constant header fields"""
+        constants = {
+            'eventtype': self.eventtype,
+            'eventsubtype': self.eventsubtype,
+            'headerversion': HeaderStatic.headerversion,
+            'payloadversion': HeaderStatic.payloadversion,
+        }
+        header = {}
+        for name in field_names(GenericSignalV2):
+            if name in MESSAGE_FIELDS:
+                continue
+            if name in ASSET_FIELDS:
+                value = getattr(self.asset, name, None)
+            elif name in SENDER_FIELDS:
+                value = getattr(self.sender, name, None)
+            else:
+                value = constants[name]
+            if value is not None:
+                header[name] = value
+        self._header = dumps(header)[:-1] + b',' if header else b'{'
+
+    def build(self, payload, assettimestamp: str = None, sendertimestamp: str = None,
+              sendereventuuid: str = None) -> bytes:
+        """Returns the serialized message of the payload
+
+        The timestamps default to the current time, the sendereventuuid to a new uuid
+        """
+        start = time.perf_counter() if serialize_seconds.enabled else None
+        assettimestamp = assettimestamp or utc_timestamp()
+        message = b''.join((
+            self._header,
+            b'"assettimestamp":', dumps(assettimestamp),
+            b',"sendertimestamp":', dumps(sendertimestamp or assettimestamp),
+            b',"sendereventuuid":', dumps(sendereventuuid or str(uuid.uuid1())),
+            b',"payload":', dumps(to_dict(payload)),
+            b'}'
+        ))
+        if start is not None:
+            serialize_seconds.observe(time.perf_counter() - start)
+        return message
@@ -0,0 +1,70 @@
+"""Serializer for the iot message dataclasses
+
+Walks the message hierarchy directly instead of deep copying it with
+dataclasses.asdict. The field names of every message class are computed once,
+optional fields set to None are omitted. If orjson is installed it is used as
+json backend, otherwise the standard library json module.
+"""
+import dataclasses
+import json
+import time
+from typing import Any
+
+from metrics.registry import metrics_registry
+
+try:
+    import orjson
+except ImportError:  # optional accelerated json backend
+    orjson = None
+
+_SCALAR_TYPES = frozenset([str, int, float, bool])
+_field_names = {}
+
+serialize_seconds = metrics_registry().histogram('iot_serialize_seconds', 'Time to serialize a message to json')
+
+
+def field_names(cls) -> tuple:
+    """Returns the cached field names of a message class"""
+    names = _field_names.get(cls)
+    if names is None:
+        names = _field_names[cls] = tuple(f.name for f in dataclasses.fields(cls))
+    return names
+
+
+def to_dict(message) -> Any:
+    """Converts a message into json compatible dicts and lists without None values"""
+    cls = message.__class__
+    names = _field_names.get(cls)
+    if names is None:
+        if cls in _SCALAR_TYPES:
+            return message
+        if isinstance(message, (list, tuple)):
+            return [to_dict(item) for item in message]
+        if isinstance(message, dict):
+            return {key: to_dict(value) for key, value in message.items()}
+        if not dataclasses.is_dataclass(message) or isinstance(message, type):
+            return message
+        names = field_names(cls)
+    result = {}
+    for name in names:
+        value = getattr(message, name)
+        if value is not None:
+            result[name] = value if value.__class__ in _SCALAR_TYPES else to_dict(value)
+    return result
+
+
+def dumps(value) -> bytes:
+    """Encodes json compatible data as compact utf-8 json"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def serialize(message) -> bytes:
+    """Serializes a message into json bytes ready to be published"""
+    if not serialize_seconds.enabled:
+        return dumps(to_dict(message))
+    start = time.perf_counter()
+    data = dumps(to_dict(message))
+    serialize_seconds.observe(time.perf_counter() - start)
+    return data
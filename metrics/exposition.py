@@ -0,0 +1,87 @@
+"""Prometheus text exposition of the metrics registry"""
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from .registry import COUNTER, GAUGE, QUANTILES, MetricsRegistry, metrics_registry
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def prometheus_text(registry: MetricsRegistry) -> str:
+    """Renders all instruments in the prometheus text format, histograms as summaries with quantiles"""
+    lines = []
+    for metric in registry.metrics():
+        if metric.description:
+            lines.append(f'# HELP {metric.name} {_escape(metric.description)}')
+        if metric.kind in (COUNTER, GAUGE):
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.append(f'{metric.name} {_number(metric.value)}')
+            continue
+        lines.append(f'# TYPE {metric.name} summary')
+        for q in QUANTILES:
+            value = metric.quantile(q)
+            lines.append(f'{metric.name}{{quantile="{q:g}"}} {_number(value) if value is not None else "NaN"}')
+        lines.append(f'{metric.name}_sum {_number(metric.sum)}')
+        lines.append(f'{metric.name}_count {metric.count}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """ Metrics Server
+    Serves the metrics of the registry in the prometheus text format at
+    /metrics from a daemon thread. It listens on the loopback interface
+    unless another host is given, port 0 picks a free port.
+    """
+    def __init__(self, registry: Optional[MetricsRegistry] = None, host: str = '127.0.0.1', port: int = 9464):
+        self.registry = registry or metrics_registry()
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self) -> 'MetricsServer':
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = prometheus_text(registry).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug('metrics request: ' + format, *args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        logger.info('serving metrics at http://%s:%s/metrics', self.host, self.port)
+        return self
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
@@ -0,0 +1,231 @@
+"""Dependency free metrics for the client stack
+
+Counters, gauges and latency histograms are created once by the instrumented
+modules and registered in the process wide registry. The registry starts
+disabled: every instrument then only checks its enabled flag, which keeps the
+instrumented hot paths as fast as without metrics. Enable the registry to
+record, read the values with snapshot() or serve them with a MetricsServer.
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class Counter:
+    """A value which only increases, e.g. the number of published messages"""
+    kind = COUNTER
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.enabled = False
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: Union[int, float] = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self.value = 0
+
+    def snapshot(self) -> Dict:
+        return {'type': self.kind, 'value': self.value}
+
+
+class Gauge:
+    """A value which goes up and down, either set by the code or read from a function when it is pulled"""
+    kind = GAUGE
+
+    def __init__(self, name: str, description: str, function: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.description = description
+        self.enabled = False
+        self.function = function
+        self._value = 0
+
+    @property
+    def value(self) -> float:
+        return self.function() if self.function is not None else self._value
+
+    def set(self, value: float) -> None:
+        if self.enabled:
+            self._value = value
+
+    def reset(self) -> None:
+        self._value = 0
+
+    def snapshot(self) -> Dict:
+        return {'type': self.kind, 'value': self.value}
+
+
+class Histogram:
+    """ Histogram
+    Records latencies in logarithmic buckets as HDR histograms do: every power
+    of two is divided into 2 ** (precision_bits - 1) linear sub buckets, so a
+    quantile is exact within 2 ** -(precision_bits - 1) of its value (about 3 %
+    for the default) however far apart the recorded values are. Values are
+    recorded in seconds with a resolution of one microsecond.
+    """
+    kind = HISTOGRAM
+
+    def __init__(self, name: str, description: str, precision_bits: int = 6):
+        self.name = name
+        self.description = description
+        self.enabled = False
+        self.precision_bits = precision_bits
+        self._linear = 1 << precision_bits
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets: Dict[int, int] = {}
+            self.count = 0
+            self.sum = 0.0
+            self.min = None
+            self.max = None
+
+    def observe(self, seconds: float) -> None:
+        if not self.enabled:
+            return
+        index = self._index(int(seconds * 1e6))
+        buckets = self._buckets
+        with self._lock:
+            buckets[index] = buckets.get(index, 0) + 1
+            self.count += 1
+            self.sum += seconds
+            if self.count == 1:
+                self.min = self.max = seconds
+            elif seconds < self.min:
+                self.min = seconds
+            elif seconds > self.max:
+                self.max = seconds
+
+    def time(self) -> '_Timer':
+        """Context manager which records the duration of its block"""
+        return _Timer(self)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns the value below which the fraction q of the recorded values lies, in seconds"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = max(1, q * self.count)
+            seen = 0
+            for index in sorted(self._buckets):
+                seen += self._buckets[index]
+                if seen >= rank:
+                    lower, upper = self._bounds(index)
+                    value = (lower + upper - 1) / 2e6
+                    return min(max(value, self.min), self.max)
+        return self.max
+
+    def snapshot(self) -> Dict:
+        result = {'type': self.kind, 'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max}
+        for q in QUANTILES:
+            result[f'p{q * 100:g}'.replace('.', '')] = self.quantile(q)
+        return result
+
+    def _index(self, micros: int) -> int:
+        if micros < self._linear:
+            return micros if micros > 0 else 0
+        shift = micros.bit_length() - self.precision_bits
+        return (shift << (self.precision_bits - 1)) + (micros >> shift)
+
+    def _bounds(self, index: int):
+        """The microseconds range [lower, upper) of a bucket"""
+        if index < self._linear:
+            return index, index + 1
+        shift = (index >> (self.precision_bits - 1)) - 1
+        sub_bucket = index - (shift << (self.precision_bits - 1))
+        return sub_bucket << shift, (sub_bucket + 1) << shift
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    """ Metrics Registry
+    Holds the instruments by name. Asking twice for the same name returns the
+    same instrument, so modules can create their instruments independently.
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._metrics: Dict[str, Union[Counter, Gauge, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str = '') -> Counter:
+        return self._register(Counter, name, description)
+
+    def gauge(self, name: str, description: str = '', function: Optional[Callable[[], float]] = None) -> Gauge:
+        gauge = self._register(Gauge, name, description)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name: str, description: str = '') -> Histogram:
+        return self._register(Histogram, name, description)
+
+    def enable(self) -> None:
+        self._set_enabled(True)
+
+    def disable(self) -> None:
+        self._set_enabled(False)
+
+    def reset(self) -> None:
+        """Resets the recorded values of all instruments"""
+        for metric in self.metrics():
+            metric.reset()
+
+    def metrics(self) -> List[Union[Counter, Gauge, Histogram]]:
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """The current values of all instruments by name"""
+        return {metric.name: metric.snapshot() for metric in self.metrics()}
+
+    def _register(self, cls, name: str, description: str):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description)
+                metric.enabled = self.enabled
+            elif not isinstance(metric, cls):
+                raise ValueError(f'metric {name} is already registered as a {metric.kind}')
+            return metric
+
+    def _set_enabled(self, enabled: bool) -> None:
+        with self._lock:
+            self.enabled = enabled
+            for metric in self._metrics.values():
+                metric.enabled = enabled
+
+
+_metrics_registry = MetricsRegistry()
+
+
+def metrics_registry() -> MetricsRegistry:
+    """Returns the registry shared by all modules of the process"""
+    return _metrics_registry
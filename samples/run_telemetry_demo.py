@@ -13,7 +13,9 @@ from dataclasses import asdict
 from time import sleep
 
 import iot_messages.generic_signal_v2 as gen_sig_v2
-from event_validator.schema_validator import event_validator_factory, SchemaValidationException
+from iot_messages.serializer import serialize
+from event_validator.fast_validator import status_v2_validator_factory
+from event_validator.schema_validator import SchemaValidationException
 from iot_assets.asset import Asset, AssetDetails
 from iot_assets.iot_client import IoTClientDetails
 from iot_assets.sender import Sender, SenderDetails
@@ -29,7 +31,7 @@ def simulate_telemetry_of_generic_signal_v2():
     1. Creates Onboarding Manager to handle directory and provisioning tasks
     2. Creates a sender with MQTT connection capabilities and an asset
     3. Creates a asset which represents a machine you want to integrate
-    4. Validates the generated message against the local json schema
+    4. Validates the generated message against the precompiled local json schema
     6. Sends the message to the telemetry topic if validation was successful
     """
     try:
@@ -38,13 +40,13 @@ def simulate_telemetry_of_generic_signal_v2():
         sender = generate_sender(connection_details)
         asset = generate_asset(connection_details)
         sender.connect(ssl_tunnel=False)  # set to True to use port 443
-        event_validator = event_validator_factory()
+        status_validator = status_v2_validator_factory()
         for _ in range(99):
             try:
                 sleep(3)
-                message = generate_generic_signal_v2(asset, sender)
-                event_validator.validate(message)
-                sender.publish_telemetry(message)
+                signal = build_generic_signal_v2(asset, sender)
+                status_validator.validate(signal)
+                sender.publish_telemetry(serialize(signal))
                 sleep(3)
             except SchemaValidationException as err:
                 logger.error(err)
@@ -87,17 +89,22 @@ def generate_asset(cd: ConnectionDetails) -> Asset:
 
 
 def generate_generic_signal_v2(asset: Asset, sender: Sender) -> str:
+    """Builds a valid generic signal v2 demo message"""
+    return json.dumps(asdict(build_generic_signal_v2(asset, sender)))
+
+
+def build_generic_signal_v2(asset: Asset, sender: Sender) -> gen_sig_v2.GenericSignalV2:
     """Builds a valid generic signal v2 demo object"""
     genericSignalDeviceInfoJobPhasePart1 = gen_sig_v2.GenericSignalDeviceInfoJobPhasePart('sideDemo1', 'sheetNameDemo1')
     genericSignalDeviceInfoJobPhasePart2 = gen_sig_v2.GenericSignalDeviceInfoJobPhasePart('sideDemo2', 'sheetNameDemo2')
     genericSignalDeviceInfoJobPhaseList = [genericSignalDeviceInfoJobPhasePart1, genericSignalDeviceInfoJobPhasePart2]
-    genericSignalDeviceInfoJobPhase1 = gen_sig_v2.GenericSignalDeviceInfoJobPhase(11, 'jobIdDemo', 'statusDemo',
+    genericSignalDeviceInfoJobPhase1 = gen_sig_v2.GenericSignalDeviceInfoJobPhase(11, 'jobIdDemo', 'InProgress',
                                                                                   'statusDetailsDemo',
                                                                                   'costCenterIdDemo', 'jobPartIdDemo',
                                                                                   genericSignalDeviceInfoJobPhaseList,
                                                                                   'percentcompleted', 'starttime',
                                                                                   'wasteDemo', 'workstepidDemo')
-    genericSignalDeviceInfoJobPhase2 = gen_sig_v2.GenericSignalDeviceInfoJobPhase(22, 'jobIdDemo', 'statusDemo',
+    genericSignalDeviceInfoJobPhase2 = gen_sig_v2.GenericSignalDeviceInfoJobPhase(22, 'jobIdDemo', 'InProgress',
                                                                                   'statusDetailsDemo',
                                                                                   'costCenterIdDemo', 'jobPartIdDemo',
                                                                                   genericSignalDeviceInfoJobPhaseList,
@@ -106,7 +113,7 @@ def generate_generic_signal_v2(asset: Asset, sender: Sender) -> str:
 
     genericSignalDeviceInfoJobPhaseList = [genericSignalDeviceInfoJobPhase1, genericSignalDeviceInfoJobPhase2]
     genericSignalDeviceInfoEvent = gen_sig_v2.GenericSignalDeviceInfoEvent('eventValueDemo', 'eventIdDemo')
-    genericSignalDeviceInfo = gen_sig_v2.GenericSignalDeviceInfo(111, 'StatusDemo', 'statusdetailsdemo', 1, 22,
+    genericSignalDeviceInfo = gen_sig_v2.GenericSignalDeviceInfo(111, 'Production', 'statusdetailsdemo', 1, 22,
                                                                  genericSignalDeviceInfoJobPhaseList,
                                                                  genericSignalDeviceInfoEvent)
     genericSignalSignalStatus = gen_sig_v2.GenericSignalSignalStatus(genericSignalDeviceInfo)
@@ -123,8 +130,7 @@ def generate_generic_signal_v2(asset: Asset, sender: Sender) -> str:
                                                  asset.assetname, asset.assetsoftwareversion, asset.assetsubtype,
                                                  sender.sendername, sender.sendersoftwareversion,asset.siteid,
                                                  asset.sitename)
-    d = asdict(genericSignalV2)
-    return json.dumps(d)
+    return genericSignalV2
 
 
 if __name__ == '__main__':
@@ -0,0 +1,59 @@
+"""Fixtures and helpers shared by the test modules"""
+import copy
+import time
+
+import iot_messages.generic_signal_v2 as gen_sig_v2
+
+
+def generic_signal_status_message():
+    return {
+        "assetid": "assetIdMock",
+        "assetserial": "assetSerialMock",
+        "assettimestamp": "2020-11-04T10:00:00.000+00:00",
+        "assettype": "BoxPacker",
+        "eventtype": "generic.signal",
+        "eventsubtype": "Status",
+        "sendereventuuid": "senderEventUuidMock",
+        "sendertype": "system",
+        "sendertimestamp": "2020-11-04T10:00:00.000+00:00",
+        "headerversion": 3,
+        "payloadversion": 2,
+        "payload": {
+            "signalstatus": {
+                "deviceinfo": {
+                    "speed": 100,
+                    "status": "Production",
+                    "statusdetails": "statusDetailsMock",
+                    "totalproductioncounter": 1
+                }
+            }
+        }
+    }
+
+
+def drop_none(value):
+    if isinstance(value, dict):
+        return {key: drop_none(item) for key, item in value.items() if item is not None}
+    if isinstance(value, list):
+        return [drop_none(item) for item in value]
+    return value
+
+
+def generic_signal_v2():
+    part = gen_sig_v2.GenericSignalDeviceInfoJobPhasePart('sideMock', 'sheetNameMock')
+    job_phase = gen_sig_v2.GenericSignalDeviceInfoJobPhase(11, 'jobIdMock', 'InProgress', 'statusDetailsMock',
+                                                           part=[copy.copy(part)])
+    device_info = gen_sig_v2.GenericSignalDeviceInfo(100, 'Production', 'statusDetailsMock', 1,
+                                                     jobphase=[job_phase])
+    payload = gen_sig_v2.GenericSignalPayload(gen_sig_v2.GenericSignalSignalStatus(device_info))
+    return gen_sig_v2.GenericSignalV2('assetIdMock', 'assetSerialMock', '2020-11-04T10:00:00.000+00:00',
+                                      'BoxPacker', 'generic.signal', 'Status', 'senderEventUuidMock', 'system',
+                                      '2020-11-04T10:00:00.000+00:00', payload, sendername='senderNameMock')
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met in time')
+        time.sleep(0.01)
@@ -0,0 +1,86 @@
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock
+
+from benchmarks.stub_broker import StubBroker, generate_credentials
+from iot_assets.async_iot_client import AsyncIoTClient
+from iot_assets.iot_client import IoTClient, IoTClientDetails
+from iot_assets.sender import Sender, SenderDetails
+
+
+class AsyncIoTClientTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.credentials = generate_credentials(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.broker = StubBroker(self.credentials).start()
+        self.addCleanup(self.broker.stop)
+
+    def client_details(self, thing_name):
+        return IoTClientDetails("localhost", self.broker.port, self.credentials['client_cert'],
+                                self.credentials['client_key'], self.credentials['ca'], thing_name)
+
+    def test_publish_and_subscribe_on_one_loop(self):
+        clients = [AsyncIoTClient(IoTClient(self.client_details(f'thing{index}'))) for index in range(5)]
+        received = Mock()
+        clients[0].iot_client.on_message = received
+
+        async def scenario():
+            await asyncio.gather(*(client.connect() for client in clients))
+            granted = await clients[0].subscribe('telemetry/#')
+            mids = await asyncio.gather(*(client.publish(f'telemetry/{index}', b'{}')
+                                          for index, client in enumerate(clients) for _ in range(10)))
+            network_threads = [thread for thread in threading.enumerate() if thread.name.startswith('paho')]
+            while received.call_count < 50:
+                await asyncio.sleep(0.01)
+            await asyncio.gather(*(client.disconnect() for client in clients))
+            return granted, mids, network_threads
+
+        granted, mids, network_threads = asyncio.run(asyncio.wait_for(scenario(), 10))
+
+        self.assertEqual(granted, (1,))
+        self.assertEqual(len(mids), 50)
+        self.assertEqual(network_threads, [])
+        self.assertEqual(self.broker.publish_count, 50)
+        self.assertEqual(received.call_count, 50)
+        self.assertFalse(any(client.is_attached for client in clients))
+
+    def test_sender_shadow_subscriptions(self):
+        sender = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                      "siteIdMock", "clientIdMock", "telemetry"),
+                        self.client_details('thingMock'))
+        client = AsyncIoTClient(sender.iot_client)
+
+        async def scenario():
+            await client.connect()
+            while not sender.iot_client.connflag:
+                await asyncio.sleep(0.01)
+            await client.disconnect()
+
+        asyncio.run(asyncio.wait_for(scenario(), 10))
+
+        self.assertEqual(self.broker.subscribe_count, 1)
+
+    def test_connection_lost_fails_pending_publish(self):
+        client = AsyncIoTClient(IoTClient(self.client_details('thingMock')))
+
+        async def scenario():
+            await client.connect(timeout=5)
+            self.broker.ack_delay = 60.0
+            publish = asyncio.ensure_future(client.publish('telemetry', b'{}'))
+            await asyncio.sleep(0.1)
+            self.broker.disconnect_all()
+            with self.assertRaises(ConnectionError):
+                await asyncio.wait_for(publish, 5)
+
+        asyncio.run(scenario())
+
+        self.assertFalse(client.is_attached)
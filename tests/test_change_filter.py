@@ -0,0 +1,79 @@
+import copy
+import json
+import unittest
+from unittest.mock import Mock
+
+from iot_assets.change_filter import ChangeFilterDetails, StatusChangeFilter
+from iot_assets.iot_client import IoTClientDetails
+from iot_assets.sender import Sender, SenderDetails
+from tests.helpers import generic_signal_status_message
+
+
+def with_device_info(**changes):
+    message = generic_signal_status_message()
+    message['payload']['signalstatus']['deviceinfo'].update(changes)
+    return message
+
+
+class StatusChangeFilterTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.change_filter = StatusChangeFilter(ChangeFilterDetails(heartbeat_interval=60, deadbands={'speed': 5}),
+                                                clock=lambda: self.now)
+        self.change_filter.record(generic_signal_status_message())
+
+    def test_unchanged_signal_is_redundant(self):
+        message = generic_signal_status_message()
+        message['sendereventuuid'] = 'otherUuidMock'
+        message['assettimestamp'] = '2020-11-04T10:00:01.000+00:00'
+
+        self.assertTrue(self.change_filter.is_redundant(message))
+        self.assertEqual(self.change_filter.suppressed, 1)
+
+    def test_changed_signal(self):
+        self.assertFalse(self.change_filter.is_redundant(with_device_info(status='Stopped')))
+        self.assertFalse(self.change_filter.is_redundant(with_device_info(productioncounter=1)))
+
+    def test_deadband(self):
+        self.assertTrue(self.change_filter.is_redundant(with_device_info(speed=105)))
+        self.assertFalse(self.change_filter.is_redundant(with_device_info(speed=106)))
+        self.assertFalse(self.change_filter.is_redundant(with_device_info(totalproductioncounter=2)))
+
+    def test_heartbeat(self):
+        self.now = 59
+        self.assertTrue(self.change_filter.is_redundant(generic_signal_status_message()))
+        self.now = 60
+        self.assertFalse(self.change_filter.is_redundant(generic_signal_status_message()))
+
+    def test_assets_are_tracked_separately(self):
+        message = generic_signal_status_message()
+        message['assetid'] = 'otherAssetIdMock'
+
+        self.assertFalse(self.change_filter.is_redundant(message))
+
+
+class SenderChangeFilterTests(unittest.TestCase):
+    def test_publish_telemetry_suppresses_unchanged_signals(self):
+        sender_details = SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                       "siteIdMock", "clientIdMock", "telemetryTopicMock",
+                                       change_filter=ChangeFilterDetails(deadbands={'speed': 5}))
+        sender = Sender(sender_details, IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock",
+                                                         "devicePrivateKeyPathMock", "amazonRootCaPathMock",
+                                                         "thingNameMock"))
+        sender.iot_client = Mock()
+        sender.iot_client.connflag = True
+        sender.state = {"sendTelemetryData": True}
+        message = generic_signal_status_message()
+
+        sender.publish_telemetry(json.dumps(message))
+        sender.publish_telemetry(json.dumps(copy.deepcopy(message)).encode())
+        sender.publish_telemetry(json.dumps(with_device_info(speed=103)))
+        sender.publish_telemetry(json.dumps(with_device_info(status='Stopped')))
+
+        self.assertEqual(sender.iot_client.publish.call_count, 2)
+        self.assertEqual(sender.change_filter.suppressed, 2)
+
+        sender.publish_telemetry('no json')
+        sender.publish_telemetry(b'\xff')
+        sender.publish_telemetry('[1, 2]')
+        self.assertEqual(sender.iot_client.publish.call_count, 5)
@@ -0,0 +1,59 @@
+import json
+import unittest
+from dataclasses import asdict
+from unittest.mock import patch
+
+from benchmarks.messages import status_signal
+from iot_assets.compression import (GZIP, ZLIB, CompressionDetails, PayloadCompressor, build_dictionary,
+                                    decompress_payload, is_compressed)
+from iot_assets.iot_client import IoTClient, IoTClientDetails
+
+
+def status_message(job_phases=5, parts=10) -> bytes:
+    return json.dumps(asdict(status_signal(job_phases, parts))).encode('utf-8')
+
+
+class CompressionTests(unittest.TestCase):
+    def test_round_trip(self):
+        message = status_message()
+        for algorithm in (ZLIB, GZIP):
+            with self.subTest(algorithm=algorithm):
+                compressed = PayloadCompressor(CompressionDetails(algorithm, threshold=0)).compress(message)
+
+                self.assertTrue(is_compressed(compressed))
+                self.assertLess(len(compressed), len(message))
+                self.assertEqual(decompress_payload(compressed), message)
+
+    def test_below_threshold_is_unchanged(self):
+        compressor = PayloadCompressor(CompressionDetails(threshold=1024))
+
+        self.assertEqual(compressor.compress('{"short": true}'), '{"short": true}')
+        self.assertIsNone(compressor.compress(None))
+        self.assertEqual(decompress_payload(b'{"short": true}'), b'{"short": true}')
+
+    def test_dictionary(self):
+        dictionary = build_dictionary(status_message(2, 2) for _ in range(20))
+        message = status_message(1, 1)
+        plain = PayloadCompressor(CompressionDetails(threshold=0)).compress(message)
+        trained = PayloadCompressor(CompressionDetails(threshold=0, dictionary=dictionary)).compress(message)
+
+        self.assertLess(len(trained), len(plain))
+        self.assertEqual(decompress_payload(trained, dictionary), message)
+
+    def test_dictionary_requires_zlib(self):
+        with self.assertRaises(ValueError):
+            PayloadCompressor(CompressionDetails(GZIP, dictionary=b'dictionary'))
+
+    @patch("iot_assets.iot_client.paho")
+    def test_iot_client_compresses_telemetry_only(self, paho_mock):
+        iot_client = IoTClient(IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock",
+                                                "devicePrivateKeyPathMock", "amazonRootCaPathMock", "thingNameMock",
+                                                CompressionDetails(threshold=0)))
+        message = status_message()
+
+        iot_client.publish('telemetryTopicMock', message)
+        payload = iot_client.mqttc.publish.call_args[0][1]
+        self.assertEqual(decompress_payload(payload), message)
+
+        iot_client.publish('$aws/things/thingNameMock/shadow/update', message)
+        iot_client.mqttc.publish.assert_called_with('$aws/things/thingNameMock/shadow/update', message, qos=1)
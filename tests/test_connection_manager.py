@@ -0,0 +1,78 @@
+import json
+import tempfile
+import threading
+import unittest
+
+from benchmarks.stub_broker import StubBroker, generate_credentials
+from iot_assets.connection_manager import ConnectionManager, ConnectionManagerDetails
+from iot_assets.iot_client import IoTClient, IoTClientDetails
+from iot_assets.reconnect_supervisor import ReconnectPolicyDetails
+from iot_assets.sender import Sender, SenderDetails
+from tests.helpers import wait_for
+
+
+class ConnectionManagerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.credentials = generate_credentials(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.broker = StubBroker(self.credentials).start()
+        self.addCleanup(self.broker.stop)
+        options = ConnectionManagerDetails(network_threads=2, reconnect=ReconnectPolicyDetails(base_delay=0.05))
+        self.manager = ConnectionManager(options)
+        self.addCleanup(self.manager.stop)
+
+    def client_details(self, thing_name):
+        return IoTClientDetails("localhost", self.broker.port, self.credentials['client_cert'],
+                                self.credentials['client_key'], self.credentials['ca'], thing_name)
+
+    def sender(self, index):
+        sender = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                      "siteIdMock", f"client{index}", "telemetry"),
+                        self.client_details(f'thing{index}'))
+        sender.state = {"sendTelemetryData": True}
+        return sender
+
+    def test_many_senders_share_the_network_threads(self):
+        senders = [self.sender(index) for index in range(20)]
+        for sender in senders:
+            sender.connect(connection_manager=self.manager)
+        wait_for(lambda: all(sender.iot_client.connflag for sender in senders))
+
+        self.broker.record_messages = True
+        for sender in senders:
+            for index in range(5):
+                sender.publish_telemetry(json.dumps({'index': index}))
+        wait_for(lambda: len([message for message in self.broker.messages if message[1].startswith('telemetry/')])
+                 == 100)
+
+        self.assertEqual(self.manager.clients, 20)
+        self.assertEqual([thread for thread in threading.enumerate() if thread.name.startswith('paho')], [])
+        for sender in senders:
+            sender.disconnect()
+        wait_for(lambda: self.manager.clients == 0)
+
+    def test_reconnect_after_connection_loss(self):
+        sender = self.sender(0)
+        sender.connect(connection_manager=self.manager)
+        wait_for(lambda: sender.iot_client.connflag)
+
+        self.broker.disconnect_all()
+        wait_for(lambda: not sender.iot_client.connflag)
+
+        wait_for(lambda: sender.iot_client.connflag)
+        self.assertEqual(self.broker.connect_count, 2)
+        self.assertEqual(sender.iot_client.reconnect_policy.stats().reconnects, 1)
+        sender.disconnect()
+
+    def test_ssl_context_is_shared(self):
+        first = IoTClient(self.client_details('thing0'))
+        second = IoTClient(self.client_details('thing1'))
+
+        self.assertIs(self.manager.ssl_context(first), self.manager.ssl_context(second))
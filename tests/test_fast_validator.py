@@ -0,0 +1,141 @@
+import json
+import unittest
+from dataclasses import asdict
+
+from jsonschema import Draft7Validator
+
+from event_validator.fast_validator import StatusV2Validator, compile_schema, status_v2_validator_factory
+from event_validator.schema_validator import PATHS, EventValidator, SchemaRegistry, SchemaValidationException
+from tests.helpers import drop_none, generic_signal_v2
+
+
+def status_message():
+    return {
+        "assetid": "assetIdMock",
+        "assetserial": "assetSerialMock",
+        "assettimestamp": "2020-11-04T10:00:00.000+00:00",
+        "assettype": "BoxPacker",
+        "eventtype": "generic.signal",
+        "eventsubtype": "Status",
+        "sendereventuuid": "senderEventUuidMock",
+        "sendertype": "system",
+        "sendertimestamp": "2020-11-04T10:00:00.000+00:00",
+        "sendername": "senderNameMock",
+        "siteid": "siteIdMock",
+        "headerversion": 3,
+        "payloadversion": 2,
+        "payload": {
+            "signalstatus": {
+                "deviceinfo": {
+                    "speed": 100,
+                    "status": "Production",
+                    "statusdetails": "statusDetailsMock",
+                    "totalproductioncounter": 1,
+                    "productioncounter": 1.5,
+                    "event": {"eventid": "eventIdMock", "eventvalue": "eventValueMock"},
+                    "jobphase": [{
+                        "amount": 11,
+                        "jobid": "jobIdMock",
+                        "status": "InProgress",
+                        "statusdetails": "statusDetailsMock",
+                        "part": [{"side": "sideMock", "sheetname": "sheetNameMock"}]
+                    }]
+                }
+            }
+        }
+    }
+
+
+def mutate(path, value=None, delete=False):
+    message = status_message()
+    target = message
+    for key in path[:-1]:
+        target = target[key]
+    if delete:
+        del target[path[-1]]
+    else:
+        target[path[-1]] = value
+    return message
+
+
+DEVICE_INFO = ('payload', 'signalstatus', 'deviceinfo')
+JOB_PHASE = DEVICE_INFO + ('jobphase', 0)
+
+CORPUS = [
+    status_message(),
+    mutate(('assetid',), delete=True),
+    mutate(('payload',), delete=True),
+    mutate(('assettype',), 'UnknownAssetType'),
+    mutate(('sendertype',), None),
+    mutate(('headerversion',), 2),
+    mutate(('headerversion',), 3.0),
+    mutate(('headerversion',), True),
+    mutate(('payloadversion',), 1),
+    mutate(('payloadversion',), '2'),
+    mutate(('eventsubtype',), 'Other'),
+    mutate(('eventtype',), 'smoke-test'),
+    mutate(('unknownfield',), 'value'),
+    mutate(('assetname',), 42),
+    mutate(('payload',), []),
+    mutate(('payload', 'signalstatus'), delete=True),
+    mutate(('payload', 'signalstatus', 'deviceinfo'), 'deviceinfo'),
+    mutate(DEVICE_INFO + ('speed',), delete=True),
+    mutate(DEVICE_INFO + ('speed',), '100'),
+    mutate(DEVICE_INFO + ('speed',), False),
+    mutate(DEVICE_INFO + ('status',), 'StatusDemo'),
+    mutate(DEVICE_INFO + ('additional',), 'allowed'),
+    mutate(DEVICE_INFO + ('event',), {"eventid": 1}),
+    mutate(DEVICE_INFO + ('jobphase',), {}),
+    mutate(JOB_PHASE + ('amount',), delete=True),
+    mutate(JOB_PHASE + ('status',), 'statusDemo'),
+    mutate(JOB_PHASE + ('part',), [{"side": None}]),
+    mutate(JOB_PHASE + ('part',), ['part']),
+    "not an object",
+]
+
+
+class FastValidatorParityTests(unittest.TestCase):
+    """The precompiled validator has to agree with jsonschema on Status.schema.json"""
+
+    def setUp(self):
+        registry = SchemaRegistry(PATHS)
+        self.schemas = [EventValidator.load_json(registry.header_path(3)),
+                        EventValidator.load_json(registry.payload_path('generic.signal', 'Status', 2))]
+        self.reference = [Draft7Validator(schema) for schema in self.schemas]
+        self.validator = StatusV2Validator(PATHS)
+
+    def reference_error_paths(self, message):
+        return sorted(tuple(error.absolute_path) for reference in self.reference
+                      for error in reference.iter_errors(message))
+
+    def test_parity_on_corpus(self):
+        for message in CORPUS:
+            with self.subTest(message=message):
+                expected = self.reference_error_paths(message)
+                found = sorted(path for check in self.validator._checks for path, _ in check(message) or ())
+                self.assertEqual(self.validator.is_valid(message), not expected)
+                self.assertEqual(found, expected)
+
+    def test_parity_on_dataclass(self):
+        message = generic_signal_v2()
+        serialized = drop_none(asdict(message))
+
+        self.assertEqual(self.reference_error_paths(serialized), [])
+        self.assertTrue(self.validator.is_valid(message))
+
+        message.payload.signalstatus.deviceinfo.status = 'StatusDemo'
+        message.assettype = None
+        self.assertEqual(self.validator.iter_errors(message),
+                         ["'assettype' is a required property",
+                          "payload/signalstatus/deviceinfo/status: 'StatusDemo' is not one of "
+                          "['Idle', 'NonPoductive', 'Offline', 'Production', 'Stopped']"])
+
+    def test_validate_raises(self):
+        self.assertRaises(SchemaValidationException, self.validator.validate, CORPUS[1])
+        self.validator.validate(json.loads(json.dumps(CORPUS[0])))
+
+    def test_unsupported_keyword(self):
+        self.assertRaises(SchemaValidationException, compile_schema, {"type": "string", "pattern": "^a"})
+
+    def test_factory_returns_shared_instance(self):
+        self.assertIs(status_v2_validator_factory(), status_v2_validator_factory())
@@ -0,0 +1,38 @@
+import copy
+import pickle
+import unittest
+from dataclasses import asdict
+
+import iot_messages.generic_signal_v2 as gen_sig_v2
+from tests.helpers import generic_signal_v2
+
+
+class GenericSignalV2Tests(unittest.TestCase):
+    def test_messages_have_no_instance_dict(self):
+        signal = generic_signal_v2()
+        device_info = signal.payload.signalstatus.deviceinfo
+
+        for message in [signal, signal.payload, device_info, device_info.jobphase[0],
+                        device_info.jobphase[0].part[0]]:
+            self.assertFalse(hasattr(message, '__dict__'), type(message).__name__)
+
+    def test_constructor_defaults(self):
+        signal = generic_signal_v2()
+
+        self.assertEqual(signal.headerversion, 3)
+        self.assertEqual(signal.payloadversion, 2)
+        self.assertIsNone(signal.sitename)
+        self.assertIsNone(signal.payload.signalstatus.deviceinfo.event)
+
+    def test_dataclass_behaviour(self):
+        signal = generic_signal_v2()
+
+        self.assertEqual(copy.deepcopy(signal), signal)
+        self.assertEqual(pickle.loads(pickle.dumps(signal)), signal)
+        self.assertEqual(asdict(signal)['payload']['signalstatus']['deviceinfo']['speed'], 100)
+        self.assertRaises(AttributeError, setattr, signal, 'unknownfield', 'value')
+
+    def test_keyword_constructor(self):
+        part = gen_sig_v2.GenericSignalDeviceInfoJobPhasePart(side='sideMock', sheetname='sheetNameMock')
+
+        self.assertEqual(part, gen_sig_v2.GenericSignalDeviceInfoJobPhasePart('sideMock', 'sheetNameMock'))
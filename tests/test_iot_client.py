@@ -29,3 +29,66 @@ class IoTClientTests(unittest.TestCase):
         self.assertEqual(err, False)
         client_mock.connect.assert_called_with(self.iot_client_details.mqtt_endpoint,
                                                self.iot_client_details.standard_port, keepalive=IoTClient.keep_alive)
+
+    def test_subscribe_topic_list(self):
+        self.iot.mqttc = Mock()
+        self.iot.mqttc.subscribe.return_value = (0, 7)
+
+        mid = self.iot.subscribe(['topicA', 'topicB'])
+
+        self.iot.mqttc.subscribe.assert_called_once_with([('topicA', 1), ('topicB', 1)])
+        self.assertEqual(mid, 7)
+        self.assertEqual(self.iot.subscriptions_ledger, {7: ['topicA', 'topicB']})
+
+    def test_ready_after_all_subscriptions(self):
+        self.iot.mqttc = Mock()
+        self.iot.mqttc.subscribe.side_effect = [(0, 1), (0, 2)]
+        self.iot.on_connect(None, None, {}, 0)
+        self.iot.subscribe(['topicA', 'topicB'])
+        self.iot.subscribe('topicC')
+
+        self.iot.on_subscribe(None, None, 2, (1,))
+        self.assertFalse(self.iot.connflag)
+        self.iot.on_subscribe(None, None, 1, (1, 1))
+
+        self.assertTrue(self.iot.connflag)
+        self.assertGreaterEqual(self.iot.ready_seconds, 0)
+
+    def test_ready_after_reconnect_with_unacknowledged_subscription(self):
+        self.iot.mqttc = Mock()
+        self.iot.mqttc.subscribe.side_effect = [(0, 1), (0, 2)]
+        self.iot.on_connect(None, None, {}, 0)
+        self.iot.subscribe(['topicA', 'topicB'])
+        self.iot.on_disconnect(None, None, 7)
+
+        self.iot.on_connect(None, None, {}, 0)
+        self.iot.subscribe(['topicA', 'topicB'])
+        self.iot.on_subscribe(None, None, 2, (1, 1))
+
+        self.assertEqual(self.iot.subscriptions_ledger, {})
+        self.assertTrue(self.iot.connflag)
+
+    def test_publish_logs_size_and_mid_only_at_info(self):
+        self.iot.mqttc = Mock()
+        self.iot.mqttc.publish.return_value = Mock(mid=3)
+
+        with self.assertLogs("iot_assets.iot_client", level="INFO") as logs:
+            self.iot.publish("topicMock", "secretPayloadMock")
+
+        self.assertEqual(logs.output, ["INFO:iot_assets.iot_client:Published 17 bytes to topic: topicMock with mid 3"])
+
+    def test_payloads_are_sampled_at_debug(self):
+        iot_client = IoTClient(IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock",
+                                                "devicePrivateKeyPathMock", "amazonRootCaPathMock", "thingNameMock",
+                                                payload_log_sampling=3))
+        iot_client.mqttc = Mock()
+        iot_client.mqttc.publish.return_value = Mock(mid=1)
+
+        with self.assertLogs("iot_assets.iot_client", level="DEBUG") as logs:
+            for index in range(7):
+                iot_client.publish("topicMock", f"payload{index}" + "x" * 2000)
+
+        dumps = [record.getMessage() for record in logs.records if record.levelname == "DEBUG"]
+        self.assertEqual([dump[:len("Payload of mid 1: payload0")] for dump in dumps],
+                         ["Payload of mid 1: payload0", "Payload of mid 1: payload3", "Payload of mid 1: payload6"])
+        self.assertEqual(len(dumps[0]), len("Payload of mid 1: ") + IoTClient.payload_log_limit)
@@ -0,0 +1,49 @@
+import json
+import unittest
+
+from iot_assets.asset import Asset, AssetDetails
+from iot_assets.iot_client import IoTClientDetails
+from iot_assets.sender import Sender, SenderDetails
+from iot_messages.message_builder import GenericSignalV2Builder
+from iot_messages.serializer import serialize
+from tests.helpers import generic_signal_v2
+
+
+class GenericSignalV2BuilderTests(unittest.TestCase):
+    def setUp(self):
+        self.asset = Asset(AssetDetails('assetIdMock', 'assetHardwareVersionMock', 'assetManufacturerNameMock',
+                                        'assetNameMock', 'assetSerialMock', 'assetSoftwareVersionMock', 'BoxPacker',
+                                        'assetSubtypeMock'))
+        self.sender = Sender(SenderDetails("system", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                           "siteIdMock", "clientIdMock", "telemetryTopicMock"),
+                             IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock", "devicePrivateKeyPathMock",
+                                              "amazonRootCaPathMock", "thingNameMock"))
+        self.builder = GenericSignalV2Builder(self.asset, self.sender)
+
+    def test_build_matches_serializer(self):
+        signal = generic_signal_v2()
+        for name in ['assetid', 'assetserial', 'assethardwareversion', 'assetmanufacturername', 'assetname',
+                     'assetsoftwareversion', 'assetsubtype']:
+            setattr(signal, name, getattr(self.asset, name))
+        signal.sendername = self.sender.sendername
+        signal.sendersoftwareversion = self.sender.sendersoftwareversion
+
+        message = self.builder.build(signal.payload, signal.assettimestamp, signal.sendertimestamp,
+                                     signal.sendereventuuid)
+
+        self.assertEqual(json.loads(message), json.loads(serialize(signal)))
+
+    def test_defaults(self):
+        message = json.loads(self.builder.build(generic_signal_v2().payload))
+        other = json.loads(self.builder.build(generic_signal_v2().payload))
+
+        self.assertEqual(message['sendertimestamp'], message['assettimestamp'])
+        self.assertNotEqual(message['sendereventuuid'], other['sendereventuuid'])
+        self.assertNotIn('siteid', message)
+
+    def test_refresh(self):
+        self.asset.siteid = 'siteIdMock'
+        self.assertNotIn('siteid', json.loads(self.builder.build(generic_signal_v2().payload)))
+
+        self.builder.refresh()
+        self.assertEqual(json.loads(self.builder.build(generic_signal_v2().payload))['siteid'], 'siteIdMock')
@@ -0,0 +1,188 @@
+import json
+import random
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import Mock
+
+from event_validator.fast_validator import status_v2_validator_factory
+from event_validator.schema_validator import SchemaValidationException
+from iot_assets.iot_client import IoTClient, IoTClientDetails
+from iot_assets.publish_pipeline import PublishPipeline, PublishPipelineDetails
+from iot_assets.reconnect_supervisor import ReconnectPolicy
+from iot_assets.segment_log import SegmentLog
+from iot_assets.store_and_forward import StoreAndForward, StoreAndForwardDetails
+from iot_messages.serializer import serialize
+from metrics.exposition import MetricsServer, prometheus_text
+from metrics.registry import Histogram, MetricsRegistry, metrics_registry
+from tests.helpers import generic_signal_v2
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry(enabled=True)
+
+    def test_histogram_quantiles(self):
+        histogram = self.registry.histogram('latency_seconds')
+        values = [random.Random(index).uniform(0.0001, 2.0) for index in range(10000)]
+        for value in values:
+            histogram.observe(value)
+
+        values.sort()
+        for q in (0.5, 0.9, 0.99, 0.999):
+            expected = values[int(q * len(values)) - 1]
+            self.assertAlmostEqual(histogram.quantile(q), expected, delta=expected * 0.04)
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual((histogram.min, histogram.max), (values[0], values[-1]))
+
+    def test_histogram_bucket_bounds(self):
+        histogram = Histogram('bounds', '')
+        histogram.enabled = True
+        for micros in (0, 1, 63, 64, 65, 1000, 123456789):
+            lower, upper = histogram._bounds(histogram._index(micros))
+            self.assertTrue(lower <= micros < upper, micros)
+            histogram.reset()
+            histogram.observe(micros / 1e6)
+            self.assertEqual(histogram._buckets, {histogram._index(micros): 1}, micros)
+
+    def test_disabled_instruments_do_not_record(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('events_total')
+        histogram = registry.histogram('latency_seconds')
+        counter.inc()
+        histogram.observe(1.0)
+        self.assertEqual((counter.value, histogram.count), (0, 0))
+
+        registry.enable()
+        counter.inc(2)
+        with histogram.time():
+            pass
+        self.assertEqual((counter.value, histogram.count), (2, 1))
+
+    def test_instruments_are_registered_once(self):
+        self.assertIs(self.registry.counter('events_total'), self.registry.counter('events_total'))
+        with self.assertRaises(ValueError):
+            self.registry.histogram('events_total')
+
+    def test_snapshot(self):
+        self.registry.counter('events_total').inc(3)
+        self.registry.gauge('queue_size', function=lambda: 7)
+        self.registry.histogram('latency_seconds').observe(0.25)
+
+        snapshot = self.registry.snapshot()
+
+        self.assertEqual(snapshot['events_total'], {'type': 'counter', 'value': 3})
+        self.assertEqual(snapshot['queue_size'], {'type': 'gauge', 'value': 7})
+        self.assertEqual(snapshot['latency_seconds']['count'], 1)
+        self.assertAlmostEqual(snapshot['latency_seconds']['p99'], 0.25, delta=0.01)
+
+    def test_prometheus_text(self):
+        self.registry.counter('events_total', 'Events\nseen').inc(3)
+        self.registry.histogram('latency_seconds').observe(0.5)
+
+        text = prometheus_text(self.registry)
+
+        self.assertIn('# HELP events_total Events\\nseen\n# TYPE events_total counter\nevents_total 3\n', text)
+        self.assertIn('# TYPE latency_seconds summary\n', text)
+        self.assertIn('latency_seconds{quantile="0.99"} 0.5', text)
+        self.assertIn('latency_seconds_sum 0.5\nlatency_seconds_count 1\n', text)
+
+    def test_metrics_server(self):
+        self.registry.counter('events_total').inc()
+        server = MetricsServer(self.registry, port=0).start()
+        self.addCleanup(server.stop)
+
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics') as response:
+            self.assertEqual(response.headers['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+            self.assertIn('events_total 1', response.read().decode('utf-8'))
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'http://127.0.0.1:{server.port}/other')
+
+
+class InstrumentationTests(unittest.TestCase):
+    def setUp(self):
+        registry = metrics_registry()
+        registry.reset()
+        registry.enable()
+        self.addCleanup(registry.reset)
+        self.addCleanup(registry.disable)
+        self.snapshot = registry.snapshot
+
+    def test_serialize_and_validate(self):
+        message = generic_signal_v2()
+        serialize(message)
+        status_v2_validator_factory().validate(message)
+        message.eventtype = 'other'
+        with self.assertRaises(SchemaValidationException):
+            status_v2_validator_factory().validate(message)
+
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot['iot_serialize_seconds']['count'], 1)
+        self.assertEqual(snapshot['iot_validate_seconds']['count'], 2)
+        self.assertEqual(snapshot['iot_validation_failures_total']['value'], 1)
+
+    def test_publish_to_puback(self):
+        iot_client = IoTClient(IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock",
+                                                "devicePrivateKeyPathMock", "amazonRootCaPathMock", "thingNameMock"))
+        iot_client.mqttc = Mock()
+        iot_client.mqttc.publish.return_value = Mock(mid=1)
+        iot_client.publish('topicMock', 'payloadMock')
+        iot_client.on_publish(None, None, 1)
+
+        # the PUBACK of the second message arrives before publish returned its mid
+        iot_client.mqttc.publish.side_effect = lambda *args, **kwargs: (iot_client.on_publish(None, None, 2),
+                                                                        Mock(mid=2))[1]
+        iot_client.publish('topicMock', json.dumps({'a': 1}))
+
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot['iot_publish_seconds']['count'], 2)
+        self.assertEqual(snapshot['iot_puback_seconds']['count'], 2)
+        self.assertEqual(snapshot['iot_published_messages_total']['value'], 2)
+        self.assertEqual(snapshot['iot_published_bytes_total']['value'], 19)
+
+    def test_reconnect(self):
+        now = [10.0]
+        policy = ReconnectPolicy(clock=lambda: now[0])
+        policy.connection_lost()
+        policy.attempt_failed()
+        now[0] = 12.0
+        policy.connected()
+
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot['iot_disconnects_total']['value'], 1)
+        self.assertEqual(snapshot['iot_reconnect_failures_total']['value'], 1)
+        self.assertAlmostEqual(snapshot['iot_reconnect_seconds']['p50'], 2.0, delta=0.05)
+
+    def test_publish_pipeline(self):
+        snapshot = self.snapshot()
+        queued, in_flight = snapshot['iot_publish_queue_depth']['value'], snapshot['iot_publish_in_flight']['value']
+        iot_client = Mock()
+        iot_client.publish.return_value = Mock(mid=1)
+        pipeline = PublishPipeline(iot_client, PublishPipelineDetails())
+        pipeline.submit('topicMock', 'message0')
+        pipeline.submit('topicMock', 'message1')
+        pipeline._publish('topicMock', 'message2')
+
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot['iot_publish_queue_depth']['value'], queued + 2)
+        self.assertEqual(snapshot['iot_publish_in_flight']['value'], in_flight + 1)
+
+    def test_store_and_forward(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backlog = self.snapshot()['iot_store_and_forward_backlog_messages']['value']
+        store_and_forward = StoreAndForward(StoreAndForwardDetails(f'{directory.name}/buffer'), Mock(), lambda: False)
+        self.addCleanup(store_and_forward.stop)
+        store_and_forward.store('message0', connected=False)
+        store_and_forward.store('message1', connected=False)
+        log = SegmentLog(f'{directory.name}/evicting', segment_size=40, max_bytes=100)
+        self.addCleanup(log.close)
+        for index in range(10):
+            log.append(f'message{index}'.encode())
+
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot['iot_store_and_forward_backlog_messages']['value'], backlog + 2)
+        self.assertGreater(snapshot['iot_store_and_forward_backlog_bytes']['value'], 0)
+        self.assertGreater(log.evicted_messages, 0)
+        self.assertEqual(snapshot['iot_store_and_forward_evicted_total']['value'], log.evicted_messages)
@@ -0,0 +1,155 @@
+import itertools
+import threading
+import unittest
+from unittest.mock import Mock
+
+from iot_assets.iot_client import IoTClientDetails
+from iot_assets.publish_pipeline import PublishPipeline, PublishPipelineDetails, DROP_NEWEST, DROP_OLDEST
+from iot_assets.sender import Sender, SenderDetails
+
+
+class IoTClientStub:
+    def __init__(self):
+        self.mids = itertools.count(1)
+        self.published = []
+        self.on_publish = Mock()
+        self.on_disconnect = Mock()
+        self.publish_callback = None  # simulates a PUBACK which arrives before publish returns
+
+    def publish(self, topic, message):
+        self.published.append((topic, message))
+        mid = next(self.mids)
+        if self.publish_callback is not None:
+            self.publish_callback(mid)
+        return Mock(mid=mid)
+
+
+class PublishPipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.iot_client = IoTClientStub()
+
+    def test_messages_are_published_by_worker(self):
+        pipeline = PublishPipeline(self.iot_client, PublishPipelineDetails())
+        pipeline.start()
+        for index in range(10):
+            pipeline.submit('topicMock', f'message{index}')
+        pipeline.stop(timeout=5)
+
+        self.assertEqual(self.iot_client.published, [('topicMock', f'message{index}') for index in range(10)])
+        self.assertEqual(pipeline.queue_depth, 0)
+        self.assertEqual(pipeline.in_flight, 10)
+
+    def test_puback_tracking(self):
+        pipeline = PublishPipeline(self.iot_client, PublishPipelineDetails())
+        pipeline.start()
+        pipeline.submit('topicMock', 'message1')
+        pipeline.submit('topicMock', 'message2')
+        pipeline.stop(timeout=5)
+
+        self.iot_client.on_publish(None, None, 1)
+        self.iot_client.publish_callback = lambda mid: self.iot_client.on_publish(None, None, mid)
+        pipeline._publish('topicMock', 'message3')  # acknowledged before publish returned
+
+        self.assertEqual(pipeline.in_flight, 1)
+        self.assertEqual(pipeline.acknowledged, 2)
+
+    def test_acknowledgements_outside_of_a_publish_are_not_kept(self):
+        pipeline = PublishPipeline(self.iot_client, PublishPipelineDetails())
+        self.iot_client.on_publish(None, None, 1)  # a message published outside of the pipeline
+        self.iot_client.publish_callback = lambda mid: self.iot_client.on_publish(None, None, 7)
+        pipeline._publish('topicMock', 'message1')
+        self.iot_client.publish_callback = None
+        self.iot_client.mids = itertools.count(7)  # the message ids wrapped around
+        pipeline._publish('topicMock', 'message2')
+
+        self.assertEqual(pipeline.in_flight, 2)
+        self.assertEqual(pipeline.acknowledged, 0)
+
+    def test_acknowledgement_while_the_mid_is_read(self):
+        pipeline = PublishPipeline(self.iot_client, PublishPipelineDetails())
+        iot_client = self.iot_client
+
+        class MessageInfo:
+            @property
+            def mid(self):
+                iot_client.on_publish(None, None, 5)
+                return 5
+
+        self.iot_client.publish = lambda topic, message: MessageInfo()
+        pipeline._publish('topicMock', 'message1')
+
+        self.assertEqual(pipeline.in_flight, 0)
+        self.assertEqual(pipeline.acknowledged, 1)
+
+    def test_disconnect_forgets_in_flight_messages(self):
+        pipeline = PublishPipeline(self.iot_client, PublishPipelineDetails())
+        pipeline._publish('topicMock', 'message1')
+        self.iot_client.on_disconnect(None, None, 7)
+        self.iot_client.on_publish(None, None, 1)
+
+        self.assertEqual(pipeline.in_flight, 0)
+        self.assertEqual(pipeline.acknowledged, 0)
+
+    def test_drop_newest(self):
+        pipeline = PublishPipeline(self.iot_client, PublishPipelineDetails(max_queue_size=2, backpressure=DROP_NEWEST))
+
+        results = [pipeline.submit('topicMock', f'message{index}') for index in range(3)]
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual([message for _, message in pipeline._queue], ['message0', 'message1'])
+        self.assertEqual(pipeline.dropped, 1)
+
+    def test_drop_oldest(self):
+        pipeline = PublishPipeline(self.iot_client, PublishPipelineDetails(max_queue_size=2, backpressure=DROP_OLDEST))
+
+        results = [pipeline.submit('topicMock', f'message{index}') for index in range(3)]
+
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual([message for _, message in pipeline._queue], ['message1', 'message2'])
+        self.assertEqual(pipeline.dropped, 1)
+
+    def test_block_until_timeout(self):
+        pipeline = PublishPipeline(self.iot_client, PublishPipelineDetails(max_queue_size=1, block_timeout=0.01))
+
+        self.assertTrue(pipeline.submit('topicMock', 'message1'))
+        self.assertFalse(pipeline.submit('topicMock', 'message2'))
+        self.assertEqual(pipeline.dropped, 1)
+
+    def test_blocked_producer_continues_when_worker_drains(self):
+        pipeline = PublishPipeline(self.iot_client, PublishPipelineDetails(max_queue_size=1))
+        pipeline.submit('topicMock', 'message1')
+        producer = threading.Thread(target=pipeline.submit, args=('topicMock', 'message2'))
+        producer.start()
+
+        pipeline.start()
+        producer.join(timeout=5)
+        pipeline.stop(timeout=5)
+
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(len(self.iot_client.published), 2)
+
+    def test_invalid_backpressure(self):
+        self.assertRaises(ValueError, PublishPipeline, self.iot_client, PublishPipelineDetails(backpressure='x'))
+
+
+class SenderPublishPipelineTests(unittest.TestCase):
+    def test_publish_telemetry_uses_pipeline(self):
+        sender_details = SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                       "siteIdMock", "clientIdMock", "telemetryTopicMock",
+                                       publish_pipeline=PublishPipelineDetails())
+        sender = Sender(sender_details, IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock",
+                                                         "devicePrivateKeyPathMock", "amazonRootCaPathMock",
+                                                         "thingNameMock"))
+        sender.iot_client.connflag = True
+        sender.iot_client.mqttc = Mock()
+        sender.iot_client.mqttc.publish.return_value = Mock(mid=1)
+        sender.state = {"sendTelemetryData": True}
+
+        sender.connect()
+        sender.publish_telemetry("mockMessage")
+        sender.disconnect(timeout=5)
+
+        sender.iot_client.mqttc.publish.assert_called_with('telemetryTopicMock/orgIdMock/clientIdMock',
+                                                           "mockMessage", qos=1)
+        sender.iot_client.mqttc.on_publish(None, None, 1)
+        self.assertEqual(sender.publish_pipeline.in_flight, 0)
@@ -0,0 +1,164 @@
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from benchmarks.stub_broker import StubBroker, generate_credentials
+from iot_assets.iot_client import IoTClient, IoTClientDetails
+from iot_assets.reconnect_supervisor import CLOSED, HALF_OPEN, OPEN, ReconnectPolicy, ReconnectPolicyDetails, \
+    ReconnectSupervisor
+from iot_assets.sender import Sender, SenderDetails
+from tests.helpers import wait_for
+
+
+class ReconnectPolicyTests(unittest.TestCase):
+    def test_full_jitter_backoff(self):
+        policy = ReconnectPolicy(ReconnectPolicyDetails(base_delay=1.0, max_delay=5.0, failure_threshold=100),
+                                 random_func=lambda: 1.0)
+        delays = []
+        for _ in range(5):
+            delays.append(policy.next_delay())
+            policy.attempt_failed()
+
+        self.assertEqual(delays, [1.0, 2.0, 4.0, 5.0, 5.0])
+        self.assertEqual(ReconnectPolicy(random_func=lambda: 0.25).next_delay(), 0.25)
+
+    def test_circuit_breaker(self):
+        policy = ReconnectPolicy(ReconnectPolicyDetails(base_delay=1.0, failure_threshold=2, open_duration=60.0),
+                                 random_func=lambda: 0.0)
+        policy.attempt_failed()
+        self.assertEqual(policy.state, CLOSED)
+        policy.attempt_failed()
+        self.assertEqual(policy.state, OPEN)
+
+        self.assertEqual(policy.next_delay(), 60.0)
+        self.assertEqual(policy.state, HALF_OPEN)
+        policy.attempt_failed()
+        self.assertEqual(policy.state, OPEN)
+
+        policy.next_delay()
+        policy.connected()
+        self.assertEqual(policy.state, CLOSED)
+        self.assertEqual(policy.failures, 0)
+
+    def test_time_to_reconnect(self):
+        now = [100.0]
+        policy = ReconnectPolicy(clock=lambda: now[0])
+        policy.connected()
+        policy.connection_lost()
+        now[0] = 102.5
+        policy.connection_lost()
+        now[0] = 104.0
+        policy.connected()
+
+        stats = policy.stats()
+        self.assertEqual((stats.disconnects, stats.reconnects, stats.last_seconds), (1, 1, 4.0))
+
+
+class ReconnectSupervisorUnitTests(unittest.TestCase):
+    def test_unexpected_reconnect_error_counts_as_failed_attempt(self):
+        supervisor = ReconnectSupervisor()
+        iot_client = Mock(client_id='thingMock')
+        iot_client.mqttc.reconnect.side_effect = ValueError('Invalid host.')
+        policy = ReconnectPolicy(random_func=lambda: 0.0)
+
+        supervisor._reconnect(iot_client, policy)
+
+        self.assertEqual(policy.failed_attempts, 1)
+        self.assertEqual(len(supervisor._due), 1)
+        iot_client.mqttc.loop_start.assert_not_called()
+
+
+class ReconnectSupervisorTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.credentials = generate_credentials(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.broker = StubBroker(self.credentials).start()
+        self.addCleanup(lambda: self.broker.stop())
+
+    def client_details(self, clean_session=True):
+        return IoTClientDetails("localhost", self.broker.port, self.credentials['client_cert'],
+                                self.credentials['client_key'], self.credentials['ca'], "thingMock",
+                                clean_session=clean_session, reconnect=ReconnectPolicyDetails(base_delay=0.05))
+
+    def test_reconnect_after_broker_restart(self):
+        iot_client = IoTClient(self.client_details())
+        connected = threading.Event()
+        iot_client.on_connect = lambda client, userdata, flags, result_code: connected.set()
+        iot_client.connect()
+        self.addCleanup(iot_client.mqttc.loop_stop)
+        self.assertTrue(connected.wait(5))
+        connected.clear()
+        first_thread = iot_client.mqttc._thread
+
+        port = self.broker.port
+        self.broker.stop()
+        wait_for(lambda: iot_client.reconnect_policy.failed_attempts >= 2)
+        self.broker = StubBroker(self.credentials, port=port).start()
+
+        self.assertTrue(connected.wait(10))
+        stats = iot_client.reconnect_policy.stats()
+        self.assertEqual((stats.disconnects, stats.reconnects), (1, 1))
+        self.assertGreater(stats.last_seconds, 0)
+        self.assertFalse(first_thread.is_alive())
+        self.assertTrue(iot_client.mqttc._thread.is_alive())
+        iot_client.disconnect()
+
+    def test_disconnect_during_delay_cancels_reconnect(self):
+        iot_client = IoTClient(self.client_details())
+        connected = threading.Event()
+        iot_client.on_connect = lambda client, userdata, flags, result_code: connected.set()
+        iot_client.connect()
+        self.addCleanup(iot_client.mqttc.loop_stop)
+        self.assertTrue(connected.wait(5))
+        iot_client.reconnect_policy._random = lambda: 6.0  # 0.3 seconds delay
+
+        self.broker.disconnect_all()
+        wait_for(lambda: iot_client.reconnect_policy.disconnects == 1)
+        iot_client.disconnect()
+        time.sleep(0.6)
+
+        self.assertEqual(self.broker.connect_count, 1)
+        self.assertEqual(iot_client.reconnect_policy.reconnects, 0)
+        self.assertIsNone(iot_client.mqttc._thread)
+
+    def test_ready_after_reconnect_before_suback(self):
+        self.broker.stop()
+        self.broker = StubBroker(self.credentials, ack_delay=0.2).start()
+        sender = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                      "siteIdMock", "clientIdMock", "telemetry"),
+                        self.client_details())
+        sender.connect()
+        self.addCleanup(sender.iot_client.mqttc.loop_stop)
+        wait_for(lambda: self.broker.subscribe_count == 1)
+
+        self.broker.disconnect_all()  # before the SUBACK was sent
+        wait_for(lambda: sender.iot_client.reconnect_policy.reconnects == 1)
+        wait_for(lambda: sender.iot_client.connflag)
+
+        self.assertEqual(sender.iot_client.subscriptions_ledger, {})
+        sender.disconnect()
+
+    def test_persistent_session_skips_resubscription(self):
+        sender = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                      "siteIdMock", "clientIdMock", "telemetry"),
+                        self.client_details(clean_session=False))
+        sender.connect()
+        self.addCleanup(sender.iot_client.mqttc.loop_stop)
+        wait_for(lambda: sender.iot_client.connflag)
+
+        self.broker.disconnect_all()
+        wait_for(lambda: sender.iot_client.reconnect_policy.reconnects == 1)
+        wait_for(lambda: sender.iot_client.connflag)
+
+        self.assertEqual(self.broker.subscribe_count, 1)
+        self.assertEqual(self.broker.connect_count, 2)
+        sender.disconnect()
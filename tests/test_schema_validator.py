@@ -0,0 +1,104 @@
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from event_validator.schema_validator import EventValidator, SchemaRegistry, SchemaValidationException, PATHS
+from tests.helpers import generic_signal_status_message
+
+
+class SchemaRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = SchemaRegistry(PATHS)
+
+    def test_schema_is_loaded_once(self):
+        with patch.object(EventValidator, 'load_json', wraps=EventValidator.load_json) as load_mock:
+            first = self.registry.header_validator(3)
+            second = self.registry.header_validator(3)
+
+        self.assertIs(first, second)
+        self.assertEqual(load_mock.call_count, 1)
+        self.assertEqual(self.registry.cache_info(), (1, 1, 1))
+
+    def test_preload(self):
+        cached = self.registry.preload()
+
+        self.assertEqual(cached, 3)
+        self.registry.payload_validator('generic.signal', 'Status', 2)
+        self.assertEqual(self.registry.cache_info().misses, 3)
+        self.assertEqual(self.registry.cache_info().hits, 1)
+
+    def test_unknown_schema(self):
+        self.assertRaises(SchemaValidationException, self.registry.payload_validator, 'generic.signal', 'Unknown', 1)
+
+
+class EventValidatorTests(unittest.TestCase):
+    def setUp(self):
+        self.validator = EventValidator(PATHS)
+
+    def test_valid_message(self):
+        self.validator.validate(json.dumps(generic_signal_status_message()))
+        self.validator.validate(json.dumps(generic_signal_status_message()))
+
+        self.assertEqual(self.validator.registry.cache_info(), (2, 2, 2))
+
+    def test_invalid_header(self):
+        message = generic_signal_status_message()
+        message['assettype'] = 'UnknownAssetType'
+
+        self.assertRaises(SchemaValidationException, self.validator.validate, json.dumps(message))
+
+    def test_missing_payload_schema(self):
+        message = generic_signal_status_message()
+        message['payloadversion'] = 99
+
+        self.assertRaises(SchemaValidationException, self.validator.validate, json.dumps(message))
+
+    def test_validate_many(self):
+        valid = generic_signal_status_message()
+        invalid_header = generic_signal_status_message()
+        invalid_header['sendertype'] = 'unknown'
+        unknown_payload = generic_signal_status_message()
+        unknown_payload['payloadversion'] = 99
+
+        errors = self.validator.validate_many([json.dumps(valid), json.dumps(valid).encode(), valid,
+                                               invalid_header, unknown_payload, '{no json', 42])
+
+        self.assertEqual(sorted(errors), [3, 4, 5, 6])
+        self.assertIn('sendertype', errors[3][0])
+        self.assertEqual(errors[4], ['payload schema not available: generic.signal/Status/99'])
+        self.assertTrue(errors[5][0].startswith('invalid json'))
+        self.assertEqual(errors[6], ['message is not a json object'])
+        self.assertEqual(self.validator.registry.cache_info().misses, 3)
+
+    def test_validate_many_unhashable_schema_keys(self):
+        valid = generic_signal_status_message()
+        list_header = generic_signal_status_message()
+        list_header['headerversion'] = [3]
+        dict_payload = generic_signal_status_message()
+        dict_payload['eventsubtype'] = {'name': 'Status'}
+
+        errors = self.validator.validate_many([list_header, valid, dict_payload])
+
+        self.assertEqual(errors, {0: ['headerversion must be a string or number'],
+                                  2: ['eventsubtype must be a string or number']})
+
+    def test_concurrent_validation(self):
+        valid = json.dumps(generic_signal_status_message())
+        invalid = generic_signal_status_message()
+        invalid['assettype'] = 'UnknownAssetType'
+        invalid = json.dumps(invalid)
+
+        def validate(index):
+            message = invalid if index % 3 == 0 else valid
+            try:
+                self.validator.validate(message)
+                return message is valid
+            except SchemaValidationException:
+                return message is invalid
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(validate, range(600)))
+
+        self.assertTrue(all(results))
+        self.assertEqual(self.validator.registry.cache_info().size, 2)
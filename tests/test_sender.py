@@ -36,3 +36,36 @@ class SenderTests(unittest.TestCase):
         sender.iot_client.publish.assert_called_with(f'{self.sender_details.telemetry_topic}/'
                                                      f'{self.sender_details.org_id}/{self.sender_details.client_id}',
                                                      "mockMessage")
+
+
+class SenderStateTests(unittest.TestCase):
+    def setUp(self):
+        self.sender = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock",
+                                           "orgIdMock", "siteIdMock", "clientIdMock", "telemetryTopicMock"),
+                             IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock",
+                                              "devicePrivateKeyPathMock", "amazonRootCaPathMock", "thingNameMock"))
+
+    def test_state_is_an_immutable_snapshot(self):
+        new_state = {"sendTelemetryData": True, "config": {"interval": 10}, "assets": ["a"]}
+        self.sender.state = new_state
+        new_state["config"]["interval"] = 20
+        snapshot = self.sender.state_snapshot
+
+        self.assertEqual(self.sender.state["config"], {"interval": 10})
+        self.assertEqual(self.sender.state["assets"], ("a",))
+        self.assertTrue(snapshot.telemetry_enabled)
+        with self.assertRaises(TypeError):
+            self.sender.state["config"]["interval"] = 30
+
+        self.sender.state = {"sendTelemetryData": False}
+        self.assertTrue(snapshot.telemetry_enabled)
+        self.assertFalse(self.sender.state_snapshot.telemetry_enabled)
+
+    def test_changed_since(self):
+        version = self.sender.state_snapshot.version
+        self.assertFalse(self.sender.changed_since(version))
+
+        self.sender.set_state({"sendTelemetryData": True})
+
+        self.assertTrue(self.sender.changed_since(version))
+        self.assertFalse(self.sender.changed_since(self.sender.state_snapshot.version))
@@ -0,0 +1,32 @@
+import json
+import unittest
+from dataclasses import asdict
+from unittest.mock import patch
+
+import iot_messages.generic_signal_v2 as gen_sig_v2
+from iot_messages import serializer
+from tests.helpers import drop_none, generic_signal_v2
+
+
+class SerializerTests(unittest.TestCase):
+    def test_serialize_matches_asdict(self):
+        signal = generic_signal_v2()
+
+        serialized = serializer.serialize(signal)
+
+        self.assertIsInstance(serialized, bytes)
+        self.assertEqual(json.loads(serialized), drop_none(asdict(signal)))
+
+    def test_none_fields_are_omitted(self):
+        device_info = gen_sig_v2.GenericSignalDeviceInfo(100, 'Production', 'statusDetailsMock', 1)
+
+        self.assertEqual(serializer.to_dict(device_info), {"speed": 100, "status": "Production",
+                                                           "statusdetails": "statusDetailsMock",
+                                                           "totalproductioncounter": 1})
+
+    def test_standard_library_backend(self):
+        signal = generic_signal_v2()
+        expected = serializer.serialize(signal)
+
+        with patch.object(serializer, 'orjson', None):
+            self.assertEqual(serializer.serialize(signal), expected)
@@ -1,10 +1,15 @@
 import json
+import os
+import tempfile
 import unittest
 from dataclasses import dataclass
 from unittest.mock import Mock
 
 from iot_assets.iot_client import IoTClientDetails
 from iot_assets.sender import Sender, SenderDetails
+from iot_assets.shadow_callback_handler import ShadowCallbackHandler, ShadowDetails
+from iot_assets.topic_router import TopicRouter
+from tests.helpers import wait_for
 
 
 @dataclass
@@ -65,3 +70,182 @@ class TestShadowCallbackHandler(unittest.TestCase):
             Message(topic=self.update_accepted_topic, payload=payload))
 
         self.sender.iot_client.publish.assert_called_with(self.update_topic, expected)
+
+    def test_other_shadow_topics_are_not_routed_to_state_change(self):
+        handler = self.sender.shadow_callback_handler
+        prefix = f"$aws/things/{self.sender.client_id}/shadow/"
+
+        self.assertEqual(handler.route(Message(topic=prefix + "get/rejected", payload="{}")),
+                         handler.on_shadow_rejected)
+        self.assertEqual(handler.route(Message(topic=prefix + "update/delta", payload="{}")),
+                         handler.on_shadow_delta)
+        self.assertIsNone(handler.route(Message(topic="$aws/things/otherThing/shadow/get/accepted", payload="{}")))
+
+    def test_shared_router(self):
+        other = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                     "siteIdMock", "otherClientMock", "telemetryTopicMock"), self.iot_client_details)
+        router = TopicRouter()
+        first = ShadowCallbackHandler(self.sender.iot_client, self.sender, router)
+        second = ShadowCallbackHandler(other.iot_client, other, router)
+
+        self.assertEqual(len(router), 10)
+        self.assertEqual(first.route(Message(topic="$aws/things/otherClientMock/shadow/get/accepted", payload="{}")),
+                         second.on_shadow_get_accepted)
+
+    def test_delta_is_merged_and_only_changes_are_reported(self):
+        self.sender.state = {"sendTelemetryData": True, "interval": 10, "config": {"a": 1, "b": 2}}
+        delta = json.dumps({"version": 5, "state": {"interval": 20, "config": {"b": 3}}})
+
+        self.sender.iot_client.on_message(
+            None, None, Message(topic=f"$aws/things/{self.sender.client_id}/shadow/update/delta", payload=delta))
+
+        self.assertEqual(self.sender.get_state(),
+                         {"sendTelemetryData": True, "interval": 20, "config": {"a": 1, "b": 3}})
+        self.sender.iot_client.publish.assert_called_once_with(
+            self.update_topic, json.dumps({"state": {"reported": {"interval": 20, "config": {"b": 3}}}}))
+
+    def test_stale_versions_are_dropped(self):
+        delta_topic = f"$aws/things/{self.sender.client_id}/shadow/update/delta"
+        for version, value in ((7, "new"), (6, "old"), (7, "duplicate")):
+            self.sender.iot_client.on_message(
+                None, None, Message(topic=delta_topic,
+                                    payload=json.dumps({"version": version, "state": {"foo": value}})))
+
+        self.assertEqual(self.sender.get_state(), {"foo": "new"})
+        self.assertEqual(self.sender.iot_client.publish.call_count, 1)
+
+    def test_none_removes_key(self):
+        self.sender.state = {"foo": "bar", "keep": True}
+        payload = json.dumps({"state": {"desired": {"foo": None}}})
+
+        self.sender.iot_client.on_message(None, None, Message(topic=self.update_accepted_topic, payload=payload))
+
+        self.assertEqual(self.sender.get_state(), {"keep": True})
+        self.sender.iot_client.publish.assert_called_with(self.update_topic,
+                                                          json.dumps({"state": {"reported": {"foo": None}}}))
+
+    def test_get_accepted_reports_difference_to_shadow(self):
+        self.sender.state = {"sendTelemetryData": True, "local": 1}
+        payload = json.dumps({"version": 3, "state": {"desired": {"sendTelemetryData": True},
+                                                      "reported": {"sendTelemetryData": True, "stale": 1}}})
+
+        self.sender.iot_client.on_message(None, None, Message(topic=self.get_accepted_topic, payload=payload))
+
+        self.sender.iot_client.publish.assert_called_once_with(
+            self.update_topic, json.dumps({"state": {"reported": {"local": 1, "stale": None}}}))
+        self.assertEqual(self.sender.shadow_callback_handler.shadow_version, 3)
+
+
+class TestReportWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.sender = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock",
+                                           "orgIdMock", "siteIdMock", "clientIdMock", "telemetryTopicMock",
+                                           shadow=ShadowDetails(report_window_ms=50)),
+                             IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock",
+                                              "devicePrivateKeyPathMock", "amazonRootCaPathMock", "thingNameMock"))
+        self.sender.iot_client.publish = Mock()
+        self.update_topic = f"$aws/things/{self.sender.client_id}/shadow/update"
+
+    def test_changes_within_window_are_coalesced(self):
+        self.sender.set_state({"a": 1})
+        self.sender.set_state({"a": 2, "b": 1})
+        self.sender.set_state({"b": 1, "c": True})
+        self.sender.iot_client.publish.assert_not_called()
+
+        wait_for(lambda: self.sender.iot_client.publish.called)
+        self.sender.iot_client.publish.assert_called_once_with(
+            self.update_topic, json.dumps({"state": {"reported": {"b": 1, "c": True}}}))
+
+    def test_unchanged_state_is_not_reported(self):
+        self.sender.shadow_callback_handler.reported_state = {"a": 1}
+        self.sender.set_state({"a": 2})
+        self.sender.set_state({"a": 1})
+
+        self.sender.shadow_callback_handler.flush_reported_state()
+
+        self.sender.iot_client.publish.assert_not_called()
+        self.assertEqual(self.sender.shadow_callback_handler.suppressed_reports, 1)
+
+    def test_acknowledged_report_is_recorded(self):
+        handler = self.sender.shadow_callback_handler
+        handler.on_desired_stage_change(json.dumps({"version": 2, "state": {"reported": {"a": 1}}}))
+        self.sender.state = {"a": 1}
+
+        self.sender.set_state({"a": 1})
+        handler.flush_reported_state()
+
+        self.sender.iot_client.publish.assert_not_called()
+
+    def test_disconnect_flushes_pending_report(self):
+        self.sender.iot_client.disconnect = Mock()
+        self.sender.set_state({"a": 1})
+
+        self.sender.disconnect()
+
+        self.sender.iot_client.publish.assert_called_once_with(
+            self.update_topic, json.dumps({"state": {"reported": {"a": 1}}}))
+
+
+class TestStatePersistence(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state_file = os.path.join(directory.name, "certificate_store", "shadow_state.json")
+
+    def create_sender(self):
+        sender = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                      "siteIdMock", "clientIdMock", "telemetryTopicMock",
+                                      shadow=ShadowDetails(state_file=self.state_file)),
+                        IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock", "devicePrivateKeyPathMock",
+                                         "amazonRootCaPathMock", "thingNameMock"))
+        sender.iot_client.publish = Mock()
+        return sender
+
+    def test_warm_start(self):
+        sender = self.create_sender()
+        delta_topic = f"$aws/things/{sender.client_id}/shadow/update/delta"
+        sender.iot_client.on_message(None, None, Message(
+            topic=delta_topic, payload=json.dumps({"version": 4, "state": {"sendTelemetryData": True}})))
+
+        restarted = self.create_sender()
+        restarted.iot_client.connflag = True
+        restarted.publish_telemetry("mockMessage")
+
+        self.assertEqual(restarted.get_state(), {"sendTelemetryData": True})
+        self.assertEqual(restarted.shadow_callback_handler.shadow_version, 4)
+        restarted.iot_client.publish.assert_called_once_with(
+            f"telemetryTopicMock/orgIdMock/{restarted.client_id}", "mockMessage")
+
+        restarted.iot_client.on_message(None, None, Message(
+            topic=delta_topic, payload=json.dumps({"version": 3, "state": {"sendTelemetryData": False}})))
+        self.assertTrue(restarted.state_snapshot.telemetry_enabled)
+
+    def test_get_accepted_reconciles_stored_state(self):
+        sender = self.create_sender()
+        sender.iot_client.on_message(None, None, Message(
+            topic=f"$aws/things/{sender.client_id}/shadow/get/accepted",
+            payload=json.dumps({"version": 9, "state": {"desired": {"sendTelemetryData": True, "interval": 5}}})))
+
+        restarted = self.create_sender()
+        restarted.iot_client.on_message(None, None, Message(
+            topic=f"$aws/things/{sender.client_id}/shadow/get/accepted",
+            payload=json.dumps({"version": 2, "state": {"desired": {"interval": 10},
+                                                        "reported": {"sendTelemetryData": True, "interval": 5}}})))
+
+        self.assertEqual(restarted.get_state(), {"sendTelemetryData": True, "interval": 10})
+        with open(self.state_file) as state_file:
+            self.assertEqual(json.load(state_file), {"version": 2, "state": {"sendTelemetryData": True,
+                                                                             "interval": 10}})
+
+    def test_corrupt_state_file_is_ignored(self):
+        os.makedirs(os.path.dirname(self.state_file))
+        with open(self.state_file, "w") as state_file:
+            state_file.write("{corrupt")
+
+        with self.assertLogs("iot_assets.shadow_callback_handler", level="WARNING"):
+            sender = self.create_sender()
+
+        self.assertEqual(sender.get_state(), {})
+        self.assertIsNone(sender.shadow_callback_handler.shadow_version)
@@ -0,0 +1,23 @@
+import unittest
+
+from iot_assets.shadow_state import merge_state, state_changes
+
+
+class ShadowStateTests(unittest.TestCase):
+    def test_merge_state(self):
+        state = {"a": 1, "nested": {"b": 2, "c": 3}, "d": 4}
+
+        merged = merge_state(state, {"a": 5, "nested": {"c": None, "e": {"f": None, "g": 6}}, "d": None})
+
+        self.assertEqual(merged, {"a": 5, "nested": {"b": 2, "e": {"g": 6}}})
+        self.assertEqual(state, {"a": 1, "nested": {"b": 2, "c": 3}, "d": 4})
+
+    def test_state_changes(self):
+        old = {"a": 1, "nested": {"b": 2, "c": 3}, "d": 4, "flag": 1}
+        new = {"a": 1, "nested": {"b": 2, "c": 5}, "e": 6, "flag": True}
+
+        changes = state_changes(old, new)
+
+        self.assertEqual(changes, {"nested": {"c": 5}, "e": 6, "flag": True, "d": None})
+        self.assertEqual(merge_state(old, changes), new)
+        self.assertEqual(state_changes(new, new), {})
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock
+
+from iot_assets.iot_client import IoTClientDetails
+from iot_assets.segment_log import SegmentLog
+from iot_assets.sender import Sender, SenderDetails
+from iot_assets.store_and_forward import StoreAndForwardDetails
+
+
+class SegmentLogTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_fifo_across_segments(self):
+        log = SegmentLog(self.directory.name, segment_size=64)
+        for index in range(10):
+            log.append(f'message{index}'.encode())
+
+        messages = log.read(100)
+
+        self.assertEqual([message for _, message in messages], [f'message{index}'.encode() for index in range(10)])
+        self.assertGreater(len(os.listdir(self.directory.name)), 2)
+        self.assertEqual(len(log), 10)
+
+    def test_commit_and_reopen(self):
+        log = SegmentLog(self.directory.name, segment_size=64)
+        for index in range(6):
+            log.append(f'message{index}'.encode())
+        messages = log.read(4)
+        log.commit(messages[-1][0], len(messages))
+        log.close()
+
+        reopened = SegmentLog(self.directory.name, segment_size=64)
+        reopened.append(b'message6')
+
+        self.assertEqual([message for _, message in reopened.read(10)], [b'message4', b'message5', b'message6'])
+        self.assertEqual(len(reopened), 3)
+
+    def test_torn_frame_is_skipped(self):
+        log = SegmentLog(self.directory.name)
+        log.append(b'message0')
+        log.close()
+        with open(os.path.join(self.directory.name, os.listdir(self.directory.name)[0]), 'ab') as segment:
+            segment.write(b'\x00\x00\x00\x10torn')
+
+        reopened = SegmentLog(self.directory.name)
+        reopened.append(b'message1')
+
+        self.assertEqual([message for _, message in reopened.read(10)], [b'message0', b'message1'])
+
+    def test_eviction(self):
+        log = SegmentLog(self.directory.name, segment_size=40, max_bytes=100)
+        for index in range(10):
+            log.append(f'message{index}'.encode())
+
+        messages = [message for _, message in log.read(100)]
+
+        self.assertEqual(messages[-1], b'message9')
+        self.assertEqual(len(messages) + log.evicted_messages, 10)
+        self.assertEqual(len(log), len(messages))
+        self.assertLessEqual(log.backlog_bytes, 100)
+
+
+class SenderStoreAndForwardTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        sender_details = SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                       "siteIdMock", "clientIdMock", "telemetryTopicMock",
+                                       store_and_forward=StoreAndForwardDetails(self.directory.name, drain_rate=1000))
+        self.sender = Sender(sender_details, IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock",
+                                                              "devicePrivateKeyPathMock", "amazonRootCaPathMock",
+                                                              "thingNameMock"))
+        self.paho_iot_client = self.sender.iot_client
+        self.sender.iot_client = Mock()
+        self.sender.iot_client.connflag = False
+        self.sender.iot_client.publish.return_value = Mock(rc=0, is_published=lambda: True)
+        self.sender.state = {"sendTelemetryData": True}
+        self.topic = 'telemetryTopicMock/orgIdMock/clientIdMock'
+
+    def test_messages_are_stored_while_offline_and_forwarded_in_order(self):
+        self.sender.connect()
+        self.addCleanup(self.sender.disconnect)
+        self.sender.publish_telemetry('message0')
+        self.sender.publish_telemetry(b'message1')
+        self.sender.iot_client.publish.assert_not_called()
+        self.assertEqual(self.sender.store_and_forward.backlog_messages, 2)
+
+        self.sender.iot_client.connflag = True
+        self.sender.publish_telemetry('message2')
+        self.sender.store_and_forward.wakeup()
+        deadline = time.monotonic() + 5
+        while self.sender.store_and_forward.backlog_messages and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.sender.publish_telemetry('message3')
+
+        self.assertEqual([args for args, _ in self.sender.iot_client.publish.call_args_list],
+                         [(self.topic, b'message0'), (self.topic, b'message1'), (self.topic, b'message2'),
+                          (self.topic, 'message3')])
+
+    def test_messages_without_puback_stay_stored(self):
+        self.sender.publish_telemetry('message0')
+        self.sender.publish_telemetry('message1')
+        acknowledged = Mock(rc=0, is_published=lambda: True)
+        unacknowledged = Mock(rc=0, is_published=lambda: False)
+        self.sender.iot_client.publish.side_effect = [acknowledged, unacknowledged]
+        self.sender.iot_client.connflag = True
+        store_and_forward = self.sender.store_and_forward
+        store_and_forward.ack_timeout = 0.05
+        store_and_forward._running = True
+
+        self.assertEqual(store_and_forward.drain(), 1)
+        self.assertEqual(store_and_forward.backlog_messages, 1)
+
+        self.sender.iot_client.publish.side_effect = None
+        self.sender.iot_client.publish.return_value = Mock(rc=4)  # MQTT_ERR_NO_CONN
+        self.assertEqual(store_and_forward.drain(), 0)
+        self.assertEqual(store_and_forward.backlog_messages, 1)
+        store_and_forward.stop()
+        self.assertTrue(store_and_forward.log.closed)
+
+    def test_forwarding_starts_when_the_client_is_ready(self):
+        self.sender.iot_client.connflag = True
+        self.sender.store_and_forward._wakeup.clear()
+
+        self.paho_iot_client.on_subscribe(None, None, 1, (1,))
+
+        self.assertTrue(self.sender.store_and_forward._wakeup.is_set())
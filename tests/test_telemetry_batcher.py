@@ -0,0 +1,120 @@
+import json
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from benchmarks.stub_broker import StubBroker, generate_credentials
+from iot_assets.iot_client import IoTClientDetails
+from iot_assets.sender import Sender, SenderDetails
+from iot_assets.telemetry_batcher import TelemetryBatcher, TelemetryBatcherDetails, frame
+from tests.helpers import wait_for
+
+
+class TelemetryBatcherTests(unittest.TestCase):
+    def test_frame(self):
+        self.assertEqual(json.loads(frame([b'{"a":1}', b'{"b":2}'])), [{'a': 1}, {'b': 2}])
+
+    def test_publish_full_batch(self):
+        publish = Mock()
+        batcher = TelemetryBatcher(publish, TelemetryBatcherDetails(max_messages=3, max_delay_ms=60000))
+
+        for index in range(7):
+            batcher.add(json.dumps({'index': index}))
+
+        self.assertEqual(publish.call_count, 2)
+        self.assertEqual([message['index'] for message in json.loads(publish.call_args[0][0])], [3, 4, 5])
+        batcher.flush()
+        self.assertEqual(json.loads(publish.call_args[0][0]), [{'index': 6}])
+        self.assertEqual(batcher.batched_messages, 7)
+
+    def test_publish_after_delay(self):
+        publish = Mock()
+        batcher = TelemetryBatcher(publish, TelemetryBatcherDetails(max_messages=100, max_delay_ms=20))
+        batcher.start()
+        self.addCleanup(batcher.stop)
+
+        batcher.add(b'{"index":0}')
+        batcher.add(b'{"index":1}')
+
+        wait_for(lambda: publish.call_count == 1)
+        self.assertEqual(publish.call_args[0][0], b'[{"index":0},{"index":1}]')
+
+    def test_stop_publishes_pending_batch(self):
+        publish = Mock()
+        batcher = TelemetryBatcher(publish, TelemetryBatcherDetails(max_messages=100, max_delay_ms=60000))
+        batcher.start()
+        batcher.add(b'{}')
+
+        batcher.stop(1)
+
+        publish.assert_called_once_with(b'[{}]')
+
+    def test_sender_batches_telemetry(self):
+        sender = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                      "siteIdMock", "clientIdMock", "telemetryTopicMock",
+                                      batching=TelemetryBatcherDetails(max_messages=2)),
+                        IoTClientDetails("mqttEndpointMock", 123, "deviceCertPathMock", "devicePrivateKeyPathMock",
+                                         "amazonRootCaPathMock", "thingNameMock"))
+        sender.iot_client = Mock()
+        sender.iot_client.connflag = True
+        sender.state = {"sendTelemetryData": True}
+
+        sender.publish_telemetry('{"index":0}')
+        sender.iot_client.publish.assert_not_called()
+        sender.publish_telemetry('{"index":1}')
+
+        sender.iot_client.publish.assert_called_once_with('telemetryTopicMock/orgIdMock/clientIdMock',
+                                                          b'[{"index":0},{"index":1}]')
+
+
+class BatchingBrokerTests(unittest.TestCase):
+    """Publishes through the local stub broker over TLS"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.credentials = generate_credentials(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.broker = StubBroker(self.credentials).start()
+        self.broker.record_messages = True
+        self.addCleanup(self.broker.stop)
+
+    def connected_sender(self, batching):
+        sender = Sender(SenderDetails("senderTypeMock", "senderNameMock", "senderSoftwareVersionMock", "orgIdMock",
+                                      "siteIdMock", "clientIdMock", "telemetry", batching=batching),
+                        IoTClientDetails("localhost", self.broker.port, self.credentials['client_cert'],
+                                         self.credentials['client_key'], self.credentials['ca'], "thingMock"))
+        sender.state = {"sendTelemetryData": True}
+        sender.connect()
+        self.addCleanup(sender.iot_client.mqttc.loop_stop)
+        wait_for(lambda: sender.iot_client.connflag)
+        return sender
+
+    def telemetry(self):
+        return [payload for _, topic, payload in self.broker.messages if topic == 'telemetry/orgIdMock/clientIdMock']
+
+    def test_batching_reduces_publish_packets(self):
+        sender = self.connected_sender(TelemetryBatcherDetails(max_messages=50, max_delay_ms=50))
+
+        for index in range(200):
+            sender.publish_telemetry(json.dumps({'index': index}))
+        sender.disconnect(5)
+
+        wait_for(lambda: sum(len(json.loads(payload)) for payload in self.telemetry()) == 200)
+        self.assertLessEqual(len(self.telemetry()), 5)
+        received = [message['index'] for payload in self.telemetry() for message in json.loads(payload)]
+        self.assertEqual(received, list(range(200)))
+
+    def test_publish_per_message(self):
+        sender = self.connected_sender(None)
+
+        for index in range(20):
+            sender.publish_telemetry(json.dumps({'index': index}))
+
+        wait_for(lambda: len(self.telemetry()) == 20)
+        sender.disconnect()
@@ -0,0 +1,66 @@
+import unittest
+
+from iot_assets.topic_router import TopicRouter
+
+
+def handler(name):
+    return lambda payload: name
+
+
+class TopicRouterTests(unittest.TestCase):
+    def setUp(self):
+        self.router = TopicRouter()
+
+    def test_exact_topic(self):
+        accepted = handler('accepted')
+        self.router.add('$aws/things/thing1/shadow/get/accepted', accepted)
+
+        self.assertIs(self.router.route('$aws/things/thing1/shadow/get/accepted'), accepted)
+        self.assertIsNone(self.router.route('$aws/things/thing2/shadow/get/accepted'))
+        self.assertIsNone(self.router.route('$aws/things/thing1/shadow/get'))
+
+    def test_wildcards(self):
+        single = handler('single')
+        multi = handler('multi')
+        self.router.add('$aws/things/+/shadow/update/delta', single)
+        self.router.add('devices/#', multi)
+
+        self.assertIs(self.router.route('$aws/things/thing1/shadow/update/delta'), single)
+        self.assertIsNone(self.router.route('$aws/things/thing1/shadow/update/documents'))
+        self.assertIs(self.router.route('devices/a/b/c'), multi)
+        self.assertIs(self.router.route('devices'), multi)
+        self.assertIsNone(self.router.route('other/a'))
+
+    def test_wildcards_do_not_match_system_topics(self):
+        self.router.add('#', handler('all'))
+        self.router.add('+/things/thing1/shadow/get/accepted', handler('single'))
+
+        self.assertIsNone(self.router.route('$aws/things/thing1/shadow/get/accepted'))
+        self.assertIsNotNone(self.router.route('telemetry/thing1'))
+
+    def test_exact_filter_takes_precedence(self):
+        exact = handler('exact')
+        wildcard = handler('wildcard')
+        self.router.add('$aws/things/+/shadow/get/accepted', wildcard)
+        self.router.add('$aws/things/thing1/shadow/get/accepted', exact)
+
+        self.assertIs(self.router.route('$aws/things/thing1/shadow/get/accepted'), exact)
+        self.assertEqual(self.router.matches('$aws/things/thing1/shadow/get/accepted'), [exact, wildcard])
+
+    def test_remove(self):
+        self.router.add('a/+/c', handler('wildcard'))
+        self.router.add('a/b/c', handler('exact'))
+        self.assertEqual(len(self.router), 2)
+
+        self.router.remove('a/b/c')
+        self.router.remove('a/+/c')
+        self.router.remove('a/+/unknown')
+
+        self.assertEqual(len(self.router), 0)
+        self.assertIsNone(self.router.route('a/b/c'))
+
+    def test_invalid_filters(self):
+        for topic_filter in ('', 'a/#/c', 'a/b+/c', 'a/#b'):
+            with self.subTest(topic_filter=topic_filter):
+                with self.assertRaises(ValueError):
+                    self.router.add(topic_filter, handler('invalid'))
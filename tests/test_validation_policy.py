@@ -0,0 +1,85 @@
+import json
+import unittest
+
+from event_validator.schema_validator import EventValidator, SchemaValidationException, PATHS
+from event_validator.validation_policy import AlwaysValidate, SampledValidation, ShapeChangeValidation, \
+    ValidationPolicy
+from tests.helpers import generic_signal_status_message
+
+
+class ValidationPolicyTests(unittest.TestCase):
+    def test_always_validate(self):
+        policy = AlwaysValidate()
+        for _ in range(3):
+            self.assertTrue(policy.should_validate(generic_signal_status_message()))
+
+        self.assertEqual(policy.counters(), (3, 0))
+
+    def test_policy_without_decision_cannot_be_created(self):
+        class IncompletePolicy(ValidationPolicy):
+            pass
+
+        self.assertRaises(TypeError, IncompletePolicy)
+
+    def test_sampled_validation(self):
+        policy = SampledValidation(first_n=2, sample_every=3)
+        decisions = [policy.should_validate(generic_signal_status_message()) for _ in range(8)]
+
+        self.assertEqual(decisions, [True, True, False, False, True, False, False, True])
+        self.assertEqual(policy.counters(), (4, 4))
+
+    def test_sampling_is_counted_per_schema(self):
+        policy = SampledValidation(first_n=1, sample_every=10)
+        other_schema = generic_signal_status_message()
+        other_schema['eventsubtype'] = 'Other'
+
+        policy.should_validate(generic_signal_status_message())
+        self.assertTrue(policy.should_validate(other_schema))
+        self.assertFalse(policy.should_validate(generic_signal_status_message()))
+
+    def test_shape_change_validation(self):
+        policy = ShapeChangeValidation()
+        changed_value = generic_signal_status_message()
+        changed_value['payload']['signalstatus']['deviceinfo']['speed'] = 200
+        changed_type = generic_signal_status_message()
+        changed_type['payload']['signalstatus']['deviceinfo']['speed'] = '200'
+        added_key = generic_signal_status_message()
+        added_key['sitename'] = 'siteNameMock'
+
+        self.assertTrue(policy.should_validate(generic_signal_status_message()))
+        self.assertTrue(policy.should_validate(changed_value))
+        policy.accepted(generic_signal_status_message())
+        self.assertFalse(policy.should_validate(changed_value))
+        self.assertTrue(policy.should_validate(changed_type))
+        self.assertTrue(policy.should_validate(added_key))
+        self.assertEqual(policy.counters(), (4, 1))
+
+    def test_shape_fingerprint_is_not_a_hash(self):
+        fingerprint = ShapeChangeValidation.fingerprint(generic_signal_status_message())
+
+        self.assertEqual(fingerprint, ShapeChangeValidation.fingerprint(generic_signal_status_message()))
+        self.assertNotIsInstance(fingerprint, int)
+
+
+class EventValidatorPolicyTests(unittest.TestCase):
+    def test_rejected_shapes_are_validated_again(self):
+        validator = EventValidator(PATHS, policy=ShapeChangeValidation())
+        invalid = generic_signal_status_message()
+        invalid['unknownfield'] = 'unknownFieldMock'
+
+        validator.validate(json.dumps(generic_signal_status_message()))
+        validator.validate(json.dumps(generic_signal_status_message()))
+        for _ in range(2):
+            self.assertRaises(SchemaValidationException, validator.validate, json.dumps(invalid))
+
+        self.assertEqual(validator.policy.counters(), (3, 1))
+
+    def test_skipped_messages_are_not_validated(self):
+        validator = EventValidator(PATHS, policy=SampledValidation(first_n=1, sample_every=100))
+        invalid = generic_signal_status_message()
+        invalid['assettype'] = 'UnknownAssetType'
+
+        validator.validate(json.dumps(generic_signal_status_message()))
+        validator.validate(json.dumps(invalid))
+
+        self.assertEqual(validator.policy.counters(), (1, 1))